@@ -5,7 +5,7 @@ from django import forms
 from django.db import models
 from accounts.models import User
 from schools.models import School
-from classrooms.models import Classroom, ClassroomPermission, MembershipType, SchoolBillingReport
+from classrooms.models import Classroom, ClassroomPermission, MembershipType, SchoolBillingReport, SchoolBillingLineItem
 from students.models import Student
 from scores.models import Score, TestResult, CommentTemplate, CommentTemplateV2, TestSummary, SchoolTestSummary
 from tests.models import TestSchedule, TestDefinition, QuestionGroup, Question, AnswerKey
@@ -1990,8 +1990,22 @@ admin.site.register(MembershipType, MembershipTypeAdmin)
 
 # BillingReportモデルは完全に廃止（コメントアウト）
 
+# 課金レポート明細（教室×生徒、読み取り専用）
+class SchoolBillingLineItemInline(admin.TabularInline):
+    model = SchoolBillingLineItem
+    extra = 0
+    can_delete = False
+    fields = ('classroom_code', 'classroom_name', 'student_id', 'student_name', 'subjects', 'score_input_dates')
+    readonly_fields = fields
+    ordering = ('classroom_name', 'student_name')
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 # 課金レポート管理（塾ベース）
 class SchoolBillingReportAdmin(admin.ModelAdmin):
+    inlines = [SchoolBillingLineItemInline]
     change_list_template = 'admin/classrooms/schoolbillingreport/change_list.html'
     list_display = ('school', 'year', 'period', 'total_classrooms', 'billed_students', 'price_per_student', 'total_amount', 'average_per_classroom', 'generated_at')
     list_filter = ('year', 'period', 'generated_at', 'school__membership_type')
@@ -2050,28 +2064,31 @@ class SchoolBillingReportAdmin(admin.ModelAdmin):
     def regenerate_school_billing_reports(self, request, queryset):
         """選択した塾の課金レポートを再生成"""
         from django.contrib import messages
-        from classrooms.utils import generate_school_billing_report
+        from collections import defaultdict
+        from classrooms.utils import generate_school_billing_reports
 
         created = updated = skipped = errors = 0
 
-        for report in queryset:
+        # 年度・期間ごとにまとめて再生成する
+        schools_by_period = defaultdict(list)
+        for report in queryset.select_related('school'):
+            schools_by_period[(report.year, report.period)].append(report.school)
+
+        for (year, period), schools in schools_by_period.items():
             try:
-                result = generate_school_billing_report(
-                    school=report.school,
-                    year=report.year,
-                    period=report.period,
-                    force=True,
-                )
+                results = generate_school_billing_reports(year, period, schools, force=True)
+            except Exception as exc:
+                errors += len(schools)
+                messages.error(request, f"{year}年度 {period}: {exc}")
+                continue
 
+            for result in results.values():
                 if result.get('created'):
                     created += 1
                 elif result.get('updated'):
                     updated += 1
                 else:
                     skipped += 1
-            except Exception as exc:
-                errors += 1
-                messages.error(request, f"{report.school.name}（{report.year}年度{report.get_period_display()}）: {exc}")
 
         if created:
             messages.success(request, f"{created}件の塾別課金レポートを新規作成しました。")
@@ -2219,10 +2236,6 @@ class SchoolBillingReportAdmin(admin.ModelAdmin):
         ('集計情報', {
             'fields': ('total_classrooms', 'total_students', 'billed_students', 'price_per_student', 'total_amount')
         }),
-        ('詳細情報', {
-            'fields': ('classroom_details', 'student_details'),
-            'classes': ('collapse',)
-        }),
         ('システム情報', {
             'fields': ('generated_at', 'updated_at'),
             'classes': ('collapse',)
@@ -0,0 +1,47 @@
+"""
+トランザクション確定時の一括処理
+
+書き込みのたびに記録した項目をトランザクション確定時に1回だけまとめて処理する。
+項目は on_commit に登録したコールバック（_Batch）自身が保持するため、トランザクションや
+セーブポイントがロールバックされると、登録済みのコールバックと一緒に項目も破棄される
+（スレッドローカルに溜めると、ロールバックした項目が次の確定時に処理されてしまう）。
+
+コールバックは同じセーブポイントの深さで登録されたものだけを再利用する。内側の
+セーブポイントで記録した項目はそのセーブポイント用のコールバックに入るため、
+セーブポイントだけをロールバックした場合も正しく破棄される（その場合、確定時の処理は
+セーブポイントごとに分かれる）。
+"""
+from __future__ import annotations
+
+from django.db import transaction
+
+
+class _Batch:
+    """on_commit に登録するコールバック（確定時に記録済みの項目をまとめて渡す）"""
+
+    def __init__(self, key, flush):
+        self.key = key
+        self.flush = flush
+        self.items = set()
+
+    def __call__(self):
+        self.flush(self.items)
+
+
+def defer_until_commit(key: str, item, flush, using=None) -> None:
+    """
+    項目を記録し、トランザクション確定時の flush(items) を1回だけ予約する
+
+    トランザクション外では即座に flush({item}) を実行する。
+    """
+    connection = transaction.get_connection(using)
+    if connection.in_atomic_block:
+        savepoint_ids = set(connection.savepoint_ids)
+        for sids, callback, *_ in connection.run_on_commit:
+            if isinstance(callback, _Batch) and callback.key == key and sids == savepoint_ids:
+                callback.items.add(item)
+                return
+
+    batch = _Batch(key, flush)
+    batch.items.add(item)
+    transaction.on_commit(batch, using=using)
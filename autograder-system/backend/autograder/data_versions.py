@@ -0,0 +1,215 @@
+"""
+データバージョンと条件付きGET（ETag / If-None-Match）
+
+(年度, 期間, 塾) ごとに単調増加するバージョン番号をキャッシュに保持し、
+得点・テスト結果・コメント・課金・生徒データの書き込み時にシグナルから加算する。
+参照系エンドポイントはこのバージョンから ETag を作り、If-None-Match が一致すれば
+重い集計を行わずに 304 を返す。
+
+バージョンは次の4つのキーに同時に加算するため、年度・期間・塾のいずれかを
+指定しない参照（全塾・全期間）でも変更を検知できる。
+    results:{year}:{period}:{school} / results:{year}:{period}:* /
+    results:*:*:{school} / results:*:*:*
+塾を特定しない変更（テスト定義・一括集計・順位確定など全塾に及ぶもの）は、さらに
+results:{year}:{period}:all と results:*:*:all を進める。塾を指定した参照はこのキーも
+ETag に含めるため、全塾向けの変更も検知できる。
+年度・期間を特定できない変更（コメントテンプレート等）は results_epoch を進め、
+全ての成績系 ETag を無効にする。
+"""
+from __future__ import annotations
+
+import hashlib
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+
+from .after_commit import defer_until_commit
+
+ANY = '*'
+ALL_SCHOOLS = 'all'
+SCHEDULES_SCOPE = 'schedules'
+TESTS_SCOPE = 'tests'
+SCHEDULE_INFO_SCOPE = 'schedule_info'
+MEMBERSHIP_PRICES_SCOPE = 'membership_prices'
+EPOCH_SCOPE = 'results_epoch'
+
+
+def _cache_key(scope: str) -> str:
+    return f'data_version:{scope}'
+
+
+def _seed() -> int:
+    # キャッシュから消えた場合も過去の値より大きくなるよう、時刻を初期値にする
+    return time.time_ns() // 1000
+
+
+def results_scope(year=None, period=None, school=None) -> str:
+    """成績系データのバージョンスコープ名（None は * 扱い）"""
+    parts = [ANY if value in (None, '') else str(value) for value in (year, period, school)]
+    return 'results:' + ':'.join(parts)
+
+
+def results_etag_scopes(year=None, period=None, school=None) -> list:
+    """成績系エンドポイントの ETag に含めるスコープ"""
+    if year in (None, '') or period in (None, ''):
+        # 年度・期間の片方だけのキーは加算されないため、全期間のキーで判定する
+        year = period = None
+    scopes = [results_scope(year, period, school), EPOCH_SCOPE]
+    if school not in (None, ''):
+        # 塾を特定しない変更（全塾に及ぶ）も検知する
+        scopes.append(results_scope(year, period, ALL_SCHOOLS))
+    return scopes
+
+
+def get_data_version(scope: str) -> int:
+    key = _cache_key(scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _seed(), timeout=None)
+        version = cache.get(key, _seed())
+    return version
+
+
+def bump_data_version(scope: str) -> None:
+    key = _cache_key(scope)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, _seed(), timeout=None)
+
+
+def bump_results_version(year, period, school=None) -> None:
+    """(年度, 期間, 塾) の変更を関連する全スコープへ反映する"""
+    scopes = {
+        results_scope(year, period, school),
+        results_scope(year, period),
+        results_scope(school=school),
+        results_scope(),
+    }
+    if school in (None, ''):
+        scopes.update({results_scope(year, period, ALL_SCHOOLS), results_scope(school=ALL_SCHOOLS)})
+    if year in (None, '') or period in (None, ''):
+        scopes.add(EPOCH_SCOPE)
+    for scope in scopes:
+        bump_data_version(scope)
+
+
+# --- 書き込み検知（トランザクション確定時にまとめて加算） ---
+
+def _flush_pending(pending) -> None:
+    from students.models import Student
+    from tests.models import TestDefinition
+
+    test_ids = {item[1] for item in pending if item[0] == 'student_test' and item[1] is not None}
+    student_ids = {item[2] for item in pending if item[0] == 'student_test'}
+    schedules = {
+        test_id: (year, period)
+        for test_id, year, period in TestDefinition.objects.filter(id__in=test_ids).values_list(
+            'id', 'schedule__year', 'schedule__period'
+        )
+    } if test_ids else {}
+    schools = dict(
+        Student.objects.filter(id__in=student_ids).values_list('id', 'classroom__school_id')
+    ) if student_ids else {}
+
+    scopes = set()
+    for item in pending:
+        if item[0] == 'student_test':
+            year, period = schedules.get(item[1], (None, None))
+            scopes.add((year, period, schools.get(item[2])))
+        elif item[0] == 'scope':
+            scopes.add(item[1:])
+        elif item[0] == 'named':
+            bump_data_version(item[1])
+
+    for year, period, school in scopes:
+        bump_results_version(year, period, school)
+
+
+def _register(item) -> None:
+    """書き込みを記録し、トランザクション確定時の加算を1回だけ予約する"""
+    defer_until_commit('data_versions', item, _flush_pending)
+
+
+def mark_student_test_changed(student_id, test_id) -> None:
+    """生徒×テスト単位の書き込み（得点・結果・コメント）"""
+    _register(('student_test', test_id, student_id))
+
+
+def mark_results_changed(year=None, period=None, school=None) -> None:
+    """年度・期間・塾が分かっている書き込み（課金・一括処理など）"""
+    _register(('scope', year, period, school))
+
+
+def mark_schedules_changed() -> None:
+    _register(('named', SCHEDULES_SCOPE))
+
+
+def mark_tests_changed() -> None:
+    """テスト定義・大問・小問の構成が変わった"""
+    _register(('named', TESTS_SCOPE))
+
+
+def mark_schedule_info_changed() -> None:
+    """日程情報（TestScheduleInfo）が変わった"""
+    _register(('named', SCHEDULE_INFO_SCOPE))
+
+
+def mark_membership_prices_changed() -> None:
+    """会員種別の料金（MembershipType）が変わった（全期間の課金額に影響する）"""
+    _register(('named', MEMBERSHIP_PRICES_SCOPE))
+    _register(('scope', None, None, None))
+
+
+# --- 条件付きGET ---
+
+def build_etag(request, scopes, extra=()) -> str:
+    """スコープのバージョン・URL・利用者から ETag を作る"""
+    user = getattr(request, 'user', None)
+    user_key = user.pk if user is not None and user.is_authenticated else ''
+    query = sorted(request.GET.lists())
+    parts = [request.path, repr(query), str(user_key)]
+    parts.extend(f'{scope}={get_data_version(scope)}' for scope in scopes)
+    parts.extend(str(value) for value in extra)
+    digest = hashlib.md5('|'.join(parts).encode('utf-8')).hexdigest()
+    return f'"{digest}"'
+
+
+def conditional_on_data_version(scope_func):
+    """
+    データバージョンによる条件付きGETを行うビュー用デコレータ
+
+    scope_func(request) は (スコープ名のリスト, 追加要素) を返す。None を返した場合は
+    条件付き処理を行わない。DRF のアクション（self, request）と関数ビュー（request）の両方に使える。
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(*args, **kwargs):
+            request = args[1] if len(args) > 1 else args[0]
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(*args, **kwargs)
+
+            resolved = scope_func(request)
+            if resolved is None:
+                return view_func(*args, **kwargs)
+            scopes, extra = resolved
+
+            etag = build_etag(request, scopes, extra)
+            if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+            if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+                response = HttpResponseNotModified()
+                response['ETag'] = etag
+                return response
+
+            response = view_func(*args, **kwargs)
+            if response.status_code == 200 and not response.has_header('ETag'):
+                response['ETag'] = etag
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
+
@@ -0,0 +1,129 @@
+"""
+一覧APIの項目選択（?fields=）と列形式レスポンス（?format=columnar）
+
+- ?fields=id,student_name,total_score: 指定した項目だけをシリアライズする
+- 一覧取得時は、シリアライズする項目の source から select_related / only() を自動で組み立てる
+  （'student.classroom.school.name' なら student__classroom__school を JOIN し、name 列だけ読む）
+- ?format=columnar: results を {項目名: [値, ...]} の列形式で返す（行ごとのキー名の重複を省く）
+"""
+from __future__ import annotations
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+
+FIELDS_QUERY_PARAM = 'fields'
+
+
+def requested_fields(request) -> list | None:
+    """?fields= で指定された項目名（指定なしは None）"""
+    if request is None:
+        return None
+    params = getattr(request, 'query_params', None) or request.GET
+    value = params.get(FIELDS_QUERY_PARAM)
+    if not value:
+        return None
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+class SparseFieldsSerializerMixin:
+    """?fields= で指定された項目以外を取り除くシリアライザー用ミックスイン（未知の項目名は無視する）"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method != 'GET':
+            return
+        names = requested_fields(request)
+        if not names:
+            return
+        allowed = set(names)
+        if not allowed & set(self.fields):
+            return
+        for name in list(self.fields):
+            if name not in allowed:
+                self.fields.pop(name)
+
+
+def optimize_queryset_for_serializer(queryset, serializer):
+    """
+    シリアライザーの項目から select_related / only() を組み立てて適用する
+
+    関連先をたどる source は select_related でまとめて取得する。全ての項目がモデルの列に
+    対応する場合だけ only() で読む列を絞る（メソッドやネストしたシリアライザーがあれば絞らない）。
+    """
+    model = queryset.model
+    related = set()
+    columns = {model._meta.pk.name}
+    can_defer = True
+
+    for field in serializer.fields.values():
+        if field.source == '*':
+            can_defer = False
+            continue
+        current = model
+        path = []
+        for attr in field.source.split('.'):
+            try:
+                model_field = current._meta.get_field(attr)
+            except FieldDoesNotExist:
+                model_field = None
+            if model_field is None or not model_field.concrete:
+                can_defer = False
+                break
+            path.append(attr)
+            lookup = '__'.join(path)
+            columns.add(lookup)
+            if not (model_field.many_to_one or model_field.one_to_one):
+                break
+            current = model_field.related_model
+            if len(path) < len(field.source.split('.')):
+                related.add(lookup)
+        else:
+            if isinstance(field, serializers.BaseSerializer) and path:
+                related.add('__'.join(path))
+                can_defer = False
+
+    queryset = queryset.select_related(None).select_related(*sorted(related))
+    if can_defer:
+        queryset = queryset.only(*sorted(columns))
+    return queryset
+
+
+class SparseFieldsViewMixin:
+    """一覧取得時に ?fields= とシリアライザーの項目に合わせてクエリを最適化するビューセット用ミックスイン"""
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if getattr(self, 'action', None) != 'list':
+            return queryset
+        return optimize_queryset_for_serializer(queryset, self.get_serializer())
+
+
+def to_columnar(rows) -> dict:
+    """[{項目: 値}, ...] を {項目: [値, ...]} に変換する"""
+    columns = {}
+    for row in rows:
+        for name in row:
+            columns.setdefault(name, [])
+    for row in rows:
+        for name, values in columns.items():
+            values.append(row.get(name))
+    return columns
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    """
+    ?format=columnar 用のレンダラー
+
+    一覧（ページネーション済みの results またはリスト）だけを列形式にし、
+    エラーなどそれ以外のレスポンスはそのまま返す。
+    """
+    format = 'columnar'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, list):
+            data = to_columnar(data)
+        elif isinstance(data, dict) and isinstance(data.get('results'), list):
+            data = {**data, 'results': to_columnar(data['results'])}
+        return super().render(data, accepted_media_type, renderer_context)
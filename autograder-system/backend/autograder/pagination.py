@@ -1,4 +1,14 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import b64decode, b64encode
+from urllib import parse
+
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination, CursorPagination, Cursor, _reverse_ordering
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class CustomPageNumberPagination(PageNumberPagination):
@@ -7,4 +17,221 @@ class CustomPageNumberPagination(PageNumberPagination):
     """
     page_size = 50  # デフォルトページサイズ
     page_size_query_param = 'page_size'  # page_sizeパラメータを有効化
-    max_page_size = 10000  # 最大ページサイズ
\ No newline at end of file
+    max_page_size = 10000  # 最大ページサイズ
+
+
+def is_pagination_requested(request, paginator=None) -> bool:
+    """
+    ?page / ?page_size が指定されたか
+
+    ページ指定なしで全件を受け取る既存クライアント向けに、指定がない場合は
+    ページ分割しないレスポンスを返すビューで使う。
+    """
+    paginator = paginator or CustomPageNumberPagination
+    params = request.query_params
+    return paginator.page_query_param in params or paginator.page_size_query_param in params
+
+
+# 推定件数がこれ未満の場合は正確なCOUNT(*)を使う（小さい結果は推定誤差が大きいため）
+ESTIMATE_EXACT_THRESHOLD = 10000
+
+
+def estimate_queryset_count(queryset):
+    """
+    PostgreSQLのプラン推定行数で件数を見積もる
+
+    大きなテーブルでCOUNT(*)の全件走査を避けるためのもの。
+    PostgreSQL以外、または推定値が小さい場合は通常のcount()を返す。
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+
+    sql, params = queryset.order_by().query.sql_with_params()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimated = int(plan[0]['Plan']['Plan Rows'])
+    except Exception:
+        return queryset.count()
+
+    if estimated < ESTIMATE_EXACT_THRESHOLD:
+        return queryset.count()
+    return estimated
+
+
+class EstimatedCountPaginator(DjangoPaginator):
+    """件数を推定値で返すDjangoページャー"""
+
+    @cached_property
+    def count(self):
+        return estimate_queryset_count(self.object_list)
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    (並び順キー, id) によるカーソルページネーション
+
+    カーソルには直前ページ末尾（前ページへ戻る場合は先頭）の行の並び順キーとidを保持し、
+    (並び順キー, id) の行比較で続きを取得する。OFFSETを使わないため、同値の行が
+    どれだけ多くても深いページで1ページ目と同じコストで取得でき、欠落・重複もしない。
+    並び順はビューのorderingに従い、同値の並びを安定させるためidを末尾に付与する。
+    並び順キーはNULLを含まない列であること。
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    ordering = '-id'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = tuple(super().get_ordering(request, queryset, view))
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            tiebreaker = '-id' if ordering and ordering[0].startswith('-') else 'id'
+            ordering = ordering + (tiebreaker,)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = bool(self.cursor and self.cursor.reverse)
+        position = self.cursor.position if self.cursor else None
+        if position is not None and len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        ordering = _reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._seek_filter(ordering, position))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+        self.display_page_controls = self.has_next or self.has_previous
+        return self.page
+
+    @staticmethod
+    def _seek_filter(ordering, position):
+        """
+        並び順で position より後ろの行の条件
+
+        例: ('-total_score', '-id') なら
+        Q(total_score__lt=v) | Q(total_score=v, id__lt=pk)
+        """
+        condition = None
+        equal = {}
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            term = Q(**equal, **{f'{name}__{lookup}': value})
+            condition = term if condition is None else condition | term
+            equal[name] = value
+        return condition
+
+    def _get_position_from_instance(self, instance, ordering):
+        position = []
+        for field in ordering:
+            name = field.lstrip('-')
+            value = instance[name] if isinstance(instance, dict) else getattr(instance, name)
+            if not isinstance(value, (int, float, str)):
+                value = str(value)
+            position.append(value)
+        return position
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            # 前方向に取得して空だった場合は、カーソル位置より前に行がない（先頭ページ）
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        position = self._get_position_from_instance(self.page[-1], self.ordering)
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        # 空ページの場合は末尾から逆方向に取得する（最終ページ）
+        position = self._get_position_from_instance(self.page[0], self.ordering) if self.page else None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            querystring = b64decode(encoded.encode('ascii')).decode('ascii')
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+            position = tokens.get('p', [None])[0]
+            position = json.loads(position) if position is not None else None
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if position is not None and not isinstance(position, list):
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(offset=0, reverse=reverse, position=position)
+
+    def encode_cursor(self, cursor):
+        tokens = {}
+        if cursor.reverse:
+            tokens['r'] = '1'
+        if cursor.position is not None:
+            tokens['p'] = json.dumps(cursor.position, separators=(',', ':'))
+        querystring = parse.urlencode(tokens, doseq=True)
+        encoded = b64encode(querystring.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+
+class AdaptivePagination(CustomPageNumberPagination):
+    """
+    大量データ向けのページネーション
+
+    - 既定: 従来どおりのページ番号方式（CustomPageNumberPaginationと同じレスポンス）
+    - ?pagination=cursor または ?cursor=...: (並び順キー, id) のカーソル方式
+    - ?count=estimate: COUNT(*)を省略し、プラン推定値で件数を返す
+    """
+    cursor_query_param = 'cursor'
+
+    def __init__(self):
+        self._cursor_paginator = None
+        self._estimated = False
+
+    def _use_cursor(self, request):
+        params = request.query_params
+        return params.get('pagination') == 'cursor' or self.cursor_query_param in params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self._use_cursor(request):
+            self._cursor_paginator = KeysetCursorPagination()
+            return self._cursor_paginator.paginate_queryset(queryset, request, view)
+
+        self._estimated = request.query_params.get('count') == 'estimate'
+        if self._estimated:
+            self.django_paginator_class = EstimatedCountPaginator
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self._cursor_paginator is not None:
+            return self._cursor_paginator.get_paginated_response(data)
+        response = super().get_paginated_response(data)
+        if self._estimated:
+            response.data['count_is_estimate'] = True
+        return response
+
+    def get_paginated_response_schema(self, schema):
+        if self._cursor_paginator is not None:
+            return self._cursor_paginator.get_paginated_response_schema(schema)
+        return super().get_paginated_response_schema(schema)
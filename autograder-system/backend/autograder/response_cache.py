@@ -0,0 +1,110 @@
+"""
+集計系エンドポイントのレスポンスキャッシュ
+
+キャッシュキーには利用者の権限スコープ（ロール・塾ID・教室ID）と、対象データの
+データバージョン（autograder.data_versions）を含める。得点・結果・コメント・課金・生徒の
+書き込みでバージョンが進むと古いエントリは参照されなくなり、TTL で自然に消える。
+本番は Redis、開発・テストは locmem を使う（settings の CACHES を参照）。
+"""
+from __future__ import annotations
+
+import hashlib
+from functools import wraps
+
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from .data_versions import get_data_version
+from .scoping import is_classroom_page
+
+RESPONSE_CACHE_TIMEOUT = 60 * 60
+CACHE_MISS = object()
+
+
+def role_scope(request) -> tuple:
+    """キャッシュを共有してよい利用者の単位（同じロール・所属なら同じ結果になる）"""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return ('anonymous',)
+    return (
+        getattr(user, 'role', ''),
+        getattr(user, 'school_id', '') or '',
+        getattr(user, 'classroom_id', '') or '',
+        is_classroom_page(request),
+    )
+
+
+def versioned_cache_key(prefix: str, scopes, *parts) -> str:
+    """データバージョンを含むキャッシュキー"""
+    versions = [f'{scope}={get_data_version(scope)}' for scope in scopes]
+    raw = '|'.join([*map(str, parts), *versions])
+    return f'{prefix}:{hashlib.md5(raw.encode("utf-8")).hexdigest()}'
+
+
+def get_or_set_versioned(prefix: str, scopes, parts, producer, timeout: int = RESPONSE_CACHE_TIMEOUT):
+    """バージョン付きキーで値をキャッシュする（None は保存しない）"""
+    key = versioned_cache_key(prefix, scopes, *parts)
+    value = cache.get(key, CACHE_MISS)
+    if value is not CACHE_MISS:
+        return value
+    value = producer()
+    if value is not None:
+        cache.set(key, value, timeout)
+    return value
+
+
+def cached_by_data_version(scope_func, timeout: int = RESPONSE_CACHE_TIMEOUT):
+    """
+    レスポンスをデータバージョン単位でキャッシュするビュー用デコレータ
+
+    scope_func は conditional_on_data_version と同じもの（(スコープ, 追加要素) または None）。
+    DRF の Response はデータを、それ以外の HttpResponse は本文を保存する。200 以外は保存しない。
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(*args, **kwargs):
+            request = args[1] if len(args) > 1 else args[0]
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(*args, **kwargs)
+
+            resolved = scope_func(request)
+            if resolved is None:
+                return view_func(*args, **kwargs)
+            scopes, extra = resolved
+
+            key = versioned_cache_key(
+                'response', scopes,
+                request.get_host(), request.path, repr(sorted(request.GET.lists())),
+                repr(role_scope(request)), *extra,
+            )
+            cached = cache.get(key)
+            if cached is not None:
+                return _restore_response(cached)
+
+            response = view_func(*args, **kwargs)
+            if response.status_code == 200:
+                stored = _store_response(response)
+                if stored is not None:
+                    cache.set(key, stored, timeout)
+            return response
+        return wrapper
+    return decorator
+
+
+def _store_response(response):
+    from rest_framework.response import Response
+
+    if isinstance(response, Response):
+        return ('drf', response.data)
+    if getattr(response, 'streaming', False):
+        return None
+    return ('http', response.content, response.get('Content-Type'))
+
+
+def _restore_response(cached):
+    from rest_framework.response import Response
+
+    kind = cached[0]
+    if kind == 'drf':
+        return Response(cached[1])
+    return HttpResponse(cached[1], content_type=cached[2])
@@ -0,0 +1,92 @@
+"""
+ロール別のデータ範囲（塾管理者・教室管理者）
+
+ユーザーの塾ID・教室ID（文字列コード）から School / Classroom の主キーを
+リクエストごとに1回だけ解決してリクエストに保持する。各ビューは
+student__classroom__school__school_id のような多段JOINの文字列比較ではなく、
+主キー（classroom__in / school_id）で絞り込む。
+"""
+from __future__ import annotations
+
+_REQUEST_ATTR = '_role_scope'
+
+
+class RoleScope:
+    """
+    リクエスト利用者のデータ範囲
+
+    role: ユーザーのロール
+    school_pk: 所属塾の主キー（塾管理者・教室管理者。見つからなければ None）
+    classroom_pks: 参照できる教室の主キー（塾管理者は塾内の全教室、教室管理者は自教室）
+    unrestricted: ロールによる制限がない（システム管理者など）
+    """
+
+    def __init__(self, role: str, school_pk=None, classroom_pks=None, classroom_pk=None, unrestricted: bool = False):
+        self.role = role
+        self.school_pk = school_pk
+        self.classroom_pks = tuple(classroom_pks or ())
+        self.classroom_pk = classroom_pk
+        self.unrestricted = unrestricted
+
+    @property
+    def is_school_admin(self) -> bool:
+        return self.role == 'school_admin'
+
+    @property
+    def is_classroom_admin(self) -> bool:
+        return self.role == 'classroom_admin'
+
+    def filter_classrooms(self, queryset, classroom_path: str):
+        """classroom_path（例: 'student__classroom'）を参照可能な教室に絞り込む"""
+        if self.unrestricted:
+            return queryset
+        return queryset.filter(**{f'{classroom_path}__in': self.classroom_pks})
+
+    def filter_own_classroom(self, queryset, classroom_path: str):
+        """教室管理者の自教室に絞り込む（自教室が見つからなければ空）"""
+        if self.classroom_pk is None:
+            return queryset.none()
+        return queryset.filter(**{classroom_path: self.classroom_pk})
+
+    def filter_school(self, queryset, school_path: str):
+        """school_path（例: 'student__classroom__school'）を所属塾に絞り込む"""
+        return queryset.filter(**{school_path: self.school_pk})
+
+
+def _resolve(user) -> RoleScope:
+    from classrooms.models import Classroom
+    from schools.models import School
+
+    role = getattr(user, 'role', None)
+    if role == 'school_admin':
+        school_pk = None
+        if getattr(user, 'school_id', None):
+            school_pk = School.objects.filter(school_id=user.school_id).values_list('id', flat=True).first()
+        classroom_pks = Classroom.objects.filter(school_id=school_pk).values_list('id', flat=True) if school_pk else ()
+        return RoleScope(role, school_pk=school_pk, classroom_pks=list(classroom_pks))
+    if role == 'classroom_admin':
+        row = None
+        if getattr(user, 'classroom_id', None):
+            row = Classroom.objects.filter(classroom_id=user.classroom_id).values_list('id', 'school_id').first()
+        classroom_pk, school_pk = row or (None, None)
+        return RoleScope(
+            role, school_pk=school_pk,
+            classroom_pks=[classroom_pk] if classroom_pk else [], classroom_pk=classroom_pk,
+        )
+    return RoleScope(role or '', unrestricted=True)
+
+
+def get_role_scope(request) -> RoleScope:
+    """リクエスト利用者のデータ範囲（リクエスト内で1回だけ解決する）"""
+    http_request = getattr(request, '_request', request)
+    scope = getattr(http_request, _REQUEST_ATTR, None)
+    if scope is None:
+        scope = _resolve(getattr(request, 'user', None))
+        setattr(http_request, _REQUEST_ATTR, scope)
+    return scope
+
+
+def is_classroom_page(request) -> bool:
+    """教室管理画面からのリクエストか（教室管理者の範囲を自教室に限定するかの判定）"""
+    params = getattr(request, 'query_params', None) or request.GET
+    return 'classroom' in request.META.get('HTTP_REFERER', '') or params.get('app_context') == 'classroom'
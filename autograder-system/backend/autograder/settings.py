@@ -105,6 +105,20 @@ else:
         }
     }
 
+# キャッシュ設定（REDIS_URL があれば Redis、なければプロセス内メモリ）
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('REDIS_URL'),
+    } if os.environ.get('REDIS_URL') else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    }
+}
+
+# テスト完了時の課金レポート生成をバックグラウンドスレッドで行うか（False なら確定直後に同期実行）
+BILLING_JOBS_ASYNC = config('BILLING_JOBS_ASYNC', default=True, cast=bool)
+
 # カスタムユーザーモデル
 AUTH_USER_MODEL = 'accounts.User'
 
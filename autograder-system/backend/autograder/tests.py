@@ -0,0 +1,126 @@
+from urllib.parse import parse_qs, urlparse
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from classrooms.models import Classroom
+from schools.models import School
+from scores.models import TestResult
+from students.models import Student
+from tests.models import TestDefinition, TestSchedule
+
+RESULTS_URL = '/api/test-results/'
+
+
+def cursor_param(link):
+    return parse_qs(urlparse(link).query)['cursor'][0]
+
+
+class AdaptivePaginationTests(TestCase):
+    """大量データ向けページネーション（ページ番号・カーソル・推定件数）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        School.objects.bulk_create([School(school_id='100001', name='テスト塾')])
+        school = School.objects.get()
+        Classroom.objects.bulk_create([Classroom(classroom_id='100001', name='テスト教室', school=school)])
+        classroom = Classroom.objects.get()
+        schedule = TestSchedule.objects.create(
+            year=2026, period='summer', planned_date=now.date(), actual_date=now.date(), deadline_at=now
+        )
+        test = TestDefinition.objects.create(schedule=schedule, grade_level='elementary_1', subject='math', max_score=100)
+        Student.objects.bulk_create([
+            Student(student_id=f'S{i:03d}', name=f'生徒{i}', classroom=classroom, grade='1') for i in range(25)
+        ])
+        # 同点を多く含めて、並び順キーが重複してもページ間で欠落・重複しないことを確認する
+        TestResult.objects.bulk_create([
+            TestResult(student=student, test=test, total_score=i % 4, correct_rate=0)
+            for i, student in enumerate(Student.objects.order_by('id'))
+        ])
+        cls.user = get_user_model().objects.create_superuser(username='admin', password='x', email='a@example.com')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_page_number_response_is_unchanged_by_default(self):
+        data = self.client.get(RESULTS_URL, {'page_size': 10}).json()
+        self.assertEqual(data['count'], 25)
+        self.assertEqual(len(data['results']), 10)
+        self.assertNotIn('count_is_estimate', data)
+
+    def test_cursor_pages_cover_every_row_once(self):
+        seen = []
+        params = {'pagination': 'cursor', 'page_size': 7}
+        while True:
+            data = self.client.get(RESULTS_URL, params).json()
+            self.assertNotIn('count', data)
+            seen.extend(row['id'] for row in data['results'])
+            if not data['next']:
+                break
+            params = {'cursor': cursor_param(data['next']), 'page_size': 7}
+
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(set(seen), set(TestResult.objects.values_list('id', flat=True)))
+        scores = dict(TestResult.objects.values_list('id', 'total_score'))
+        ordered = [(-scores[pk], -pk) for pk in seen]
+        self.assertEqual(ordered, sorted(ordered))
+
+    def test_estimated_count_falls_back_to_exact_count(self):
+        # PostgreSQL 以外・少件数では COUNT(*) の値を返す
+        data = self.client.get(RESULTS_URL, {'count': 'estimate', 'page_size': 10}).json()
+        self.assertEqual(data['count'], 25)
+        self.assertTrue(data['count_is_estimate'])
+
+    def test_cursor_previous_link_returns_preceding_page(self):
+        first = self.client.get(RESULTS_URL, {'pagination': 'cursor', 'page_size': 7}).json()
+        second = self.client.get(RESULTS_URL, {'cursor': cursor_param(first['next']), 'page_size': 7}).json()
+        back = self.client.get(RESULTS_URL, {'cursor': cursor_param(second['previous']), 'page_size': 7}).json()
+        self.assertEqual([row['id'] for row in back['results']], [row['id'] for row in first['results']])
+
+
+class KeysetCursorTieTests(TestCase):
+    """同点の行が DRF の offset_cutoff（1000件）を超えてもページが進むこと"""
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        School.objects.bulk_create([School(school_id='100001', name='テスト塾')])
+        Classroom.objects.bulk_create([Classroom(classroom_id='100001', name='テスト教室', school=School.objects.get())])
+        classroom = Classroom.objects.get()
+        schedule = TestSchedule.objects.create(
+            year=2026, period='summer', planned_date=now.date(), actual_date=now.date(), deadline_at=now
+        )
+        test = TestDefinition.objects.create(schedule=schedule, grade_level='elementary_1', subject='math', max_score=100)
+        Student.objects.bulk_create([
+            Student(student_id=f'S{i:04d}', name=f'生徒{i}', classroom=classroom, grade='1') for i in range(1300)
+        ])
+        TestResult.objects.bulk_create([
+            TestResult(student=student, test=test, total_score=50, correct_rate=0)
+            for student in Student.objects.all()
+        ])
+        cls.user = get_user_model().objects.create_superuser(username='admin', password='x', email='a@example.com')
+
+    def test_tie_group_larger_than_offset_cutoff(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        seen = []
+        params = {'pagination': 'cursor', 'page_size': 100}
+        for _ in range(20):
+            with CaptureQueriesContext(connection) as queries:
+                data = client.get(RESULTS_URL, params).json()
+            self.assertFalse(any('OFFSET' in query['sql'] for query in queries.captured_queries))
+            seen.extend(row['id'] for row in data['results'])
+            if not data['next']:
+                break
+            params = {'cursor': cursor_param(data['next']), 'page_size': 100}
+        else:
+            self.fail('カーソルのページが終端に達しない')
+
+        self.assertEqual(len(seen), 1300)
+        self.assertEqual(seen, sorted(TestResult.objects.values_list('id', flat=True), reverse=True))
@@ -82,7 +82,7 @@ def bulk_add_school_billing(request):
     """課金レポート一括追加ページ"""
     from django.shortcuts import render, redirect
     from django.contrib import messages
-    from classrooms.utils import generate_school_billing_report
+    from classrooms.utils import generate_school_billing_reports
     from schools.models import School
     from datetime import datetime
 
@@ -102,19 +102,20 @@ def bulk_add_school_billing(request):
                 skipped_count = 0
                 error_count = 0
 
-                for school in schools:
-                    try:
-                        result = generate_school_billing_report(school, year, period, force=overwrite)
-
-                        if result.get('created'):
-                            created_count += 1
-                        elif result.get('updated'):
-                            updated_count += 1
-                        else:
-                            skipped_count += 1
-                    except Exception as e:
-                        error_count += 1
-                        messages.warning(request, f'{school.name}: {str(e)}')
+                try:
+                    results = generate_school_billing_reports(year, period, schools, force=overwrite)
+                except Exception as e:
+                    results = {}
+                    error_count += 1
+                    messages.warning(request, f'課金レポートの生成に失敗しました: {str(e)}')
+
+                for result in results.values():
+                    if result.get('created'):
+                        created_count += 1
+                    elif result.get('updated'):
+                        updated_count += 1
+                    else:
+                        skipped_count += 1
 
                 if created_count:
                     messages.success(request, f'{created_count}件の塾別課金レポートを新規生成しました。（{year}年度 {period}期）')
@@ -0,0 +1,75 @@
+"""
+ZIPアーカイブのストリーミング生成
+
+メンバーを追加するたびに書き出されたバイト列をそのまま返すため、
+アーカイブ全体をメモリや一時ファイルに保持せずにレスポンスを送出できる。
+"""
+import os
+import zipfile
+from urllib.parse import quote
+
+from django.http import StreamingHttpResponse
+
+
+class _ChunkBuffer:
+    """zipfileの書き込み先。tellを持たないため非シーク出力として扱われる"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_zip_stream(members, compression=zipfile.ZIP_STORED):
+    """
+    (アーカイブ内ファイル名, ファイルパス or bytes) の反復から
+    ZIPのバイト列をメンバー単位で順次生成する
+
+    PDFなど既に圧縮済みのファイルが中心のため、既定はSTORED（無圧縮）。
+    メモリ上に保持するのは常に処理中の1メンバーのみ。
+    """
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=compression, allowZip64=True) as zip_file:
+        for arcname, source in members:
+            if isinstance(source, (bytes, bytearray)):
+                data = source
+            else:
+                try:
+                    with open(source, 'rb') as f:
+                        data = f.read()
+                except (FileNotFoundError, PermissionError):
+                    continue
+            zip_file.writestr(arcname, data)
+            del data
+            chunk = buffer.drain()
+            if chunk:
+                yield chunk
+    # セントラルディレクトリはcloseで書き出される
+    chunk = buffer.drain()
+    if chunk:
+        yield chunk
+
+
+def streaming_zip_response(members, filename, compression=zipfile.ZIP_STORED):
+    """メンバーの反復をZIPとしてストリーミング配信するレスポンスを返す"""
+    response = StreamingHttpResponse(
+        iter_zip_stream(members, compression=compression),
+        content_type='application/zip'
+    )
+    ascii_name = os.path.basename(filename).encode('ascii', 'ignore').decode() or 'download.zip'
+    response['Content-Disposition'] = (
+        f'attachment; filename="{ascii_name}"; filename*=UTF-8\'\'{quote(filename)}'
+    )
+    # リバースプロキシでのバッファリングを抑止し、最初のメンバーから送出する
+    response['X-Accel-Buffering'] = 'no'
+    return response
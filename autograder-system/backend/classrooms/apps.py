@@ -5,3 +5,7 @@ class ClassroomsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "classrooms"
     verbose_name = "塾管理"
+
+    def ready(self):
+        """アプリが準備できた時にシグナルを登録"""
+        import classrooms.signals
@@ -0,0 +1,216 @@
+"""
+課金カウンター（点数入力時の差分更新）
+
+点数入力のたびに (教室, 年度, 期間) の課金対象生徒数と、生徒ごとの受講教科
+（教科コードのビット集合）を差分で更新する。課金サマリーはこのカウンターを読むだけで
+済み、受講記録からの全件再集計（rebuild_billing_counters）は照合用に時々実行する。
+
+- 生徒の初回入力は BillingStudent の一意制約で判定し、教室カウンターを F() で加算する
+- 教科は subject_mask | bit の UPDATE で追加する（同じ教科の再入力では何もしない）
+"""
+from __future__ import annotations
+
+import logging
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from autograder.after_commit import defer_until_commit
+from autograder.data_versions import mark_results_changed
+from .models import AttendanceRecord, BillingCounter, BillingStudent
+
+logger = logging.getLogger(__name__)
+
+
+def _subject_bits() -> dict:
+    """教科（コード・表示名の両方）-> ビット"""
+    from tests.models import TestDefinition
+
+    bits = {}
+    for subject, display in TestDefinition.SUBJECTS:
+        bit = 1 << (TestDefinition.SUBJECT_CODES[subject] - 1)
+        bits[subject] = bit
+        bits[display] = bit
+    return bits
+
+
+def subject_bit(subject: str) -> int:
+    """教科のビット（未知の教科は 0）"""
+    return _subject_bits().get(subject, 0)
+
+
+def subjects_from_mask(mask: int) -> list:
+    """ビット集合 -> 教科の表示名リスト（教科コード順）"""
+    from tests.models import TestDefinition
+
+    displays = dict(TestDefinition.SUBJECTS)
+    return [
+        displays[subject]
+        for subject, code in sorted(TestDefinition.SUBJECT_CODES.items(), key=lambda item: item[1])
+        if mask & (1 << (code - 1))
+    ]
+
+
+def _increment_counter(classroom, year, period) -> None:
+    updated = BillingCounter.objects.filter(classroom=classroom, year=year, period=period).update(
+        billed_students=F('billed_students') + 1,
+        updated_at=timezone.now(),
+    )
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            BillingCounter.objects.create(
+                school_id=classroom.school_id, classroom=classroom, year=year, period=period, billed_students=1
+            )
+    except IntegrityError:
+        # 同時に作成された場合は加算し直す
+        BillingCounter.objects.filter(classroom=classroom, year=year, period=period).update(
+            billed_students=F('billed_students') + 1,
+            updated_at=timezone.now(),
+        )
+
+
+def record_billing_input(classroom, student_id, student_name, year, period, subject) -> bool:
+    """
+    点数入力を課金カウンターに反映する
+
+    Returns:
+        bool: この入力で新たに課金対象になった生徒なら True
+    """
+    bit = subject_bit(subject)
+    with transaction.atomic():
+        billing_student, created = BillingStudent.objects.get_or_create(
+            classroom=classroom,
+            student_id=student_id,
+            year=year,
+            period=period,
+            defaults={'student_name': student_name, 'subject_mask': bit},
+        )
+        if created:
+            _increment_counter(classroom, year, period)
+        elif bit and not billing_student.subject_mask & bit:
+            BillingStudent.objects.filter(pk=billing_student.pk).update(
+                subject_mask=F('subject_mask').bitor(bit)
+            )
+    return created
+
+
+def rebuild_billing_counters(year, period, school_pks=None) -> int:
+    """
+    点数入力済みの受講記録からカウンターを作り直す（照合用）
+
+    Returns:
+        int: 課金対象生徒数
+    """
+    records = AttendanceRecord.objects.filter(year=year, period=period, has_score_input=True)
+    if school_pks is not None:
+        records = records.filter(classroom__school_id__in=school_pks)
+
+    bits = _subject_bits()
+    students = {}
+    classroom_schools = {}
+    for classroom_pk, school_pk, student_id, student_name, subject in records.values_list(
+        'classroom_id', 'classroom__school_id', 'student_id', 'student_name', 'subject'
+    ).iterator(chunk_size=2000):
+        classroom_schools[classroom_pk] = school_pk
+        key = (classroom_pk, student_id)
+        if key not in students:
+            students[key] = BillingStudent(
+                classroom_id=classroom_pk, student_id=student_id, student_name=student_name,
+                year=year, period=period, subject_mask=0,
+            )
+        students[key].subject_mask |= bits.get(subject, 0)
+
+    billed = defaultdict(int)
+    for classroom_pk, _ in students:
+        billed[classroom_pk] += 1
+
+    counters = [
+        BillingCounter(
+            school_id=classroom_schools[classroom_pk], classroom_id=classroom_pk,
+            year=year, period=period, billed_students=count,
+        )
+        for classroom_pk, count in billed.items()
+    ]
+
+    existing_counters = BillingCounter.objects.filter(year=year, period=period)
+    existing_students = BillingStudent.objects.filter(year=year, period=period)
+    if school_pks is not None:
+        existing_counters = existing_counters.filter(school_id__in=school_pks)
+        existing_students = existing_students.filter(classroom__school_id__in=school_pks)
+
+    with transaction.atomic():
+        affected_schools = set(classroom_schools.values()) | set(existing_counters.values_list('school_id', flat=True))
+        existing_students.delete()
+        existing_counters.delete()
+        BillingStudent.objects.bulk_create(students.values(), batch_size=2000)
+        BillingCounter.objects.bulk_create(counters, batch_size=2000)
+        # bulk_create は post_save を送らないため、データバージョンはここで進める
+        for school_pk in affected_schools:
+            mark_results_changed(year, period, school_pk)
+
+    return len(students)
+
+
+def get_billing_counter_summary(year, period, school_pks) -> dict:
+    """
+    有効な教室のカウンターを塾ごとにまとめて返す（1クエリ）
+
+    Returns:
+        dict: {塾PK: {'total_classrooms', 'billed_students', 'classrooms': [...], 'updated_at'}}
+    """
+    summary = {}
+    for school_pk, classroom_code, classroom_name, billed_students, updated_at in BillingCounter.objects.filter(
+        year=year,
+        period=period,
+        school_id__in=school_pks,
+        classroom__is_active=True,
+        billed_students__gt=0,
+    ).order_by('school_id', 'classroom__classroom_id').values_list(
+        'school_id', 'classroom__classroom_id', 'classroom__name', 'billed_students', 'updated_at'
+    ):
+        entry = summary.setdefault(school_pk, {
+            'total_classrooms': 0,
+            'billed_students': 0,
+            'classrooms': [],
+            'updated_at': None,
+        })
+        entry['total_classrooms'] += 1
+        entry['billed_students'] += billed_students
+        entry['classrooms'].append({
+            'classroom_id': classroom_code,
+            'classroom_name': classroom_name,
+            'billed_students': billed_students,
+        })
+        if entry['updated_at'] is None or updated_at > entry['updated_at']:
+            entry['updated_at'] = updated_at
+    return summary
+
+
+# --- 点数入力の検知（トランザクション確定時にまとめて反映） ---
+
+def _flush_pending(pending) -> None:
+    from students.models import Student
+    from tests.models import TestDefinition
+    from .utils import update_attendance_record
+
+    try:
+        students = Student.objects.select_related('classroom').in_bulk({student_id for student_id, _ in pending})
+        tests = TestDefinition.objects.select_related('schedule').in_bulk({test_id for _, test_id in pending})
+        for student_pk, test_pk in sorted(pending):
+            student = students.get(student_pk)
+            test_definition = tests.get(test_pk)
+            if student is None or test_definition is None or student.classroom_id is None:
+                continue
+            update_attendance_record(student, test_definition)
+    except Exception as e:
+        # 点数入力自体は確定済みのため失敗はログに残し、照合時に反映する
+        logger.error(f"課金カウンター更新エラー: {str(e)}")
+
+
+def queue_score_input(student_id, test_id) -> None:
+    """出席ありの点数入力を記録し、トランザクション確定時の反映を1回だけ予約する"""
+    defer_until_commit('billing_counters', (student_id, test_id), _flush_pending)
@@ -0,0 +1,77 @@
+"""
+課金レポートのバックグラウンド生成
+
+テスト完了などで課金レポートが必要になった時に、保存したリクエストやコマンドを
+待たせずに生成する。(年度, 期間) ごとにまとめ、トランザクション確定後に1回だけ
+別スレッドで generate_school_billing_reports を実行する。
+同じ (年度, 期間) の生成が他のプロセスで実行中の場合は、キャッシュのロックで重複を防ぐ
+（プロセス間のロックになるのは Redis などの共有キャッシュを使う場合のみ）。
+"""
+from __future__ import annotations
+
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from autograder.after_commit import defer_until_commit
+
+logger = logging.getLogger(__name__)
+
+# 実行中ロックの有効期限（異常終了してもこの時間で解放される）
+BILLING_JOB_LOCK_TIMEOUT = 60 * 30
+
+
+def _lock_key(year, period) -> str:
+    return f'billing_job:{year}:{period}'
+
+
+def run_school_billing(year, period, force=False) -> dict:
+    """有効な全塾の課金レポートを (年度, 期間) 単位でまとめて生成する"""
+    from schools.models import School
+    from .utils import generate_school_billing_reports
+
+    results = generate_school_billing_reports(
+        int(year), period, School.objects.filter(is_active=True), force=force
+    )
+    successful_reports = sum(
+        1 for result in results.values() if result.get('created') or result.get('updated')
+    )
+    logger.info(
+        f"自動塾課金レポート生成完了: {year}年度 {period} "
+        f"成功 {successful_reports}件, スキップ {len(results) - successful_reports}件"
+    )
+    return results
+
+
+def _run_job(year, period, in_thread=True) -> None:
+    try:
+        run_school_billing(year, period)
+    except Exception as e:
+        logger.error(f"自動課金レポート生成で予期しないエラー: {year}年度 {period} - {str(e)}")
+    finally:
+        cache.delete(_lock_key(year, period))
+        if in_thread:
+            # スレッド用に開いたDB接続を閉じる
+            connection.close()
+
+
+def _flush_pending(pending) -> None:
+    for year, period in sorted(pending):
+        if not cache.add(_lock_key(year, period), 1, timeout=BILLING_JOB_LOCK_TIMEOUT):
+            logger.info(f"課金レポート生成は実行中のためスキップ: {year}年度 {period}")
+            continue
+        if getattr(settings, 'BILLING_JOBS_ASYNC', True):
+            # デーモンにしないため、コマンド終了時も生成の完了を待つ
+            threading.Thread(
+                target=_run_job, args=(year, period), name=f'billing-{year}-{period}'
+            ).start()
+        else:
+            _run_job(year, period, in_thread=False)
+
+
+def enqueue_school_billing(year, period) -> None:
+    """(年度, 期間) の課金レポート生成を予約する（トランザクション確定後に1回だけ実行）"""
+    defer_until_commit('billing_jobs', (int(year), period), _flush_pending)
@@ -1,11 +1,16 @@
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from classrooms.models import AttendanceRecord
+from classrooms.billing_counters import rebuild_billing_counters
 from scores.models import Score
 from tests.models import TestSchedule, TestDefinition
 from collections import defaultdict
+from django.db.models import Count
 from django.utils import timezone
 
+# 一括 upsert の1回あたりの件数
+BATCH_SIZE = 5000
+
 
 class Command(BaseCommand):
     help = '得点データ（Score）から出席記録（AttendanceRecord）を生成'
@@ -62,96 +67,63 @@ class Command(BaseCommand):
             )
             return
 
-        # 出席済み（attendance=True）の得点データを取得
+        # 出席済み（attendance=True）の得点を (教室, 生徒, 教科) 単位で重複排除して取得
         try:
-            attended_scores = Score.objects.filter(
+            attended_pairs = Score.objects.filter(
                 test__in=test_definitions,
                 attendance=True
-            ).select_related(
-                'student',
-                'student__classroom',
-                'test'
-            )
-            
-            self.stdout.write(f'出席済み得点データ: {attended_scores.count()}件')
-            
+            ).values_list(
+                'student__classroom_id',
+                'student__student_id',
+                'student__name',
+                'test__subject'
+            ).order_by().distinct()
+
+            self.stdout.write(f'生成対象の出席記録: {attended_pairs.count()}件')
+
         except Exception as e:
             self.stdout.write(
                 self.style.ERROR(f'得点データ取得エラー: {str(e)}')
             )
             return
 
-        # 生徒・テスト・科目の組み合わせでグループ化
-        attendance_records = {}
-        processed_combinations = set()
-        
-        for score in attended_scores:
-            # 生徒・テストの組み合わせをチェック（重複排除）
-            combination_key = (score.student.student_id, score.test.id)
-            if combination_key in processed_combinations:
-                continue
-            processed_combinations.add(combination_key)
-            
-            # AttendanceRecord用のキー
-            record_key = (
-                score.student.classroom.id,
-                score.student.student_id,
-                score.student.name,
-                year,
-                period,
-                score.test.get_subject_display()
-            )
-            
-            attendance_records[record_key] = {
-                'classroom': score.student.classroom,
-                'student_id': score.student.student_id,
-                'student_name': score.student.name,
-                'year': year,
-                'period': period,
-                'subject': score.test.get_subject_display(),
-                'has_score_input': True,
-                'score_input_date': timezone.now()
-            }
-
-        self.stdout.write(f'生成対象の出席記録: {len(attendance_records)}件')
-
-        # 既存記録の確認と処理
-        created_count = 0
-        updated_count = 0
-        skipped_count = 0
-        
+        subject_display = dict(TestDefinition.SUBJECTS)
+        existing_records = AttendanceRecord.objects.filter(year=year, period=period)
+        before_count = existing_records.count()
+        target_count = 0
+        now = timezone.now()
+
+        # 一意キー (教室, 生徒ID, 年度, 期, 教科) で一括 upsert（--force なしは既存記録を残す）
+        upsert_options = {
+            'update_conflicts': True,
+            'unique_fields': ['classroom', 'student_id', 'year', 'period', 'subject'],
+            'update_fields': ['has_score_input', 'score_input_date', 'updated_at'],
+        } if force else {'ignore_conflicts': True}
+
         with transaction.atomic():
-            for record_key, record_data in attendance_records.items():
-                classroom, student_id, student_name, year, period, subject = record_key
-                
-                try:
-                    # 既存記録をチェック
-                    existing_record = AttendanceRecord.objects.filter(
-                        classroom=record_data['classroom'],
-                        student_id=student_id,
-                        year=year,
-                        period=period,
-                        subject=subject
-                    ).first()
-                    
-                    if existing_record:
-                        if force:
-                            # 更新
-                            existing_record.has_score_input = True
-                            existing_record.score_input_date = record_data['score_input_date']
-                            existing_record.save()
-                            updated_count += 1
-                        else:
-                            skipped_count += 1
-                    else:
-                        # 新規作成
-                        AttendanceRecord.objects.create(**record_data)
-                        created_count += 1
-                        
-                except Exception as e:
-                    self.stdout.write(
-                        self.style.WARNING(f'記録作成エラー ({student_name}): {str(e)}')
-                    )
+            batch = []
+            for classroom_id, student_id, student_name, subject in attended_pairs.iterator(chunk_size=BATCH_SIZE):
+                batch.append(AttendanceRecord(
+                    classroom_id=classroom_id,
+                    student_id=student_id,
+                    student_name=student_name,
+                    year=year,
+                    period=period,
+                    subject=subject_display.get(subject, subject),
+                    has_score_input=True,
+                    score_input_date=now
+                ))
+                if len(batch) >= BATCH_SIZE:
+                    AttendanceRecord.objects.bulk_create(batch, **upsert_options)
+                    target_count += len(batch)
+                    batch = []
+            if batch:
+                AttendanceRecord.objects.bulk_create(batch, **upsert_options)
+                target_count += len(batch)
+
+        created_count = existing_records.count() - before_count
+        updated_count = target_count - created_count if force else 0
+        skipped_count = 0 if force else target_count - created_count
 
         # 結果表示
         self.stdout.write(
@@ -163,54 +135,55 @@ class Command(BaseCommand):
             )
         )
 
+        # 課金カウンターを受講記録と照合（塾ごとのデータバージョンもここで進む）
+        billed = rebuild_billing_counters(year, period)
+        self.stdout.write(f'課金カウンターを再集計しました: {billed}名')
+
         # 集計表示
         self.display_summary(year, period)
 
     def display_summary(self, year, period):
-        """生成結果のサマリー表示"""
+        """生成結果のサマリー表示（塾・教科ごとの集計はSQLで行う）"""
         period_display = {'spring': '春期', 'summer': '夏期', 'winter': '冬期'}[period]
-        
+
         records = AttendanceRecord.objects.filter(
             year=year,
             period=period,
             has_score_input=True
-        ).select_related('classroom', 'classroom__school')
-        
-        if not records.exists():
+        )
+
+        school_summary = list(
+            records.values('classroom__school_id', 'classroom__school__name').annotate(
+                classroom_count=Count('classroom', distinct=True),
+                student_count=Count('student_id', distinct=True),
+                subject_count=Count('subject', distinct=True),
+            ).order_by('classroom__school__name')
+        )
+
+        if not school_summary:
             self.stdout.write(
                 self.style.WARNING('生成された出席記録がありません')
             )
             return
 
-        # 塾ごとの集計
-        school_summary = defaultdict(lambda: {
-            'classrooms': set(),
-            'students': set(),
-            'subjects': set()
-        })
-        
-        for record in records:
-            school = record.classroom.school
-            school_summary[school.name]['classrooms'].add(record.classroom.name)
-            school_summary[school.name]['students'].add((record.student_id, record.student_name))
-            school_summary[school.name]['subjects'].add(record.subject)
+        subject_counts = defaultdict(list)
+        for school_id, subject, record_count in records.values_list(
+            'classroom__school_id', 'subject'
+        ).annotate(record_count=Count('id')).order_by('classroom__school_id', 'subject'):
+            subject_counts[school_id].append((subject, record_count))
 
         self.stdout.write(
             self.style.SUCCESS(f'\n=== {year}年度 {period_display} 出席記録サマリー ===')
         )
-        
-        for school_name, data in school_summary.items():
+
+        for data in school_summary:
             self.stdout.write(
-                f'{school_name}: '
-                f'{len(data["classrooms"])}教室 '
-                f'{len(data["students"])}名 '
-                f'{len(data["subjects"])}科目'
+                f'{data["classroom__school__name"]}: '
+                f'{data["classroom_count"]}教室 '
+                f'{data["student_count"]}名 '
+                f'{data["subject_count"]}科目'
             )
-            
+
             # 科目別詳細
-            for subject in sorted(data["subjects"]):
-                subject_count = records.filter(
-                    classroom__school__name=school_name,
-                    subject=subject
-                ).count()
-                self.stdout.write(f'  - {subject}: {subject_count}件')
\ No newline at end of file
+            for subject, record_count in subject_counts[data['classroom__school_id']]:
+                self.stdout.write(f'  - {subject}: {record_count}件')
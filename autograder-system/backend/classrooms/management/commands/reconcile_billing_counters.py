@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from classrooms.billing_counters import rebuild_billing_counters
+
+
+class Command(BaseCommand):
+    help = '受講記録（AttendanceRecord）から課金カウンターを再集計して照合'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--year',
+            type=int,
+            required=True,
+            help='対象年度を指定してください'
+        )
+        parser.add_argument(
+            '--period',
+            type=str,
+            choices=['spring', 'summer', 'winter'],
+            required=True,
+            help='対象期間を指定してください (spring/summer/winter)'
+        )
+
+    def handle(self, *args, **options):
+        year = options['year']
+        period = options['period']
+        period_display = {'spring': '春期', 'summer': '夏期', 'winter': '冬期'}[period]
+
+        billed = rebuild_billing_counters(year, period)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'{year}年度 {period_display} の課金カウンターを再集計しました: {billed}名')
+        )
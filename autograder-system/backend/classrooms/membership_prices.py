@@ -0,0 +1,39 @@
+"""
+会員種別の料金のプロセス内キャッシュ
+
+会員種別（MembershipType）の 塾区分コード -> 1名あたり料金 をワーカープロセス内に保持する。
+有効性はデータバージョン（autograder.data_versions）で判定するため、通常時は DB に
+アクセスせずに返せる。MembershipType の保存・削除でバージョンが進むと、次の参照時に
+1回だけ読み直す。課金・帳票の単価はすべてここから引く（料金表をコードに持たない）。
+"""
+from __future__ import annotations
+
+from autograder.data_versions import get_data_version, MEMBERSHIP_PRICES_SCOPE
+
+# 会員種別も一般料金も登録されていない場合の料金
+DEFAULT_PRICE_PER_STUDENT = 500
+
+# (データバージョン, {塾区分コード: 料金})
+_store = {}
+
+
+def get_membership_prices() -> dict:
+    """塾区分コード -> 1名あたり料金"""
+    from .models import MembershipType
+
+    version = get_data_version(MEMBERSHIP_PRICES_SCOPE)
+    entry = _store.get('prices')
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    prices = dict(MembershipType.objects.values_list('type_code', 'price_per_student'))
+    _store['prices'] = (version, prices)
+    return prices
+
+
+def resolve_price_per_student(membership_type_code, prices=None) -> int:
+    """塾の会員種別の単価（未登録なら一般料金、一般料金もなければ既定料金）"""
+    if prices is None:
+        prices = get_membership_prices()
+    if membership_type_code in prices:
+        return prices[membership_type_code]
+    return prices.get('general', DEFAULT_PRICE_PER_STUDENT)
@@ -0,0 +1,135 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("schools", "0006_classroom_membershiptype_student_schoolbillingreport_and_more"),
+        ("classrooms", "0008_auto_20250917_1256"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BillingCounter",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("year", models.IntegerField(verbose_name="年度")),
+                (
+                    "period",
+                    models.CharField(
+                        choices=[
+                            ("spring", "春期"),
+                            ("summer", "夏期"),
+                            ("winter", "冬期"),
+                        ],
+                        max_length=10,
+                        verbose_name="期",
+                    ),
+                ),
+                (
+                    "billed_students",
+                    models.IntegerField(default=0, verbose_name="課金対象生徒数"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="更新日時"),
+                ),
+                (
+                    "classroom",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="classrooms.classroom",
+                        verbose_name="教室",
+                    ),
+                ),
+                (
+                    "school",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="schools.school",
+                        verbose_name="塾",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "課金カウンター",
+                "verbose_name_plural": "課金カウンター",
+                "db_table": "billing_counters",
+                "indexes": [
+                    models.Index(
+                        fields=["school", "year", "period"],
+                        name="billing_cou_school__d591ab_idx",
+                    ),
+                ],
+                "unique_together": {("classroom", "year", "period")},
+            },
+        ),
+        migrations.CreateModel(
+            name="BillingStudent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("student_id", models.CharField(max_length=10, verbose_name="生徒ID")),
+                ("student_name", models.CharField(max_length=100, verbose_name="生徒名")),
+                ("year", models.IntegerField(verbose_name="年度")),
+                (
+                    "period",
+                    models.CharField(
+                        choices=[
+                            ("spring", "春期"),
+                            ("summer", "夏期"),
+                            ("winter", "冬期"),
+                        ],
+                        max_length=10,
+                        verbose_name="期",
+                    ),
+                ),
+                (
+                    "subject_mask",
+                    models.IntegerField(default=0, verbose_name="受講教科"),
+                ),
+                (
+                    "first_input_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="初回入力日時"),
+                ),
+                (
+                    "classroom",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="classrooms.classroom",
+                        verbose_name="教室",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "課金対象生徒",
+                "verbose_name_plural": "課金対象生徒",
+                "db_table": "billing_students",
+                "indexes": [
+                    models.Index(
+                        fields=["classroom", "year", "period"],
+                        name="billing_stu_classro_ade469_idx",
+                    ),
+                ],
+                "unique_together": {("classroom", "student_id", "year", "period")},
+            },
+        ),
+    ]
@@ -0,0 +1,115 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def move_details_to_line_items(apps, schema_editor):
+    """既存レポートの student_details / classroom_details を明細行に移す"""
+    SchoolBillingReport = apps.get_model("classrooms", "SchoolBillingReport")
+    SchoolBillingLineItem = apps.get_model("classrooms", "SchoolBillingLineItem")
+    Classroom = apps.get_model("classrooms", "Classroom")
+
+    classroom_pks = dict(Classroom.objects.values_list("classroom_id", "id"))
+    batch = []
+    for report in SchoolBillingReport.objects.iterator(chunk_size=100):
+        classroom_codes = {
+            name: (detail or {}).get("classroom_id", "")
+            for name, detail in (report.classroom_details or {}).items()
+        }
+        for detail in (report.student_details or {}).values():
+            classroom_name = detail.get("classroom_name", "")
+            classroom_code = classroom_codes.get(classroom_name, "")
+            batch.append(
+                SchoolBillingLineItem(
+                    report_id=report.pk,
+                    classroom_id=classroom_pks.get(classroom_code),
+                    classroom_code=classroom_code,
+                    classroom_name=classroom_name,
+                    student_id=detail.get("student_id", ""),
+                    student_name=detail.get("student_name", ""),
+                    subjects=detail.get("subjects", []),
+                    score_input_dates=detail.get("score_input_dates", []),
+                )
+            )
+        if len(batch) >= 5000:
+            SchoolBillingLineItem.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        SchoolBillingLineItem.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("classrooms", "0009_billingcounter_billingstudent"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SchoolBillingLineItem",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("classroom_code", models.CharField(max_length=10, verbose_name="教室ID")),
+                ("classroom_name", models.CharField(max_length=100, verbose_name="教室名")),
+                ("student_id", models.CharField(max_length=10, verbose_name="生徒ID")),
+                ("student_name", models.CharField(max_length=100, verbose_name="生徒名")),
+                ("subjects", models.JSONField(default=list, verbose_name="教科")),
+                (
+                    "score_input_dates",
+                    models.JSONField(default=list, verbose_name="点数入力日"),
+                ),
+                (
+                    "classroom",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="classrooms.classroom",
+                        verbose_name="教室",
+                    ),
+                ),
+                (
+                    "report",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="line_items",
+                        to="classrooms.schoolbillingreport",
+                        verbose_name="課金レポート",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "塾別課金明細",
+                "verbose_name_plural": "塾別課金明細",
+                "db_table": "school_billing_line_items",
+                "indexes": [
+                    models.Index(
+                        fields=["report", "classroom_name", "student_name"],
+                        name="school_bill_report__3a4997_idx",
+                    ),
+                    models.Index(
+                        fields=["report", "student_id"],
+                        name="school_bill_report__3e0ae5_idx",
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(move_details_to_line_items, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name="schoolbillingreport",
+            name="classroom_details",
+        ),
+        migrations.RemoveField(
+            model_name="schoolbillingreport",
+            name="student_details",
+        ),
+    ]
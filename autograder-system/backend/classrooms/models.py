@@ -240,9 +240,7 @@ class SchoolBillingReport(models.Model):
     price_per_student = models.IntegerField(verbose_name='単価（円）')
     total_amount = models.IntegerField(default=0, verbose_name='合計金額（円）')
 
-    # 詳細情報（JSON）
-    classroom_details = models.JSONField(default=dict, verbose_name='教室別詳細')
-    student_details = models.JSONField(default=dict, verbose_name='生徒詳細')
+    # 教室・生徒ごとの内訳は SchoolBillingLineItem に保持する
 
     generated_at = models.DateTimeField(auto_now_add=True, verbose_name='生成日時')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='更新日時')
@@ -270,3 +268,85 @@ class SchoolBillingReport(models.Model):
         if self.total_classrooms > 0:
             return self.total_amount / self.total_classrooms
         return 0
+
+
+class SchoolBillingLineItem(models.Model):
+    """塾別課金レポートの明細（教室×課金対象生徒ごとに1行）"""
+    report = models.ForeignKey(
+        SchoolBillingReport, on_delete=models.CASCADE, related_name='line_items', verbose_name='課金レポート'
+    )
+    classroom = models.ForeignKey(Classroom, on_delete=models.SET_NULL, null=True, blank=True, verbose_name='教室')
+    classroom_code = models.CharField(max_length=10, verbose_name='教室ID')
+    classroom_name = models.CharField(max_length=100, verbose_name='教室名')
+    student_id = models.CharField(max_length=10, verbose_name='生徒ID')
+    student_name = models.CharField(max_length=100, verbose_name='生徒名')
+    subjects = models.JSONField(default=list, verbose_name='教科')
+    score_input_dates = models.JSONField(default=list, verbose_name='点数入力日')
+
+    class Meta:
+        db_table = 'school_billing_line_items'
+        verbose_name = '塾別課金明細'
+        verbose_name_plural = '塾別課金明細'
+        indexes = [
+            models.Index(fields=['report', 'classroom_name', 'student_name']),
+            models.Index(fields=['report', 'student_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.classroom_name} - {self.student_name}"
+
+
+class BillingCounter(models.Model):
+    """教室・年度・期間ごとの課金カウンター（点数入力時に加算し、再集計で照合する）"""
+    PERIOD_CHOICES = [
+        ('spring', '春期'),
+        ('summer', '夏期'),
+        ('winter', '冬期'),
+    ]
+
+    school = models.ForeignKey('schools.School', on_delete=models.CASCADE, verbose_name='塾')
+    classroom = models.ForeignKey(Classroom, on_delete=models.CASCADE, verbose_name='教室')
+    year = models.IntegerField(verbose_name='年度')
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES, verbose_name='期')
+    billed_students = models.IntegerField(default=0, verbose_name='課金対象生徒数')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新日時')
+
+    class Meta:
+        db_table = 'billing_counters'
+        verbose_name = '課金カウンター'
+        verbose_name_plural = '課金カウンター'
+        unique_together = ['classroom', 'year', 'period']
+        indexes = [
+            models.Index(fields=['school', 'year', 'period']),
+        ]
+
+    def __str__(self):
+        return f"{self.classroom.name} - {self.year}年度 {self.get_period_display()} - {self.billed_students}名"
+
+
+class BillingStudent(models.Model):
+    """課金対象生徒（教室・年度・期間ごと）。受講教科は教科コードのビット集合で保持する"""
+    classroom = models.ForeignKey(Classroom, on_delete=models.CASCADE, verbose_name='教室')
+    student_id = models.CharField(max_length=10, verbose_name='生徒ID')
+    student_name = models.CharField(max_length=100, verbose_name='生徒名')
+    year = models.IntegerField(verbose_name='年度')
+    period = models.CharField(max_length=10, choices=AttendanceRecord.PERIOD_CHOICES, verbose_name='期')
+    subject_mask = models.IntegerField(default=0, verbose_name='受講教科')
+    first_input_at = models.DateTimeField(auto_now_add=True, verbose_name='初回入力日時')
+
+    class Meta:
+        db_table = 'billing_students'
+        verbose_name = '課金対象生徒'
+        verbose_name_plural = '課金対象生徒'
+        unique_together = ['classroom', 'student_id', 'year', 'period']
+        indexes = [
+            models.Index(fields=['classroom', 'year', 'period']),
+        ]
+
+    def get_subjects(self):
+        """受講教科の表示名リスト"""
+        from .billing_counters import subjects_from_mask
+        return subjects_from_mask(self.subject_mask)
+
+    def __str__(self):
+        return f"{self.classroom.name} - {self.student_name} ({self.year}年度 {self.get_period_display()})"
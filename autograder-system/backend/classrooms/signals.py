@@ -0,0 +1,53 @@
+"""
+課金データのDjangoシグナル
+
+受講記録・塾課金レポートの書き込みを検知し、条件付きGET用のデータバージョンを進める。
+出席ありの点数入力は受講記録と課金カウンターに反映する。
+"""
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from autograder.data_versions import mark_membership_prices_changed, mark_results_changed
+from schools.models import School
+from scores.models import Score
+from .billing_counters import queue_score_input
+from .models import Classroom, AttendanceRecord, MembershipType, SchoolBillingReport
+
+
+@receiver(post_save, sender=Score)
+def score_input_for_billing(sender, instance, **kwargs):
+    """出席ありの点数入力を受講記録・課金カウンターに反映する（確定時に生徒×テスト単位で1回）"""
+    if instance.attendance:
+        queue_score_input(instance.student_id, instance.test_id)
+
+
+@receiver(post_save, sender=AttendanceRecord)
+@receiver(post_delete, sender=AttendanceRecord)
+def attendance_record_changed(sender, instance, **kwargs):
+    mark_results_changed(instance.year, instance.period, instance.classroom.school_id)
+
+
+@receiver(post_save, sender=SchoolBillingReport)
+@receiver(post_delete, sender=SchoolBillingReport)
+def school_billing_report_changed(sender, instance, **kwargs):
+    mark_results_changed(instance.year, instance.period, instance.school_id)
+
+
+@receiver(post_save, sender=Classroom)
+@receiver(post_delete, sender=Classroom)
+def classroom_changed(sender, instance, **kwargs):
+    """教室の増減は全期間の課金集計に影響する"""
+    mark_results_changed(school=instance.school_id)
+
+
+@receiver(post_save, sender=School)
+def school_changed(sender, instance, **kwargs):
+    """会員種別（単価）の変更は全期間の課金集計に影響する"""
+    mark_results_changed(school=instance.pk)
+
+
+@receiver(post_save, sender=MembershipType)
+@receiver(post_delete, sender=MembershipType)
+def membership_type_changed(sender, instance, **kwargs):
+    """料金の変更はプロセス内の料金キャッシュと全期間の課金集計に影響する"""
+    mark_membership_prices_changed()
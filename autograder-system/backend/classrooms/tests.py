@@ -1,3 +1,122 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from schools.models import School
+from scores.models import Score
+from students.models import Student
+from tests.models import QuestionGroup, TestDefinition, TestSchedule
+
+from .billing_counters import get_billing_counter_summary, rebuild_billing_counters
+from .models import BillingCounter, BillingStudent, Classroom
+
+
+class BillingFixtureMixin:
+    """1塾1教室・国語/算数（大問2つずつ）・生徒3人"""
+
+    def setUp(self):
+        now = timezone.now()
+        School.objects.bulk_create([School(school_id='100001', name='テスト塾')])
+        self.school = School.objects.get()
+        Classroom.objects.bulk_create([Classroom(classroom_id='100001', name='テスト教室', school=self.school)])
+        self.classroom = Classroom.objects.get()
+        schedule = TestSchedule.objects.create(
+            year=2026, period='summer', planned_date=now.date(), actual_date=now.date(), deadline_at=now
+        )
+        TestDefinition.objects.bulk_create([
+            TestDefinition(schedule=schedule, grade_level='elementary_1', subject=subject, max_score=100)
+            for subject in ('japanese', 'math')
+        ])
+        self.japanese, self.math = TestDefinition.objects.order_by('id')
+        QuestionGroup.objects.bulk_create([
+            QuestionGroup(test=test, group_number=number, title='大問', max_score=50)
+            for test in (self.japanese, self.math)
+            for number in (1, 2)
+        ])
+        Student.objects.bulk_create([
+            Student(student_id=f'S{i}', name=f'生徒{i}', classroom=self.classroom, grade='1')
+            for i in range(3)
+        ])
+        self.students = list(Student.objects.order_by('id'))
+
+    def input_scores(self, student, test, attendance=True):
+        for question_group in test.question_groups.all():
+            Score.objects.create(
+                student=student, test=test, question_group=question_group,
+                score=10 if attendance else 0, attendance=attendance,
+            )
+
+
+class BillingCounterTests(BillingFixtureMixin, TestCase):
+    """点数入力時の差分更新と全件再集計の照合"""
+
+    def counter_state(self):
+        return (
+            sorted(BillingCounter.objects.values_list('classroom_id', 'billed_students')),
+            sorted(BillingStudent.objects.values_list('student_id', 'subject_mask')),
+        )
+
+    def test_incremental_counters_match_rebuild(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.input_scores(self.students[0], self.japanese)
+                self.input_scores(self.students[1], self.japanese)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.input_scores(self.students[0], self.math)
+                self.input_scores(self.students[2], self.math, attendance=False)
+
+        incremental = self.counter_state()
+        summary = get_billing_counter_summary(2026, 'summer', [self.school.pk])
+        self.assertEqual(summary[self.school.pk]['billed_students'], 2)
+
+        rebuild_billing_counters(2026, 'summer')
+        self.assertEqual(self.counter_state(), incremental)
+
+    def test_rolled_back_input_is_not_billed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.input_scores(self.students[0], self.japanese)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            with transaction.atomic():
+                self.input_scores(self.students[1], self.japanese)
+
+        self.assertEqual(
+            list(BillingStudent.objects.values_list('student_id', flat=True)),
+            [self.students[1].student_id],
+        )
+        summary = get_billing_counter_summary(2026, 'summer', [self.school.pk])
+        self.assertEqual(summary[self.school.pk]['billed_students'], 1)
+
+
+class BillingDetailsPaginationTests(BillingFixtureMixin, TestCase):
+    """請求詳細の生徒明細は ?page / ?page_size 指定時のみページ分割する"""
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                for student in self.students:
+                    self.input_scores(student, self.japanese)
+        self.client = APIClient()
+        self.client.force_authenticate(
+            get_user_model().objects.create_superuser(username='admin', password='x', email='a@example.com')
+        )
+
+    def billing_details(self, **params):
+        return self.client.get('/api/classrooms/billing_details/', {'year': 2026, 'period': 'summer', **params}).json()
+
+    def test_without_page_params_returns_every_student(self):
+        data = self.billing_details()
+        self.assertEqual(len(data['schools'][0]['students']), 3)
+        self.assertNotIn('students_pagination', data)
+
+    def test_page_size_paginates_students(self):
+        data = self.billing_details(page_size=2)
+        self.assertEqual(len(data['schools'][0]['students']), 2)
+        self.assertEqual(data['students_pagination']['count'], 3)
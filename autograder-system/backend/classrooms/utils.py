@@ -1,6 +1,7 @@
 from django.utils import timezone
 from django.db import transaction
-from .models import AttendanceRecord, MembershipType, SchoolBillingReport
+from .membership_prices import get_membership_prices, resolve_price_per_student
+from .models import AttendanceRecord, SchoolBillingReport, SchoolBillingLineItem
 import logging
 
 logger = logging.getLogger(__name__)
@@ -8,42 +9,45 @@ logger = logging.getLogger(__name__)
 def update_attendance_record(student, test_definition):
     """
     点数入力時に受講記録を更新する
-    
+
+    受講記録と同時に課金カウンター（classrooms.billing_counters）も差分で更新する。
+
     Args:
         student: Student model instance
         test_definition: TestDefinition model instance
     """
-    from students.models import Student
-    from tests.models import TestDefinition
-    
+    from .billing_counters import record_billing_input
+
     # 必要な情報を取得
     classroom = student.classroom
-    
-    # テスト定義から年度・期・教科を取得
-    # テスト定義の構造に応じて調整が必要
-    year = getattr(test_definition, 'year', 2025)
-    period = getattr(test_definition, 'period', 'summer')
-    subject = getattr(test_definition, 'subject', '算数')
-    
-    # 受講記録を作成または更新
-    attendance_record, created = AttendanceRecord.objects.update_or_create(
-        classroom=classroom,
-        student_id=student.student_id,
-        year=year,
-        period=period,
-        subject=subject,
-        defaults={
-            'student_name': student.name,
-            'has_score_input': True,
-            'score_input_date': timezone.now(),
-        }
-    )
-    
+
+    # テスト定義の日程から年度・期を、教科は表示名（受講記録の形式）で取得
+    schedule = test_definition.schedule
+    year = int(schedule.year)
+    period = schedule.period
+    subject = test_definition.get_subject_display()
+
+    with transaction.atomic():
+        # 受講記録を作成または更新
+        attendance_record, created = AttendanceRecord.objects.update_or_create(
+            classroom=classroom,
+            student_id=student.student_id,
+            year=year,
+            period=period,
+            subject=subject,
+            defaults={
+                'student_name': student.name,
+                'has_score_input': True,
+                'score_input_date': timezone.now(),
+            }
+        )
+        record_billing_input(classroom, student.student_id, student.name, year, period, subject)
+
     if created:
-        print(f"新規受講記録を作成: {student.name} ({classroom.name})")
+        logger.debug(f"新規受講記録を作成: {student.name} ({classroom.name})")
     else:
-        print(f"受講記録を更新: {student.name} ({classroom.name})")
-    
+        logger.debug(f"受講記録を更新: {student.name} ({classroom.name})")
+
     return attendance_record
 
 
@@ -155,28 +159,8 @@ def generate_classroom_billing_report(classroom, year, period, force=False):
     # 課金対象生徒数
     billed_students = len(student_details)
 
-    # 料金計算
-    # 教室の会員種別から単価を取得
-    if hasattr(classroom, 'school') and hasattr(classroom.school, 'membership_type'):
-        # membership_typeが文字列として保存されている場合
-        membership_type_code = classroom.school.membership_type
-        try:
-            membership_type = MembershipType.objects.get(type_code=membership_type_code)
-            price_per_student = membership_type.price_per_student
-        except MembershipType.DoesNotExist:
-            # フォールバック: 一般料金
-            try:
-                general_membership = MembershipType.objects.get(type_code='general')
-                price_per_student = general_membership.price_per_student
-            except MembershipType.DoesNotExist:
-                price_per_student = 500  # デフォルト料金
-    else:
-        # フォールバック: 一般料金
-        try:
-            general_membership = MembershipType.objects.get(type_code='general')
-            price_per_student = general_membership.price_per_student
-        except MembershipType.DoesNotExist:
-            price_per_student = 500  # デフォルト料金
+    # 料金計算（教室の塾の会員種別から単価を取得、未登録なら一般料金）
+    price_per_student = resolve_price_per_student(getattr(classroom.school, 'membership_type', None))
 
     total_amount = billed_students * price_per_student
 
@@ -255,151 +239,201 @@ def get_billing_summary(year, period):
     }
 
 
-def generate_school_billing_report(school, year, period, force=False):
+# 課金レポートの上書き対象の列（generated_at は作成時のまま残す）
+SCHOOL_BILLING_UPDATE_FIELDS = [
+    'total_classrooms', 'total_students', 'billed_students', 'price_per_student',
+    'total_amount', 'updated_at',
+]
+
+
+def _aggregate_school_attendance(year, period, school_pks):
     """
-    指定された塾・年度・期間の課金レポートを生成
+    点数入力済みの受講記録を (塾, 教室, 生徒) 単位で1回の走査で集計する
+
+    Returns:
+        dict: {塾PK: {'line_items', 'total_classrooms', 'total_students', 'billed_students'}}
+            line_items は SchoolBillingLineItem（report 未設定）のリスト
+    """
+    records = AttendanceRecord.objects.filter(
+        classroom__school_id__in=school_pks,
+        classroom__is_active=True,
+        year=year,
+        period=period,
+        has_score_input=True,
+    ).order_by('classroom__school_id', 'classroom_id', 'id').values_list(
+        'classroom__school_id', 'classroom_id', 'classroom__classroom_id', 'classroom__name',
+        'student_id', 'student_name', 'subject', 'score_input_date',
+    )
+
+    aggregates = {}
+    classroom_students = {}
+    classroom_student_ids = set()
+    current_school_pk = None
+
+    def close_classroom():
+        if current_school_pk is None:
+            return
+        aggregate = aggregates[current_school_pk]
+        aggregate['total_classrooms'] += 1
+        aggregate['total_students'] += len(classroom_student_ids)
+        aggregate['billed_students'] += len(classroom_students)
+        aggregate['line_items'].extend(classroom_students.values())
+
+    last_classroom_pk = None
+    for (school_pk, classroom_pk, classroom_code, classroom_name,
+         student_id, student_name, subject, score_input_date) in records.iterator(chunk_size=2000):
+        if classroom_pk != last_classroom_pk:
+            close_classroom()
+            last_classroom_pk = classroom_pk
+            current_school_pk = school_pk
+            classroom_students = {}
+            classroom_student_ids = set()
+            aggregates.setdefault(school_pk, {
+                'total_classrooms': 0,
+                'total_students': 0,
+                'billed_students': 0,
+                'line_items': [],
+            })
+
+        student_key = (student_id, student_name)
+        line_item = classroom_students.get(student_key)
+        if line_item is None:
+            line_item = classroom_students[student_key] = SchoolBillingLineItem(
+                classroom_id=classroom_pk,
+                classroom_code=classroom_code,
+                classroom_name=classroom_name,
+                student_id=student_id,
+                student_name=student_name,
+                subjects=[],
+                score_input_dates=[],
+            )
+        classroom_student_ids.add(student_id)
+        line_item.subjects.append(subject)
+        if score_input_date:
+            line_item.score_input_dates.append(score_input_date.strftime('%Y-%m-%d'))
+    close_classroom()
+
+    return aggregates
+
+
+def generate_school_billing_reports(year, period, schools, force=False):
+    """
+    複数の塾の課金レポートをまとめて生成する
+
+    受講記録は対象の全塾分を1クエリで集計し、会員種別の単価は1回だけ読み込み、
+    SchoolBillingReport は一括 upsert、明細（SchoolBillingLineItem）は一括作成で保存する。
 
     Args:
-        school: Schoolインスタンス
         year: 年度（整数）
         period: 期間（'spring', 'summer', 'winter'）
+        schools: Schoolのクエリセットまたはリスト
         force: 既存レポートを上書きするか（bool）
 
     Returns:
-        dict: 生成結果（created, updated, reason, billed_students, total_amount）
+        dict: {塾PK: 生成結果（created, updated, reason, billed_students, total_amount）}
     """
+    from autograder.data_versions import mark_results_changed
+
+    schools = list(schools)
+    existing_reports = {
+        report['school_id']: report
+        for report in SchoolBillingReport.objects.filter(
+            school__in=schools, year=year, period=period
+        ).values('school_id', 'billed_students', 'total_amount')
+    }
 
-    # 既存レポートをチェック
-    existing_report = SchoolBillingReport.objects.filter(
-        school=school,
-        year=year,
-        period=period
-    ).first()
+    results = {}
+    targets = []
+    for school in schools:
+        existing = existing_reports.get(school.pk)
+        if existing and not force:
+            results[school.pk] = {
+                'created': False,
+                'updated': False,
+                'reason': '既存レポートあり',
+                'billed_students': existing['billed_students'],
+                'total_amount': existing['total_amount']
+            }
+        else:
+            targets.append(school)
 
-    if existing_report and not force:
-        return {
-            'created': False,
-            'updated': False,
-            'reason': '既存レポートあり',
-            'billed_students': existing_report.billed_students,
-            'total_amount': existing_report.total_amount
-        }
+    if not targets:
+        return results
 
-    # 塾の全教室を取得
-    classrooms = school.classrooms.filter(is_active=True)
+    aggregates = _aggregate_school_attendance(year, period, [school.pk for school in targets])
+    prices = get_membership_prices()
 
-    # 塾全体の集計データを初期化
-    total_classrooms = 0
-    total_students = 0
-    billed_students = 0
-    classroom_details = {}
-    all_student_details = {}
+    reports = []
+    for school in targets:
+        aggregate = aggregates.get(school.pk, {})
+        billed_students = aggregate.get('billed_students', 0)
+        price_per_student = resolve_price_per_student(getattr(school, 'membership_type', None), prices)
+        total_amount = billed_students * price_per_student
 
-    # 各教室の受講記録を取得して集計
-    for classroom in classrooms:
-        attendance_records = AttendanceRecord.objects.filter(
-            classroom=classroom,
+        reports.append(SchoolBillingReport(
+            school=school,
             year=year,
             period=period,
-            has_score_input=True
+            total_classrooms=aggregate.get('total_classrooms', 0),
+            total_students=aggregate.get('total_students', 0),
+            billed_students=billed_students,
+            price_per_student=price_per_student,
+            total_amount=total_amount,
+        ))
+
+        updated = school.pk in existing_reports
+        results[school.pk] = {
+            'created': not updated,
+            'updated': updated,
+            'reason': '既存レポートを更新' if updated else '新規レポート作成',
+            'billed_students': billed_students,
+            'total_amount': total_amount
+        }
+
+    with transaction.atomic():
+        SchoolBillingReport.objects.bulk_create(
+            reports,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=['school', 'year', 'period'],
+            update_fields=SCHOOL_BILLING_UPDATE_FIELDS,
         )
 
-        if attendance_records.exists():
-            total_classrooms += 1
-
-            # 教室ごとの生徒詳細を作成
-            classroom_student_details = {}
-            for record in attendance_records:
-                student_key = f"{record.student_id}_{record.student_name}"
-                if student_key not in classroom_student_details:
-                    classroom_student_details[student_key] = {
-                        'student_id': record.student_id,
-                        'student_name': record.student_name,
-                        'classroom_name': classroom.name,
-                        'subjects': [],
-                        'score_input_dates': []
-                    }
-
-                classroom_student_details[student_key]['subjects'].append(record.subject)
-                if record.score_input_date:
-                    classroom_student_details[student_key]['score_input_dates'].append(
-                        record.score_input_date.strftime('%Y-%m-%d')
-                    )
-
-            # 教室別詳細を保存
-            classroom_billed_students = len(classroom_student_details)
-            classroom_details[classroom.name] = {
-                'classroom_id': classroom.classroom_id,
-                'billed_students': classroom_billed_students,
-                'student_list': list(classroom_student_details.keys())
-            }
+        # 明細は塾ごとに作り直す（upsert では主キーが返らないため、レポートIDを引き直す）
+        report_pks = dict(
+            SchoolBillingReport.objects.filter(
+                school__in=targets, year=year, period=period
+            ).values_list('school_id', 'id')
+        )
+        SchoolBillingLineItem.objects.filter(report_id__in=report_pks.values()).delete()
+        line_items = []
+        for school in targets:
+            for line_item in aggregates.get(school.pk, {}).get('line_items', []):
+                line_item.report_id = report_pks[school.pk]
+                line_items.append(line_item)
+        SchoolBillingLineItem.objects.bulk_create(line_items, batch_size=2000)
 
-            # 全体の集計に加算
-            total_students += attendance_records.values('student_id').distinct().count()
-            billed_students += classroom_billed_students
-            all_student_details.update(classroom_student_details)
-
-    # 料金計算（塾の会員種別を使用）
-    if hasattr(school, 'membership_type'):
-        membership_type_code = school.membership_type
-        try:
-            membership_type = MembershipType.objects.get(type_code=membership_type_code)
-            price_per_student = membership_type.price_per_student
-        except MembershipType.DoesNotExist:
-            try:
-                general_membership = MembershipType.objects.get(type_code='general')
-                price_per_student = general_membership.price_per_student
-            except MembershipType.DoesNotExist:
-                price_per_student = 500
-    else:
-        try:
-            general_membership = MembershipType.objects.get(type_code='general')
-            price_per_student = general_membership.price_per_student
-        except MembershipType.DoesNotExist:
-            price_per_student = 500
+        # bulk_create は post_save を送らないため、データバージョンはここで進める
+        for school in targets:
+            mark_results_changed(year, period, school.pk)
 
-    total_amount = billed_students * price_per_student
+    return results
 
-    # レポートデータを準備
-    report_data = {
-        'school': school,
-        'year': year,
-        'period': period,
-        'total_classrooms': total_classrooms,
-        'total_students': total_students,
-        'billed_students': billed_students,
-        'price_per_student': price_per_student,
-        'total_amount': total_amount,
-        'classroom_details': classroom_details,
-        'student_details': all_student_details,
-    }
 
-    with transaction.atomic():
-        if existing_report:
-            # 既存レポートを更新
-            for key, value in report_data.items():
-                if key != 'school':
-                    setattr(existing_report, key, value)
-            existing_report.save()
+def generate_school_billing_report(school, year, period, force=False):
+    """
+    指定された塾・年度・期間の課金レポートを生成
 
-            return {
-                'created': False,
-                'updated': True,
-                'reason': '既存レポートを更新',
-                'billed_students': billed_students,
-                'total_amount': total_amount
-            }
-        else:
-            # 新規レポートを作成
-            SchoolBillingReport.objects.create(**report_data)
+    Args:
+        school: Schoolインスタンス
+        year: 年度（整数）
+        period: 期間（'spring', 'summer', 'winter'）
+        force: 既存レポートを上書きするか（bool）
 
-            return {
-                'created': True,
-                'updated': False,
-                'reason': '新規レポート作成',
-                'billed_students': billed_students,
-                'total_amount': total_amount
-            }
+    Returns:
+        dict: 生成結果（created, updated, reason, billed_students, total_amount）
+    """
+    return generate_school_billing_reports(year, period, [school], force=force)[school.pk]
 
 
 def get_school_billing_summary(year, period):
@@ -5,17 +5,42 @@ from rest_framework.permissions import IsAuthenticated
 from django.contrib.auth import get_user_model
 from django.db import transaction
 from django.utils import timezone
-from .models import Classroom, ClassroomPermission, AttendanceRecord, SchoolBillingReport
+from collections import defaultdict
+from django.db.models import Count, F
+from .models import Classroom, ClassroomPermission, AttendanceRecord, SchoolBillingReport, SchoolBillingLineItem
 from .serializers import ClassroomSerializer
 from .utils import (
     get_billing_student_count,
     get_classroom_attendance_summary,
-    generate_school_billing_report,
+    generate_school_billing_reports,
 )
+from .membership_prices import get_membership_prices, resolve_price_per_student
+from .billing_counters import get_billing_counter_summary, rebuild_billing_counters
 from schools.models import School
+from autograder.data_versions import conditional_on_data_version, results_etag_scopes
+from autograder.scoping import get_role_scope
+from autograder.response_cache import cached_by_data_version
+from autograder.pagination import CustomPageNumberPagination, is_pagination_requested
 
 User = get_user_model()
 
+# billing_details の ?ordering= で指定できる生徒明細の並び順
+BILLING_STUDENT_ORDERING = {
+    'classroom_name': 'classroom_name',
+    'student_name': 'student_name',
+    'student_id': 'student_id',
+}
+
+
+def _billing_summary_scope(request):
+    """課金サマリーのETagスコープ（強制再生成時は条件付き処理を行わない）"""
+    if request.GET.get('force') in {'1', 'true', 'True'}:
+        return None
+    year = request.GET.get('year', timezone.now().year)
+    period = request.GET.get('period', 'summer')
+    return results_etag_scopes(year, period, get_role_scope(request).school_pk), ()
+
+
 class ClassroomViewSet(viewsets.ModelViewSet):
     serializer_class = ClassroomSerializer
     permission_classes = [IsAuthenticated]
@@ -28,30 +53,41 @@ class ClassroomViewSet(viewsets.ModelViewSet):
             'winter': '冬期',
         }.get(period, period)
 
-    def get_queryset(self):
-        user = self.request.user
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.error(f"DEBUG Classroom queryset: user={user.username}, role={user.role}, school_id={getattr(user, 'school_id', None)}, classroom_id={getattr(user, 'classroom_id', None)}")
+    @staticmethod
+    def _ensure_school_billing_reports(schools, year, period, force_refresh, errors):
+        """
+        塾別課金レポートを {塾PK: SchoolBillingReport} で返す
+
+        未生成の塾（force_refresh 時は全塾）のレポートはまとめて生成する。
+        生成に失敗した場合は errors に追記し、既存のレポートだけを返す。
+        """
+        reports = {
+            report.school_id: report
+            for report in SchoolBillingReport.objects.filter(school__in=schools, year=year, period=period)
+        }
+        targets = schools if force_refresh else [school for school in schools if school.pk not in reports]
+        if not targets:
+            return reports
 
-        if user.role == 'school_admin':
-            queryset = Classroom.objects.filter(school__school_id=user.school_id)
-            logger.error(f"DEBUG School admin queryset count: {queryset.count()}")
-            return queryset
-        elif user.role == 'classroom_admin':
-            queryset = Classroom.objects.filter(classroom_id=user.classroom_id)
-            logger.error(f"DEBUG Classroom admin queryset count: {queryset.count()}")
-            return queryset
+        try:
+            generate_school_billing_reports(year, period, targets, force=True)
+        except Exception as exc:
+            errors.append({'error': str(exc)})
+            return reports
+
+        return {
+            report.school_id: report
+            for report in SchoolBillingReport.objects.filter(school__in=schools, year=year, period=period)
+        }
+
+    def get_queryset(self):
+        scope = get_role_scope(self.request)
+        if scope.is_school_admin:
+            return Classroom.objects.filter(school_id=scope.school_pk)
+        elif scope.is_classroom_admin:
+            return Classroom.objects.filter(pk=scope.classroom_pk)
         return Classroom.objects.all()
     
-    def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response({
-            'results': serializer.data,
-            'count': queryset.count()
-        })
-    
     def create(self, request, *args, **kwargs):
         """教室を作成する"""
         user = request.user
@@ -147,7 +183,7 @@ class ClassroomViewSet(viewsets.ModelViewSet):
         # 権限チェック
         if user.role == 'school_admin':
             # 自分の学校の教室のみ更新可能
-            if instance.school.school_id != user.school_id:
+            if instance.school_id != get_role_scope(request).school_pk:
                 return Response(
                     {'error': 'この教室の更新権限がありません'},
                     status=status.HTTP_403_FORBIDDEN
@@ -214,6 +250,8 @@ class ClassroomViewSet(viewsets.ModelViewSet):
         })
     
     @action(detail=False, methods=['get'])
+    @conditional_on_data_version(_billing_summary_scope)
+    @cached_by_data_version(_billing_summary_scope)
     def billing_summary(self, request):
         """塾単位の課金サマリーを取得"""
         year = request.query_params.get('year', timezone.now().year)
@@ -243,7 +281,7 @@ class ClassroomViewSet(viewsets.ModelViewSet):
                 'schools': [],
             })
 
-        schools = School.objects.filter(id__in=school_ids).order_by('school_id')
+        schools = list(School.objects.filter(id__in=school_ids).order_by('school_id'))
 
         summary_entries = []
         total_schools = 0
@@ -252,55 +290,48 @@ class ClassroomViewSet(viewsets.ModelViewSet):
         total_amount = 0
         errors = []
 
-        for school in schools:
-            report = SchoolBillingReport.objects.filter(
-                school=school,
-                year=year,
-                period=period,
-            ).first()
-
+        # 課金サマリーは点数入力時に更新されるカウンターを読む（force 指定時は受講記録から照合し直す）
+        if force_refresh:
             try:
-                if force_refresh or not report:
-                    generate_school_billing_report(
-                        school=school,
-                        year=year,
-                        period=period,
-                        force=True,
-                    )
-                    report = SchoolBillingReport.objects.filter(
-                        school=school,
-                        year=year,
-                        period=period,
-                    ).first()
+                rebuild_billing_counters(year, period, school_ids)
             except Exception as exc:
-                errors.append({
-                    'school_id': school.school_id,
-                    'school_name': school.name,
-                    'error': str(exc),
-                })
-                continue
+                errors.append({'error': str(exc)})
 
-            if not report:
-                continue
+        counters = get_billing_counter_summary(year, period, school_ids)
+        prices = get_membership_prices()
+
+        for school in schools:
+            counter = counters.get(school.pk, {})
+            school_classrooms = counter.get('total_classrooms', 0)
+            billed_students = counter.get('billed_students', 0)
+            price_per_student = resolve_price_per_student(school.membership_type, prices)
+            school_amount = billed_students * price_per_student
+            updated_at = counter.get('updated_at')
 
             total_schools += 1
-            total_classrooms += report.total_classrooms
-            total_billing_students += report.billed_students
-            total_amount += report.total_amount
+            total_classrooms += school_classrooms
+            total_billing_students += billed_students
+            total_amount += school_amount
 
             summary_entries.append({
                 'school_id': school.school_id,
                 'school_name': school.name,
                 'membership_type': school.get_membership_type_display(),
-                'price_per_student': report.price_per_student,
-                'total_classrooms': report.total_classrooms,
-                'total_students': report.total_students,
-                'billed_students': report.billed_students,
-                'total_amount': report.total_amount,
-                'average_per_classroom': report.get_average_per_classroom(),
-                'classroom_details': report.classroom_details,
-                'generated_at': report.generated_at.isoformat(),
-                'updated_at': report.updated_at.isoformat(),
+                'price_per_student': price_per_student,
+                'total_classrooms': school_classrooms,
+                'total_students': billed_students,
+                'billed_students': billed_students,
+                'total_amount': school_amount,
+                'average_per_classroom': school_amount / school_classrooms if school_classrooms > 0 else 0,
+                'classroom_details': {
+                    classroom['classroom_name']: {
+                        'classroom_id': classroom['classroom_id'],
+                        'billed_students': classroom['billed_students'],
+                    }
+                    for classroom in counter.get('classrooms', [])
+                },
+                'generated_at': updated_at.isoformat() if updated_at else None,
+                'updated_at': updated_at.isoformat() if updated_at else None,
             })
 
         response_payload = {
@@ -378,34 +409,44 @@ class ClassroomViewSet(viewsets.ModelViewSet):
         latest_generated_at = None
         latest_updated_at = None
 
-        for school in schools:
-            report = SchoolBillingReport.objects.filter(
-                school=school,
-                year=year,
-                period=period,
-            ).first()
+        reports = self._ensure_school_billing_reports(schools, year, period, force_refresh, errors)
+        report_pks = [report.pk for report in reports.values()]
+
+        # 教室別の内訳は明細から集計する
+        classroom_details = defaultdict(list)
+        for row in SchoolBillingLineItem.objects.filter(report_id__in=report_pks).values(
+            'report_id', 'classroom_code', 'classroom_name'
+        ).annotate(billed_students=Count('id')).order_by('report_id', 'classroom_name'):
+            classroom_details[row['report_id']].append({
+                'classroom_id': row['classroom_code'],
+                'classroom_name': row['classroom_name'],
+                'billed_students': row['billed_students'],
+            })
 
-            try:
-                if force_refresh or not report:
-                    generate_school_billing_report(
-                        school=school,
-                        year=year,
-                        period=period,
-                        force=True,
-                    )
-                    report = SchoolBillingReport.objects.filter(
-                        school=school,
-                        year=year,
-                        period=period,
-                    ).first()
-            except Exception as exc:
-                errors.append({
-                    'school_id': school.school_id,
-                    'school_name': school.name,
-                    'error': str(exc),
-                })
-                continue
+        # 生徒明細は SQL で並べ替え、?page= / ?page_size= 指定時のみページ単位で取得する（?ordering=）
+        ordering = request.query_params.get('ordering') or 'classroom_name'
+        order_field = BILLING_STUDENT_ORDERING.get(ordering.lstrip('-'), 'classroom_name')
+        order_prefix = '-' if ordering.startswith('-') else ''
+        line_items = SchoolBillingLineItem.objects.filter(report_id__in=report_pks).annotate(
+            billing_amount=F('report__price_per_student'),
+        ).order_by(
+            'report__school__school_id', f'{order_prefix}{order_field}', 'student_name', 'id'
+        ).values(
+            'report_id', 'student_id', 'student_name', 'classroom_name', 'subjects', 'score_input_dates', 'billing_amount'
+        )
+        if is_pagination_requested(request):
+            paginator = CustomPageNumberPagination()
+            page = paginator.paginate_queryset(line_items, request, view=self)
+        else:
+            # ページ指定なしのクライアント（従来の請求詳細画面）には全件を返す
+            paginator = None
+            page = line_items
+        students_by_report = defaultdict(list)
+        for line_item in page:
+            students_by_report[line_item.pop('report_id')].append(line_item)
 
+        for school in schools:
+            report = reports.get(school.pk)
             if not report:
                 continue
 
@@ -418,20 +459,6 @@ class ClassroomViewSet(viewsets.ModelViewSet):
             if latest_updated_at is None or report.updated_at > latest_updated_at:
                 latest_updated_at = report.updated_at
 
-            classroom_details = []
-            for classroom_name, detail in (report.classroom_details or {}).items():
-                detail_copy = dict(detail)
-                detail_copy['classroom_name'] = classroom_name
-                classroom_details.append(detail_copy)
-            classroom_details.sort(key=lambda item: item.get('classroom_name', ''))
-
-            students = []
-            for student in (report.student_details or {}).values():
-                student_copy = dict(student)
-                student_copy['billing_amount'] = report.price_per_student
-                students.append(student_copy)
-            students.sort(key=lambda item: (item.get('classroom_name', ''), item.get('student_name', '')))
-
             detailed_entries.append({
                 'school_id': school.school_id,
                 'school_name': school.name,
@@ -441,8 +468,8 @@ class ClassroomViewSet(viewsets.ModelViewSet):
                 'total_students': report.total_students,
                 'billed_students': report.billed_students,
                 'total_amount': report.total_amount,
-                'classroom_details': classroom_details,
-                'students': students,
+                'classroom_details': classroom_details[report.pk],
+                'students': students_by_report[report.pk],
                 'generated_at': report.generated_at.isoformat(),
                 'updated_at': report.updated_at.isoformat(),
             })
@@ -459,6 +486,14 @@ class ClassroomViewSet(viewsets.ModelViewSet):
             },
             'schools': detailed_entries,
         }
+        if paginator is not None:
+            response_payload['students_pagination'] = {
+                'count': paginator.page.paginator.count,
+                'page': paginator.page.number,
+                'total_pages': paginator.page.paginator.num_pages,
+                'next': paginator.get_next_link(),
+                'previous': paginator.get_previous_link(),
+            }
 
         if latest_generated_at:
             response_payload['generated_at'] = latest_generated_at.isoformat()
@@ -534,39 +569,34 @@ class ClassroomViewSet(viewsets.ModelViewSet):
         results = []
         errors = []
 
+        try:
+            generated = generate_school_billing_reports(year, period, schools, force=force_refresh)
+        except Exception as exc:
+            generated = {}
+            errors.append({'error': str(exc)})
+        reports = {
+            report.school_id: report
+            for report in SchoolBillingReport.objects.filter(school__in=schools, year=year, period=period)
+        }
+
         for school in schools:
-            try:
-                result = generate_school_billing_report(
-                    school=school,
-                    year=year,
-                    period=period,
-                    force=force_refresh,
-                )
-                report = SchoolBillingReport.objects.filter(
-                    school=school,
-                    year=year,
-                    period=period,
-                ).first()
-
-                results.append({
-                    'school_id': school.school_id,
-                    'school_name': school.name,
-                    'created': result.get('created', False),
-                    'updated': result.get('updated', False),
-                    'reason': result.get('reason'),
-                    'billed_students': result.get('billed_students', report.billed_students if report else 0),
-                    'total_amount': result.get('total_amount', report.total_amount if report else 0),
-                    'price_per_student': report.price_per_student if report else school.get_price_per_student(),
-                    'total_classrooms': report.total_classrooms if report else 0,
-                    'generated_at': report.generated_at.isoformat() if report else None,
-                    'updated_at': report.updated_at.isoformat() if report else None,
-                })
-            except Exception as exc:
-                errors.append({
-                    'school_id': school.school_id,
-                    'school_name': school.name,
-                    'error': str(exc),
-                })
+            result = generated.get(school.pk)
+            if result is None:
+                continue
+            report = reports.get(school.pk)
+            results.append({
+                'school_id': school.school_id,
+                'school_name': school.name,
+                'created': result.get('created', False),
+                'updated': result.get('updated', False),
+                'reason': result.get('reason'),
+                'billed_students': result.get('billed_students', report.billed_students if report else 0),
+                'total_amount': result.get('total_amount', report.total_amount if report else 0),
+                'price_per_student': report.price_per_student if report else school.get_price_per_student(),
+                'total_classrooms': report.total_classrooms if report else 0,
+                'generated_at': report.generated_at.isoformat() if report else None,
+                'updated_at': report.updated_at.isoformat() if report else None,
+            })
 
         response_payload = {
             'message': '塾別課金レポートを生成しました',
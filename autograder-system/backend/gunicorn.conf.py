@@ -51,3 +51,9 @@ if os.environ.get('DEBUG', 'False').lower() == 'true':
     reload = True
     loglevel = "debug"
     daemon = False
+
+
+def post_worker_init(worker):
+    """ワーカー起動時に参照データ（日程・テスト一覧）をメモリに読み込む"""
+    from tests.reference_data import warm_reference_data
+    warm_reference_data()
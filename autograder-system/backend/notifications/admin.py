@@ -4,14 +4,14 @@ from .models import Notification, UserNotification
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
-    list_display = ['title', 'notification_type', 'year', 'period', 'created_at', 'is_read']
-    list_filter = ['notification_type', 'year', 'period', 'is_read', 'created_at']
+    list_display = ['title', 'notification_type', 'year', 'period', 'created_at', 'is_broadcast', 'is_read']
+    list_filter = ['notification_type', 'year', 'period', 'is_broadcast', 'is_read', 'created_at']
     search_fields = ['title', 'message']
     readonly_fields = ['created_at']
     
     fieldsets = (
         (None, {
-            'fields': ('title', 'message', 'notification_type', 'is_read')
+            'fields': ('title', 'message', 'notification_type', 'is_broadcast', 'is_read')
         }),
         ('関連情報', {
             'fields': ('test_id', 'year', 'period'),
@@ -26,8 +26,8 @@ class NotificationAdmin(admin.ModelAdmin):
 
 @admin.register(UserNotification)
 class UserNotificationAdmin(admin.ModelAdmin):
-    list_display = ['user', 'notification', 'is_read', 'read_at', 'created_at']
-    list_filter = ['is_read', 'created_at', 'notification__notification_type']
+    list_display = ['user', 'notification', 'is_read', 'read_at', 'is_dismissed', 'created_at']
+    list_filter = ['is_read', 'is_dismissed', 'created_at', 'notification__notification_type']
     search_fields = ['user__username', 'notification__title']
     readonly_fields = ['created_at', 'read_at']
     
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:10
+
+from django.db import migrations, models
+
+
+BROADCAST_TYPES = ["test_created", "test_updated"]
+
+
+def convert_test_notifications_to_broadcast(apps, schema_editor):
+    """全ユーザーに配信していたテスト通知を全員宛てにし、未読の行を削除する"""
+    Notification = apps.get_model("notifications", "Notification")
+    UserNotification = apps.get_model("notifications", "UserNotification")
+
+    Notification.objects.filter(notification_type__in=BROADCAST_TYPES).update(is_broadcast=True)
+    UserNotification.objects.filter(
+        notification__notification_type__in=BROADCAST_TYPES, is_read=False
+    ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notifications", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="notification",
+            name="is_broadcast",
+            field=models.BooleanField(default=False, verbose_name="全員宛て"),
+        ),
+        migrations.AddField(
+            model_name="usernotification",
+            name="is_dismissed",
+            field=models.BooleanField(default=False, verbose_name="非表示"),
+        ),
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(
+                fields=["is_broadcast", "created_at"],
+                name="notificatio_is_broa_202853_idx",
+            ),
+        ),
+        migrations.RunPython(convert_test_notifications_to_broadcast, migrations.RunPython.noop),
+    ]
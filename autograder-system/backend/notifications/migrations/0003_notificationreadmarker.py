@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("notifications", "0002_notification_is_broadcast_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="NotificationReadMarker",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "read_all_at",
+                    models.DateTimeField(verbose_name="すべて既読にした日時"),
+                ),
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="notification_read_marker",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="ユーザー",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "通知既読位置",
+                "verbose_name_plural": "通知既読位置",
+                "db_table": "notification_read_markers",
+            },
+        ),
+    ]
@@ -22,6 +22,8 @@ class Notification(models.Model):
         verbose_name='通知種別'
     )
     is_read = models.BooleanField(default=False, verbose_name='既読')
+    # 全員宛ての通知は1行だけ保存し、ユーザー別の行は既読・非表示にした時だけ作る
+    is_broadcast = models.BooleanField(default=False, verbose_name='全員宛て')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='作成日時')
     
     # 関連情報（オプション）
@@ -38,6 +40,7 @@ class Notification(models.Model):
             models.Index(fields=['created_at']),
             models.Index(fields=['notification_type']),
             models.Index(fields=['is_read']),
+            models.Index(fields=['is_broadcast', 'created_at']),
         ]
 
     def __str__(self):
@@ -45,11 +48,17 @@ class Notification(models.Model):
 
 
 class UserNotification(models.Model):
-    """ユーザー別通知モデル"""
+    """
+    ユーザー別通知モデル
+
+    個別宛ての通知では宛先ごとの行、全員宛ての通知では既読・非表示の状態を持つ行。
+    全員宛ての通知に行がなければ未読として扱う。
+    """
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='ユーザー')
     notification = models.ForeignKey(Notification, on_delete=models.CASCADE, verbose_name='通知')
     is_read = models.BooleanField(default=False, verbose_name='既読')
     read_at = models.DateTimeField(null=True, blank=True, verbose_name='既読日時')
+    is_dismissed = models.BooleanField(default=False, verbose_name='非表示')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='作成日時')
 
     class Meta:
@@ -70,4 +79,20 @@ class UserNotification(models.Model):
         self.save(update_fields=['is_read', 'read_at'])
 
     def __str__(self):
-        return f"{self.user.username} - {self.notification.title}"
\ No newline at end of file
+        return f"{self.user.username} - {self.notification.title}"
+
+
+class NotificationReadMarker(models.Model):
+    """ユーザー別の「すべて既読」位置（この日時以前の通知は既読として扱う）"""
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, related_name='notification_read_marker', verbose_name='ユーザー'
+    )
+    read_all_at = models.DateTimeField(verbose_name='すべて既読にした日時')
+
+    class Meta:
+        db_table = 'notification_read_markers'
+        verbose_name = '通知既読位置'
+        verbose_name_plural = '通知既読位置'
+
+    def __str__(self):
+        return f"{self.user.username} - {self.read_all_at}"
@@ -27,19 +27,15 @@ class UserNotificationSerializer(serializers.ModelSerializer):
 
 
 class UserNotificationListSerializer(serializers.ModelSerializer):
-    """ユーザー向け通知リスト用のシンプルなシリアライザー"""
-    title = serializers.CharField(source='notification.title')
-    message = serializers.CharField(source='notification.message')
-    notification_type = serializers.CharField(source='notification.notification_type')
-    notification_type_display = serializers.CharField(source='notification.get_notification_type_display')
-    test_id = serializers.IntegerField(source='notification.test_id')
-    year = serializers.IntegerField(source='notification.year')
-    period = serializers.CharField(source='notification.period')
+    """ユーザー向け通知リスト用のシンプルなシリアライザー（既読状態はユーザー別に付与）"""
+    notification_type_display = serializers.CharField(source='get_notification_type_display', read_only=True)
+    is_read = serializers.BooleanField(source='user_is_read', read_only=True)
+    read_at = serializers.DateTimeField(source='user_read_at', read_only=True, allow_null=True)
 
     class Meta:
-        model = UserNotification
+        model = Notification
         fields = [
             'id', 'title', 'message', 'notification_type', 'notification_type_display',
             'is_read', 'read_at', 'created_at', 'test_id', 'year', 'period'
         ]
-        read_only_fields = ['id', 'created_at']
\ No newline at end of file
+        read_only_fields = fields
@@ -1,9 +1,16 @@
 """
 通知作成サービス
 """
-from typing import List, Optional
+from typing import List
 from django.contrib.auth import get_user_model
-from .models import Notification, UserNotification
+from django.db import transaction
+from django.db.models import (
+    BooleanField, Case, DateTimeField, Exists, ExpressionWrapper, OuterRef, Q, Subquery, Value, When,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from . import unread_counter
+from .models import Notification, NotificationReadMarker, UserNotification
 
 User = get_user_model()
 
@@ -40,52 +47,21 @@ def create_test_notification(
         title = f"{schedule.year if schedule else '----'}年度{period_display}のテストが更新されました"
         message = f"{grade_display} {subject_display}のテスト情報が更新されました。"
     
-    # 通知を作成
+    # 通知を作成（全ユーザー宛て: 管理者・学校・教師全て。ユーザー別の行は作らない）
     notification = Notification.objects.create(
         title=title,
         message=message,
         notification_type=notification_type,
         test_id=test_definition.id,
         year=schedule.year if schedule else None,
-        period=schedule.period if schedule else None
+        period=schedule.period if schedule else None,
+        is_broadcast=True,
     )
-    
-    # 全ユーザーに通知を送信（管理者・学校・教師全て）
-    create_user_notifications_for_all(notification)
+    # 最新の全員宛て通知IDは Notification の post_save（signals.py）で確定後に進める
     
     return notification
 
 
-def create_user_notifications_for_all(notification: Notification) -> int:
-    """
-    全ユーザーに通知を送信する
-    
-    Args:
-        notification: 送信する通知オブジェクト
-    
-    Returns:
-        int: 作成されたユーザー通知の数
-    """
-    # アクティブな全ユーザーを取得
-    users = User.objects.filter(is_active=True)
-    
-    # 各ユーザーに通知を作成
-    user_notifications = []
-    for user in users:
-        user_notifications.append(
-            UserNotification(
-                user=user,
-                notification=notification,
-                is_read=False
-            )
-        )
-    
-    # バルク作成でパフォーマンスを向上
-    UserNotification.objects.bulk_create(user_notifications, ignore_conflicts=True)
-    
-    return len(user_notifications)
-
-
 def create_user_notifications_for_users(
     notification: Notification,
     user_ids: List[int]
@@ -100,26 +76,93 @@ def create_user_notifications_for_users(
     Returns:
         int: 作成されたユーザー通知の数
     """
-    users = User.objects.filter(id__in=user_ids, is_active=True)
+    active_user_ids = User.objects.filter(id__in=user_ids, is_active=True).values_list('id', flat=True)
     
-    user_notifications = []
-    for user in users:
-        user_notifications.append(
-            UserNotification(
-                user=user,
-                notification=notification,
-                is_read=False
-            )
+    user_notifications = [
+        UserNotification(
+            user_id=user_id,
+            notification=notification,
+            is_read=False
         )
+        for user_id in active_user_ids
+    ]
     
     UserNotification.objects.bulk_create(user_notifications, ignore_conflicts=True)
+    transaction.on_commit(
+        lambda: unread_counter.invalidate_cached_counts([un.user_id for un in user_notifications])
+    )
     
     return len(user_notifications)
 
 
+def _get_read_all_at(user: User):
+    """「すべて既読」にした日時（未設定なら None）"""
+    return NotificationReadMarker.objects.filter(user=user).values_list('read_all_at', flat=True).first()
+
+
+def get_user_notifications(user: User):
+    """
+    ユーザーに表示する通知を取得する（既読状態・既読日時を付与）
+
+    全員宛ての通知（登録日時以降に作成されたもの）と、ユーザー宛ての行がある通知のうち、
+    非表示にしていないものを返す。「すべて既読」にした日時以前の通知は既読として扱う。
+
+    Args:
+        user: 対象ユーザー
+
+    Returns:
+        QuerySet: Notification のクエリセット（user_is_read, user_read_at を付与）
+    """
+    states = UserNotification.objects.filter(user=user, notification=OuterRef('pk'))
+    read_all_at = _get_read_all_at(user)
+
+    is_read = Q(Exists(states.filter(is_read=True)))
+    read_at = Subquery(states.filter(is_read=True).values('read_at')[:1])
+    if read_all_at is not None:
+        is_read |= Q(created_at__lte=read_all_at)
+        read_at = Coalesce(
+            read_at,
+            Case(When(created_at__lte=read_all_at, then=Value(read_all_at)), output_field=DateTimeField()),
+        )
+
+    return Notification.objects.filter(
+        Q(is_broadcast=True, created_at__gte=user.date_joined) | Exists(states)
+    ).exclude(
+        Exists(states.filter(is_dismissed=True))
+    ).annotate(
+        user_is_read=ExpressionWrapper(is_read, output_field=BooleanField()),
+        user_read_at=read_at,
+    ).order_by('-created_at')
+
+
+def get_unread_notifications(user: User):
+    """
+    ユーザーの未読通知を取得する
+
+    Args:
+        user: 対象ユーザー
+
+    Returns:
+        QuerySet: 未読の Notification のクエリセット
+    """
+    states = UserNotification.objects.filter(user=user, notification=OuterRef('pk'))
+    notifications = Notification.objects.filter(
+        Q(is_broadcast=True, created_at__gte=user.date_joined) | Exists(states)
+    ).exclude(
+        Exists(states.filter(Q(is_read=True) | Q(is_dismissed=True)))
+    )
+    read_all_at = _get_read_all_at(user)
+    if read_all_at is not None:
+        notifications = notifications.filter(created_at__gt=read_all_at)
+    return notifications
+
+
 def get_unread_count(user: User) -> int:
     """
     ユーザーの未読通知数を取得する
+
+    キャッシュの未読数を返し、その後に作成された全員宛て通知の分だけ主キーの範囲で
+    追いつき集計する。キャッシュがなければ DB から集計する。
     
     Args:
         user: 対象ユーザー
@@ -127,10 +170,37 @@ def get_unread_count(user: User) -> int:
     Returns:
         int: 未読通知数
     """
-    return UserNotification.objects.filter(
+    latest = unread_counter.get_latest_broadcast_id()
+    entry = unread_counter.get_cached_count(user.pk)
+    if entry is None:
+        # 集計済みの範囲を latest までに揃える（latest 取得後に確定した通知は次の追いつき集計で数える）
+        count = get_unread_notifications(user).exclude(is_broadcast=True, pk__gt=latest).count()
+    elif entry['through'] < latest:
+        count = entry['count'] + get_unread_notifications(user).filter(
+            is_broadcast=True, pk__gt=entry['through'], pk__lte=latest
+        ).count()
+    else:
+        return entry['count']
+    unread_counter.set_cached_count(user.pk, count, latest)
+    return count
+
+
+def _update_user_state(user: User, notification_id: int, **state) -> bool:
+    """表示対象の通知について、ユーザー別の状態行を作成または更新する"""
+    if not get_user_notifications(user).filter(pk=notification_id).exists():
+        return False
+    # 未読だった場合のみ未読数を減らす（None なら既読済み）
+    unread_is_broadcast = get_unread_notifications(user).filter(pk=notification_id).values_list(
+        'is_broadcast', flat=True
+    ).first()
+    UserNotification.objects.update_or_create(
         user=user,
-        is_read=False
-    ).count()
+        notification_id=notification_id,
+        defaults=state,
+    )
+    if unread_is_broadcast is not None:
+        unread_counter.adjust_cached_count(user.pk, -1, notification_id, unread_is_broadcast)
+    return True
 
 
 def mark_notification_as_read(user: User, notification_id: int) -> bool:
@@ -144,12 +214,40 @@ def mark_notification_as_read(user: User, notification_id: int) -> bool:
     Returns:
         bool: 成功したかどうか
     """
-    try:
-        user_notification = UserNotification.objects.get(
-            user=user,
-            notification_id=notification_id
-        )
-        user_notification.mark_as_read()
-        return True
-    except UserNotification.DoesNotExist:
-        return False
\ No newline at end of file
+    return _update_user_state(user, notification_id, is_read=True, read_at=timezone.now())
+
+
+def dismiss_notification(user: User, notification_id: int) -> bool:
+    """
+    特定の通知を非表示にする
+
+    Args:
+        user: 対象ユーザー
+        notification_id: 通知ID
+
+    Returns:
+        bool: 成功したかどうか
+    """
+    return _update_user_state(user, notification_id, is_dismissed=True)
+
+
+def mark_all_notifications_as_read(user: User) -> int:
+    """
+    ユーザーの未読通知をすべて既読にする
+
+    通知ごとの行は作らず、ユーザーの「すべて既読」日時を1回の UPDATE で進める。
+
+    Args:
+        user: 対象ユーザー
+
+    Returns:
+        int: 既読にした通知の数
+    """
+    count = get_unread_count(user)
+    # 既読日時より前に最新IDを取る（逆だと間に作成された通知を集計済み扱いにしてしまう）
+    through = unread_counter.get_latest_broadcast_id()
+    now = timezone.now()
+    if not NotificationReadMarker.objects.filter(user=user).update(read_all_at=now):
+        NotificationReadMarker.objects.update_or_create(user=user, defaults={'read_all_at': now})
+    unread_counter.reset_cached_count(user.pk, through)
+    return count
@@ -1,9 +1,12 @@
 """
 通知システム用のDjangoシグナル
 """
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from tests.models import TestDefinition
+from . import unread_counter
+from .models import Notification
 from .services import create_test_notification
 
 
@@ -38,4 +41,25 @@ def create_test_notification_on_save(sender, instance, created, **kwargs):
         # エラーが発生してもテスト作成は継続させる
         print(f"❌ Error creating notification for test {instance.id}: {str(e)}")
         import traceback
-        traceback.print_exc()
\ No newline at end of file
+        traceback.print_exc()
+
+
+@receiver(post_save, sender=Notification)
+def update_unread_counts_on_save(sender, instance, created, **kwargs):
+    """
+    通知の保存後に未読数のキャッシュを更新する
+
+    全員宛て通知の作成時は確定後に最新IDを進める（管理画面・API から作成した場合も含む）。
+    既存の通知の変更では宛先が変わりうるため、全ユーザー分を無効にする。
+    """
+    if created:
+        if instance.is_broadcast:
+            transaction.on_commit(lambda: unread_counter.set_latest_broadcast_id(instance.pk))
+    else:
+        transaction.on_commit(unread_counter.invalidate_all_cached_counts)
+
+
+@receiver(post_delete, sender=Notification)
+def invalidate_unread_counts_on_delete(sender, instance, **kwargs):
+    """通知の削除後、キャッシュ済みの未読数を全ユーザー分無効にする"""
+    transaction.on_commit(unread_counter.invalidate_all_cached_counts)
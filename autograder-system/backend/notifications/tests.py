@@ -0,0 +1,38 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+
+from . import unread_counter
+from .models import Notification
+from .services import get_unread_count
+
+
+class UnreadCountCacheTests(TestCase):
+    """未読数キャッシュと全員宛て通知の最新ID"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='teacher', password='x')
+
+    def create_broadcast(self):
+        return Notification.objects.create(title='お知らせ', message='本文', is_broadcast=True)
+
+    def test_broadcast_created_outside_services_advances_latest_id(self):
+        self.assertEqual(get_unread_count(self.user), 0)
+        # 管理画面・API からの作成と同じく、サービス関数を通さずに作成する
+        with self.captureOnCommitCallbacks(execute=True):
+            notification = self.create_broadcast()
+
+        self.assertEqual(unread_counter.get_latest_broadcast_id(), notification.pk)
+        self.assertEqual(get_unread_count(self.user), 1)
+
+    def test_broadcast_committed_after_latest_id_is_counted_once(self):
+        self.assertEqual(unread_counter.get_latest_broadcast_id(), 0)
+        # 確定済みだが最新IDはまだ進んでいない（on_commit 実行前）状態でキャッシュなしから集計する
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.create_broadcast()
+        self.assertEqual(get_unread_count(self.user), 0)
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(get_unread_count(self.user), 1)
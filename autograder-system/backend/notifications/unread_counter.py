@@ -0,0 +1,107 @@
+"""
+未読通知数のキャッシュ
+
+ユーザーごとの未読数を {'count': 未読数, 'through': 集計済みの最新の全員宛て通知ID} として
+キャッシュに持つ。ポーリング時はキャッシュを読むだけで済み、DB の集計は初回や
+キャッシュ消失時（フォールバック）だけ行う。
+
+- 全員宛ての通知の作成時は最新IDを更新するだけで、各ユーザーの未読数は次の読み出し時に
+  「through より新しい全員宛て通知」の件数（主キーの範囲検索）で追いつく
+- 既読・非表示にした時は未読数を減らし、すべて既読にした時は 0 にする
+- 個別宛ての通知の作成時は宛先ユーザーのキャッシュを消す
+- 通知の削除時は世代を進め、全ユーザーのキャッシュをまとめて無効にする
+  （削除された通知を数えたままの未読数を返さないため）
+"""
+from __future__ import annotations
+
+import time
+
+from django.core.cache import cache
+
+# 未読数キャッシュの有効期限（期限切れ後は DB から集計し直す）
+UNREAD_COUNT_TIMEOUT = 60 * 60 * 24
+
+LATEST_BROADCAST_KEY = 'notifications:latest_broadcast_id'
+GENERATION_KEY = 'notifications:unread_generation'
+
+
+def _seed() -> int:
+    # キャッシュから消えた場合も過去の世代と重ならないよう、時刻を初期値にする
+    return time.time_ns() // 1000
+
+
+def _generation() -> int:
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, _seed(), timeout=None)
+        generation = cache.get(GENERATION_KEY, 0)
+    return generation
+
+
+def _count_key(user_id) -> str:
+    return f'notifications:unread:{_generation()}:{user_id}'
+
+
+def get_latest_broadcast_id() -> int:
+    """最新の全員宛て通知ID（キャッシュになければ DB から取得）"""
+    latest = cache.get(LATEST_BROADCAST_KEY)
+    if latest is None:
+        from .models import Notification
+
+        latest = Notification.objects.filter(is_broadcast=True).order_by('-pk').values_list(
+            'pk', flat=True
+        ).first() or 0
+        cache.set(LATEST_BROADCAST_KEY, latest, timeout=None)
+    return latest
+
+
+def set_latest_broadcast_id(notification_id: int) -> None:
+    """全員宛て通知の作成時に最新IDを進める"""
+    if notification_id > get_latest_broadcast_id():
+        cache.set(LATEST_BROADCAST_KEY, notification_id, timeout=None)
+
+
+def get_cached_count(user_id):
+    """キャッシュ済みの未読数（なければ None）"""
+    return cache.get(_count_key(user_id))
+
+
+def set_cached_count(user_id, count: int, through: int) -> None:
+    cache.set(_count_key(user_id), {'count': max(count, 0), 'through': through}, timeout=UNREAD_COUNT_TIMEOUT)
+
+
+def adjust_cached_count(user_id, delta: int, notification_id: int, is_broadcast: bool) -> None:
+    """
+    未読数を増減する
+
+    全員宛ての通知は集計済み（notification_id <= through）のものだけを増減する。まだ集計して
+    いない通知は次の読み出し時の追いつき集計に含まれるため、ここでは何もしない。
+    """
+    entry = get_cached_count(user_id)
+    if entry is None or (is_broadcast and notification_id > entry['through']):
+        return
+    set_cached_count(user_id, entry['count'] + delta, entry['through'])
+
+
+def reset_cached_count(user_id, through: int) -> None:
+    """
+    すべて既読にした時に未読数を 0 にする
+
+    through は「すべて既読」日時を記録する前に取得した最新の全員宛て通知ID。その後に
+    作成された通知は次の読み出し時の追いつき集計に含まれる。
+    """
+    set_cached_count(user_id, 0, through)
+
+
+def invalidate_cached_counts(user_ids) -> None:
+    """次の読み出しで DB から集計し直す"""
+    cache.delete_many([_count_key(user_id) for user_id in user_ids])
+
+
+def invalidate_all_cached_counts() -> None:
+    """通知の削除時に全ユーザーの未読数を無効にする（世代を進めるだけで既存キーは自然に失効）"""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, _seed(), timeout=None)
+    cache.delete(LATEST_BROADCAST_KEY)
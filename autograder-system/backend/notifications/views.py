@@ -1,13 +1,19 @@
-from rest_framework import viewsets, status, permissions
+from rest_framework import mixins, viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.contrib.auth import get_user_model
-from .models import Notification, UserNotification
+from .models import Notification
 from .serializers import (
     NotificationSerializer, 
-    UserNotificationSerializer, 
     UserNotificationListSerializer
 )
+from .services import (
+    dismiss_notification,
+    get_unread_count,
+    get_user_notifications,
+    mark_all_notifications_as_read,
+    mark_notification_as_read,
+)
 
 User = get_user_model()
 
@@ -28,23 +34,29 @@ class NotificationViewSet(viewsets.ModelViewSet):
         return [permission() for permission in permission_classes]
 
 
-class UserNotificationViewSet(viewsets.ModelViewSet):
-    """ユーザー通知管理用ViewSet"""
+class UserNotificationViewSet(mixins.DestroyModelMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    ユーザー通知管理用ViewSet
+
+    id は通知ID。全員宛ての通知はユーザー別の行を持たないため、既読・非表示は
+    操作した時に状態行を作って記録する（削除は非表示として扱う）。
+    """
     serializer_class = UserNotificationListSerializer
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
         """ログインユーザーの通知のみを取得"""
-        return UserNotification.objects.filter(
-            user=self.request.user
-        ).select_related('notification').order_by('-created_at')
+        return get_user_notifications(self.request.user)
+    
+    def perform_destroy(self, instance):
+        dismiss_notification(self.request.user, instance.id)
     
     @action(detail=True, methods=['post'])
     def mark_as_read(self, request, pk=None):
         """通知を既読にする"""
         try:
-            user_notification = self.get_object()
-            user_notification.mark_as_read()
+            notification = self.get_object()
+            mark_notification_as_read(request.user, notification.id)
             
             return Response({
                 'success': True,
@@ -60,12 +72,7 @@ class UserNotificationViewSet(viewsets.ModelViewSet):
     def mark_all_as_read(self, request):
         """すべての未読通知を既読にする"""
         try:
-            unread_notifications = self.get_queryset().filter(is_read=False)
-            count = 0
-            
-            for notification in unread_notifications:
-                notification.mark_as_read()
-                count += 1
+            count = mark_all_notifications_as_read(request.user)
             
             return Response({
                 'success': True,
@@ -82,7 +89,7 @@ class UserNotificationViewSet(viewsets.ModelViewSet):
     def unread_count(self, request):
         """未読通知数を取得"""
         try:
-            count = self.get_queryset().filter(is_read=False).count()
+            count = get_unread_count(request.user)
             
             return Response({
                 'success': True,
@@ -92,4 +99,4 @@ class UserNotificationViewSet(viewsets.ModelViewSet):
             return Response({
                 'success': False,
                 'error': str(e)
-            }, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+            }, status=status.HTTP_400_BAD_REQUEST)
@@ -23,6 +23,7 @@ from scores.models import Score, TestResult
 from students.models import Student
 from tests.models import TestDefinition
 from classrooms.models import Classroom
+from classrooms.membership_prices import get_membership_prices, resolve_price_per_student
 
 
 class TestReportGenerator:
@@ -95,6 +96,9 @@ class TestReportGenerator:
             if score['question_group__group_number']:
                 score_cache[key][f'大問{score["question_group__group_number"]}'] = score['score']
         
+        # 料金は会員種別の料金設定から1回だけ取得
+        prices = get_membership_prices()
+        
         # データをDataFrameに変換
         data = []
         for result in test_results:
@@ -108,7 +112,7 @@ class TestReportGenerator:
                 '教室ID': result.student.classroom.classroom_id,
                 '教室名': result.student.classroom.name,
                 '会員種別': result.student.classroom.get_membership_type_display(),
-                '料金': f"{result.student.classroom.get_price_per_student()}円",
+                '料金': f"{resolve_price_per_student(result.student.classroom.school.membership_type, prices)}円",
                 '生徒ID': result.student.student_id,
                 '生徒名': result.student.name,
                 '学年': result.student.grade,
@@ -240,12 +244,8 @@ class TestReportGenerator:
             count=Count('id')
         )
         
-        # 価格マッピング（Schoolモデルの価格設定）
-        price_mapping = {
-            'culture_kids': 100,
-            'eduplus': 300,
-            'general': 500,
-        }
+        # 会員種別の料金設定
+        prices = get_membership_prices()
         
         # 会員種別表示名マッピング
         membership_display_mapping = {
@@ -278,7 +278,7 @@ class TestReportGenerator:
             membership_display = []
             
             for membership_type, count in membership_breakdown.items():
-                price_per_student = price_mapping.get(membership_type, 500)
+                price_per_student = resolve_price_per_student(membership_type, prices)
                 total_fee += count * price_per_student
                 
                 display_name = membership_display_mapping.get(membership_type, membership_type)
@@ -6,11 +6,19 @@ from datetime import datetime
 import logging
 
 from tests.models import TestSchedule, TestDefinition
+from autograder.data_versions import conditional_on_data_version, results_etag_scopes
 from .utils import TestReportGenerator, create_excel_response, create_pdf_response
 
 logger = logging.getLogger(__name__)
 
 
+def _preview_report_data_scope(request):
+    year, period = request.GET.get('year'), request.GET.get('period')
+    if not year or not period:
+        return None
+    return results_etag_scopes(year, period), ()
+
+
 @login_required
 def test_report_generator_view(request):
     """テスト結果帳票生成画面"""
@@ -110,6 +118,7 @@ def test_report_generator_view(request):
 
 
 @login_required 
+@conditional_on_data_version(_preview_report_data_scope)
 def preview_report_data(request):
     """レポートデータのプレビューAPI"""
     
@@ -134,13 +134,9 @@ class School(models.Model):
         return status_display
     
     def get_price_per_student(self):
-        """会員種別に応じた1名あたり料金を取得"""
-        price_mapping = {
-            'culture_kids': 100,
-            'eduplus': 300,
-            'general': 500,
-        }
-        return price_mapping.get(self.membership_type, 500)
+        """会員種別に応じた1名あたり料金を取得（会員種別の料金設定から）"""
+        from classrooms.membership_prices import resolve_price_per_student
+        return resolve_price_per_student(self.membership_type)
     
     def calculate_total_fee(self, student_count):
         """受講者数から合計料金を計算"""
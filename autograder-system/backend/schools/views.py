@@ -9,6 +9,7 @@ from django.contrib.admin.views.decorators import staff_member_required
 from .models import School
 from .serializers import SchoolSerializer
 from classrooms.models import Classroom
+from autograder.scoping import get_role_scope
 from .utils import (
     import_schools_from_excel, import_students_from_excel,
     export_school_template, export_student_template
@@ -100,19 +101,14 @@ class SchoolViewSet(viewsets.ModelViewSet):
         return response
     
     def get_queryset(self):
-        user = self.request.user
-        if user.role == 'school_admin':
-            # 退会した塾はアクセス不可
-            school = School.objects.filter(school_id=user.school_id).first()
+        scope = get_role_scope(self.request)
+        if scope.is_school_admin or scope.is_classroom_admin:
+            # 塾管理者・教室管理者は所属塾のみ閲覧可能（退会した塾はアクセス不可）
+            queryset = School.objects.filter(pk=scope.school_pk)
+            school = queryset.first()
             if school and not school.can_access():
                 return School.objects.none()
-            return School.objects.filter(school_id=user.school_id)
-        elif user.role == 'classroom_admin':
-            # 教室管理者は所属塾のみ閲覧可能（退会チェック含む）
-            school = School.objects.filter(classrooms__classroom_id=user.classroom_id).first()
-            if school and not school.can_access():
-                return School.objects.none()
-            return School.objects.filter(classrooms__classroom_id=user.classroom_id)
+            return queryset
         else:
             # 管理者は全て閲覧可能
             return School.objects.all()
@@ -7,6 +7,7 @@ from django.utils.html import format_html
 from django.utils import timezone
 from .models import IndividualProblem, IndividualProblemScore, Score, TestResult
 from .utils import bulk_calculate_test_results
+from autograder.data_versions import mark_results_changed
 from tests.models import TestDefinition
 
 # IndividualProblem と IndividualProblemScore を admin から明示的に除外
@@ -447,6 +448,9 @@ class TestResultAdmin(admin.ModelAdmin):
         # STEP 3: 0点(欠席者)を削除
         deleted_count = TestResult.objects.filter(total_score=0).delete()[0]
 
+        # 一括更新はシグナルを経由しないため、成績系のデータバージョンをまとめて進める
+        mark_results_changed()
+
         self.message_user(
             request,
             f"✅ 一括集計完了！ TestResult生成/更新: {generated_count}件、順位・偏差値計算: {updated_count}件、欠席者削除: {deleted_count}件",
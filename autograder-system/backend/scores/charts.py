@@ -0,0 +1,352 @@
+"""
+成績表用グラフ生成
+
+同じ描画命令からSVG（WeasyPrint/HTML用）とPNG（Word用）の両方を出力する。
+matplotlibを使わないため、一括帳票生成でもグラフ1枚あたりの負荷はごく小さい。
+"""
+from __future__ import annotations
+
+import io
+from functools import lru_cache
+from xml.sax.saxutils import escape
+
+# PNG描画に使う日本語フォント候補（見つからない場合はPillow既定フォント）
+FONT_CANDIDATES = [
+    '/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/truetype/fonts-japanese-gothic.ttf',
+    '/usr/share/fonts/opentype/ipaexfont-gothic/ipaexg.ttf',
+    '/usr/share/fonts/truetype/takao-gothic/TakaoPGothic.ttf',
+    '/System/Library/Fonts/ヒラギノ角ゴシック W3.ttc',
+    'C:/Windows/Fonts/meiryo.ttc',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+]
+
+SVG_FONT_FAMILY = "'Noto Sans CJK JP', 'Hiragino Sans', 'Yu Gothic', 'Meiryo', sans-serif"
+
+
+@lru_cache(maxsize=32)
+def _load_font(size: int):
+    """Pillow用フォントをサイズ別にキャッシュして返す"""
+    import os
+    from PIL import ImageFont
+
+    for path in FONT_CANDIDATES:
+        if os.path.exists(path):
+            try:
+                return ImageFont.truetype(path, size)
+            except OSError:
+                continue
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        return ImageFont.load_default()
+
+
+def _fmt(value: float) -> str:
+    value = round(float(value), 2)
+    return str(int(value)) if value.is_integer() else str(value)
+
+
+def _blend(color: str, opacity: float) -> tuple[int, int, int]:
+    """白背景に対する不透明度をRGBに畳み込む"""
+    from PIL import ImageColor
+
+    r, g, b = ImageColor.getrgb(color)[:3]
+    return (
+        int(255 - (255 - r) * opacity),
+        int(255 - (255 - g) * opacity),
+        int(255 - (255 - b) * opacity),
+    )
+
+
+class Chart:
+    """SVG座標系で描画命令を保持し、SVG/PNGへ出力する簡易キャンバス"""
+
+    def __init__(self, width: float, height: float, chart_id: str | None = None, css_class: str | None = None):
+        self.width = width
+        self.height = height
+        self.chart_id = chart_id
+        self.css_class = css_class
+        self.elements: list[tuple[str, dict]] = []
+
+    def line(self, x1, y1, x2, y2, stroke='#000', width=1, dash: str | None = None):
+        self.elements.append(('line', dict(x1=x1, y1=y1, x2=x2, y2=y2, stroke=stroke, width=width, dash=dash)))
+
+    def polyline(self, points, stroke='#000', width=1, dash: str | None = None):
+        self.elements.append(('polyline', dict(points=list(points), stroke=stroke, width=width, dash=dash)))
+
+    def rect(self, x, y, w, h, fill='#000', opacity=1.0):
+        self.elements.append(('rect', dict(x=x, y=y, w=w, h=h, fill=fill, opacity=opacity)))
+
+    def circle(self, cx, cy, r, fill='#000'):
+        self.elements.append(('circle', dict(cx=cx, cy=cy, r=r, fill=fill)))
+
+    def text(self, x, y, content, size=10, fill='#666', anchor='start', bold=False):
+        self.elements.append(('text', dict(x=x, y=y, content=str(content), size=size, fill=fill, anchor=anchor, bold=bold)))
+
+    def star(self, x, y, size=14, fill='#ffd700'):
+        """(x, y) を中心とする星印"""
+        self.elements.append(('star', dict(x=x, y=y, size=size, fill=fill)))
+
+    # ---- SVG出力 -------------------------------------------------------
+
+    def to_svg(self) -> str:
+        attrs = [f'viewBox="0 0 {_fmt(self.width)} {_fmt(self.height)}"']
+        if self.css_class:
+            attrs.append(f'class="{self.css_class}"')
+        if self.chart_id:
+            attrs.append(f'id="{self.chart_id}"')
+        parts = [f'<svg {" ".join(attrs)} xmlns="http://www.w3.org/2000/svg" font-family="{SVG_FONT_FAMILY}">']
+
+        for kind, e in self.elements:
+            if kind == 'line':
+                dash = f' stroke-dasharray="{e["dash"]}"' if e['dash'] else ''
+                parts.append(
+                    f'<line x1="{_fmt(e["x1"])}" y1="{_fmt(e["y1"])}" x2="{_fmt(e["x2"])}" y2="{_fmt(e["y2"])}" '
+                    f'stroke="{e["stroke"]}" stroke-width="{_fmt(e["width"])}"{dash}/>'
+                )
+            elif kind == 'polyline':
+                dash = f' stroke-dasharray="{e["dash"]}"' if e['dash'] else ''
+                points = ' '.join(f'{_fmt(x)},{_fmt(y)}' for x, y in e['points'])
+                parts.append(
+                    f'<polyline points="{points}" fill="none" stroke="{e["stroke"]}" '
+                    f'stroke-width="{_fmt(e["width"])}"{dash}/>'
+                )
+            elif kind == 'rect':
+                opacity = f' opacity="{_fmt(e["opacity"])}"' if e['opacity'] < 1 else ''
+                parts.append(
+                    f'<rect x="{_fmt(e["x"])}" y="{_fmt(e["y"])}" width="{_fmt(e["w"])}" height="{_fmt(e["h"])}" '
+                    f'fill="{e["fill"]}"{opacity}/>'
+                )
+            elif kind == 'circle':
+                parts.append(f'<circle cx="{_fmt(e["cx"])}" cy="{_fmt(e["cy"])}" r="{_fmt(e["r"])}" fill="{e["fill"]}"/>')
+            elif kind == 'text':
+                weight = ' font-weight="700"' if e['bold'] else ''
+                anchor = f' text-anchor="{e["anchor"]}"' if e['anchor'] != 'start' else ''
+                parts.append(
+                    f'<text x="{_fmt(e["x"])}" y="{_fmt(e["y"])}"{anchor} font-size="{_fmt(e["size"])}" '
+                    f'fill="{e["fill"]}"{weight}>{escape(e["content"])}</text>'
+                )
+            elif kind == 'star':
+                points = ' '.join(f'{_fmt(x)},{_fmt(y)}' for x, y in _star_points(e['x'], e['y'], e['size'] / 2))
+                parts.append(f'<polygon points="{points}" fill="{e["fill"]}" stroke="#b8860b" stroke-width="0.5"/>')
+
+        parts.append('</svg>')
+        return '\n'.join(parts)
+
+    # ---- PNG出力 -------------------------------------------------------
+
+    def to_png(self, scale: float = 4.0) -> bytes:
+        """描画命令をPillowでラスタライズしてPNGバイト列を返す"""
+        from PIL import Image, ImageDraw
+
+        image = Image.new('RGB', (int(self.width * scale), int(self.height * scale)), 'white')
+        draw = ImageDraw.Draw(image)
+
+        def s(value):
+            return value * scale
+
+        for kind, e in self.elements:
+            if kind == 'line':
+                _draw_line(draw, [(s(e['x1']), s(e['y1'])), (s(e['x2']), s(e['y2']))],
+                           e['stroke'], max(1, int(s(e['width']))), e['dash'], scale)
+            elif kind == 'polyline':
+                _draw_line(draw, [(s(x), s(y)) for x, y in e['points']],
+                           e['stroke'], max(1, int(s(e['width']))), e['dash'], scale)
+            elif kind == 'rect':
+                if e['h'] <= 0 or e['w'] <= 0:
+                    continue
+                draw.rectangle(
+                    [s(e['x']), s(e['y']), s(e['x'] + e['w']), s(e['y'] + e['h'])],
+                    fill=_blend(e['fill'], e['opacity'])
+                )
+            elif kind == 'circle':
+                r = s(e['r'])
+                draw.ellipse([s(e['cx']) - r, s(e['cy']) - r, s(e['cx']) + r, s(e['cy']) + r], fill=e['fill'])
+            elif kind == 'text':
+                font = _load_font(max(1, int(s(e['size']))))
+                anchor = {'start': 'ls', 'middle': 'ms', 'end': 'rs'}[e['anchor']]
+                try:
+                    draw.text((s(e['x']), s(e['y'])), e['content'], fill=e['fill'], font=font, anchor=anchor,
+                              stroke_width=1 if e['bold'] else 0, stroke_fill=e['fill'])
+                except ValueError:
+                    # ビットマップフォントはanchor非対応
+                    draw.text((s(e['x']), s(e['y']) - s(e['size'])), e['content'], fill=e['fill'], font=font)
+            elif kind == 'star':
+                draw.polygon([(s(x), s(y)) for x, y in _star_points(e['x'], e['y'], e['size'] / 2)],
+                             fill=e['fill'], outline='#b8860b')
+
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG', optimize=True)
+        return buffer.getvalue()
+
+
+def _star_points(cx: float, cy: float, radius: float) -> list[tuple[float, float]]:
+    import math
+
+    inner = radius * 0.45
+    points = []
+    for i in range(10):
+        r = radius if i % 2 == 0 else inner
+        angle = math.pi / 2 + i * math.pi / 5
+        points.append((cx + r * math.cos(angle), cy - r * math.sin(angle)))
+    return points
+
+
+def _draw_line(draw, points, color, width, dash, scale):
+    if not dash:
+        draw.line(points, fill=color, width=width)
+        return
+
+    import math
+
+    on, off = (float(v) * scale for v in dash.replace(' ', ',').split(',')[:2])
+    for (x1, y1), (x2, y2) in zip(points, points[1:]):
+        length = math.hypot(x2 - x1, y2 - y1)
+        if length == 0:
+            continue
+        dx, dy = (x2 - x1) / length, (y2 - y1) / length
+        pos = 0.0
+        while pos < length:
+            end = min(pos + on, length)
+            draw.line([(x1 + dx * pos, y1 + dy * pos), (x1 + dx * end, y1 + dy * end)], fill=color, width=width)
+            pos = end + off
+
+
+# ---- 成績表で使うグラフ ----------------------------------------------------
+
+def score_history_chart(scores: list[float], avg_score: float, color: str, chart_id: str, max_score: float = 100) -> Chart | None:
+    """回ごとの得点棒グラフ＋学年平均の星印（個人成績表の推移欄）"""
+    if not scores:
+        return None
+    max_score = max_score or 100
+
+    chart = Chart(200, 140, chart_id=chart_id, css_class='line-chart')
+    chart.line(40, 20, 40, 110, stroke='#bdc3c7', width=2)
+    chart.line(40, 110, 190, 110, stroke='#bdc3c7', width=2)
+    chart.text(20, 20, _fmt(max_score), size=9)
+    chart.text(20, 65, _fmt(max_score / 2), size=9)
+    chart.text(28, 115, '0', size=9)
+    chart.line(40, 20, 190, 20, stroke='#e0e0e0', dash='2,2')
+    chart.line(40, 65, 190, 65, stroke='#e0e0e0', dash='2,2')
+
+    bar_width = 25
+    spacing = 50
+
+    def to_y(value):
+        return 110 - (max(0, min(float(value), max_score)) / max_score) * 90
+
+    avg_y = to_y(avg_score)
+    if len(scores) > 1:
+        chart.line(60, avg_y, 60 + (len(scores) - 1) * spacing, avg_y, stroke='#ffd700', width=2, dash='4,3')
+
+    for index, score in enumerate(scores):
+        x = 60 + index * spacing
+        y = to_y(score)
+        chart.rect(x - bar_width / 2, y, bar_width, 110 - y, fill=color, opacity=0.8)
+        chart.text(x, y - 5, round(score), size=10, fill=color, anchor='middle', bold=True)
+        chart.text(x, 130, f'{index + 1}回', size=10, anchor='middle', bold=True)
+
+    for index in range(len(scores)):
+        chart.star(60 + index * spacing, avg_y, size=12)
+
+    return chart
+
+
+def score_comparison_chart(subject_data: dict) -> Chart:
+    """全国・塾内の平均点と自分の得点を並べる比較棒グラフ（Word帳票用）"""
+    categories = [
+        ('全国', subject_data.get('total_score') or 0, subject_data.get('average_score') or 0),
+        ('塾内', subject_data.get('total_score') or 0, subject_data.get('school_average') or 0),
+    ]
+    max_value = max([v for _, mine, avg in categories for v in (mine, avg)] + [1])
+    scale_max = max(100, ((int(max_value) + 9) // 10) * 10)
+
+    chart = Chart(320, 200)
+    left, right, top, bottom = 40, 310, 30, 170
+    plot_height = bottom - top
+
+    chart.text((left + right) / 2, 16, f'{subject_data.get("name", "")} 得点比較', size=12, fill='#333', anchor='middle', bold=True)
+    for step in range(5):
+        value = scale_max * step / 4
+        y = bottom - plot_height * step / 4
+        chart.line(left, y, right, y, stroke='#e0e0e0', dash='2,2' if step else None)
+        chart.text(left - 4, y + 3, _fmt(value), size=8, anchor='end')
+    chart.line(left, top, left, bottom, stroke='#999')
+
+    group_width = (right - left) / len(categories)
+    bar_width = group_width * 0.3
+    for index, (label, mine, avg) in enumerate(categories):
+        center = left + group_width * (index + 0.5)
+        for offset, value, color, fmt in ((-1, mine, '#1f73b5', '{:.0f}'), (1, avg, '#ff7f0e', '{:.1f}')):
+            height = plot_height * float(value) / scale_max
+            x = center + (offset * bar_width / 2) - bar_width / 2
+            chart.rect(x, bottom - height, bar_width, height, fill=color)
+            chart.text(x + bar_width / 2, bottom - height - 3, fmt.format(float(value)), size=8, fill='#333', anchor='middle')
+        chart.text(center, bottom + 14, label, size=9, fill='#333', anchor='middle')
+
+    chart.rect(right - 120, top - 8, 8, 8, fill='#1f73b5')
+    chart.text(right - 108, top - 1, 'あなたの得点', size=8, fill='#333')
+    chart.rect(right - 48, top - 8, 8, 8, fill='#ff7f0e')
+    chart.text(right - 36, top - 1, '平均点', size=8, fill='#333')
+    return chart
+
+
+def score_trend_chart(points: list[dict], title: str) -> Chart | None:
+    """期ごとの得点推移の折れ線グラフ（本人と平均）"""
+    if len(points) < 2:
+        return None
+
+    scores = [float(p.get('score') or 0) for p in points]
+    averages = [float(p.get('average') or 0) for p in points]
+    max_value = max(scores + averages + [1])
+    scale_max = ((int(max_value) + 9) // 10) * 10
+
+    chart = Chart(330, 200)
+    left, right, top, bottom = 36, 320, 28, 170
+    plot_height = bottom - top
+    step_x = (right - left - 20) / (len(points) - 1)
+
+    def to_xy(index, value):
+        return left + 10 + index * step_x, bottom - plot_height * value / scale_max
+
+    chart.text((left + right) / 2, 16, title, size=11, fill='#333', anchor='middle', bold=True)
+    for step in range(5):
+        y = bottom - plot_height * step / 4
+        chart.line(left, y, right, y, stroke='#e0e0e0', dash='2,2' if step else None)
+        chart.text(left - 4, y + 3, _fmt(scale_max * step / 4), size=8, anchor='end')
+
+    score_points = [to_xy(i, v) for i, v in enumerate(scores)]
+    chart.polyline(score_points, stroke='#1f77b4', width=2)
+    for x, y in score_points:
+        chart.circle(x, y, 3, fill='#1f77b4')
+
+    if any(averages):
+        avg_points = [to_xy(i, v) for i, v in enumerate(averages)]
+        chart.polyline(avg_points, stroke='#ff7f0e', width=1.6, dash='4,3')
+        for x, y in avg_points:
+            chart.circle(x, y, 2.5, fill='#ff7f0e')
+
+    for index, point in enumerate(points):
+        x, _ = to_xy(index, 0)
+        chart.text(x, bottom + 14, point.get('label', ''), size=8, fill='#333', anchor='middle')
+
+    chart.line(right - 110, bottom - 10, right - 96, bottom - 10, stroke='#1f77b4', width=2)
+    chart.text(right - 92, bottom - 7, 'あなた', size=8, fill='#333')
+    if any(averages):
+        chart.line(right - 52, bottom - 10, right - 38, bottom - 10, stroke='#ff7f0e', width=1.6, dash='4,3')
+        chart.text(right - 34, bottom - 7, '平均', size=8, fill='#333')
+    return chart
+
+
+def add_chart_to_docx(doc, chart: Chart, width_cm: float = 12):
+    """グラフをPNG化してWord文書に中央揃えで挿入する（一時ファイル不要）"""
+    from docx.shared import Cm
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+    paragraph = doc.add_paragraph()
+    run = paragraph.add_run()
+    run.add_picture(io.BytesIO(chart.to_png()), width=Cm(width_cm))
+    paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    return paragraph
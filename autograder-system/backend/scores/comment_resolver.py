@@ -0,0 +1,187 @@
+"""
+塾長コメントの一括解決
+
+(生徒, テスト, 得点) の組をまとめて受け取り、保存済みコメントを一括取得したうえで
+CommentTemplateV2 を得点範囲の区間索引で照合する。件数に関わらずクエリ数は一定。
+
+優先順位（従来の _get_principal_comment と同じ）:
+    1. SubjectGeneralComment（教科別の手動コメント）
+    2. TestComment（scope='test_overall'）
+    3. CommentTemplateV2（科目・得点範囲が一致するもの）
+    4. StudentComment（comment_type='general'）
+    5. 既定文
+"""
+from __future__ import annotations
+
+from bisect import bisect_right
+from collections import defaultdict
+
+DEFAULT_PRINCIPAL_COMMENT = '今回の結果は、未来へのヒントです。今の努力が、これからの可能性を広げていきます。'
+
+# CommentTemplateV2.subject_filter は日本語で登録されている
+SUBJECT_FILTER_NAMES = {
+    'japanese': '国語',
+    'math': '算数',
+}
+
+_NEG_INF = float('-inf')
+_POS_INF = float('inf')
+
+
+class CommentTemplateIndex:
+    """
+    科目ごとの得点区間索引
+
+    各科目について区間の端点で数直線を分割し、分割区間ごとに該当テンプレートの一覧を
+    前計算しておく。照合は二分探索1回で済む。
+    """
+
+    def __init__(self, templates):
+        by_subject = defaultdict(list)
+        for template in templates:
+            by_subject[template.subject_filter or ''].append(template)
+        self._index = {subject: self._build(items) for subject, items in by_subject.items()}
+
+    @classmethod
+    def load(cls, queryset=None):
+        from .models import CommentTemplateV2
+
+        if queryset is None:
+            queryset = CommentTemplateV2.objects.filter(is_active=True)
+        return cls(queryset.order_by('id'))
+
+    @staticmethod
+    def _bounds(template):
+        low = template.score_range_min if template.score_range_min is not None else _NEG_INF
+        high = template.score_range_max if template.score_range_max is not None else _POS_INF
+        return low, high
+
+    @classmethod
+    def _build(cls, templates):
+        # 閉区間 [low, high] を半開区間の境界として扱うため high 側は +1 した位置で切る（得点は整数）
+        points = set()
+        for template in templates:
+            low, high = cls._bounds(template)
+            points.add(low)
+            points.add(high + 1 if high != _POS_INF else _POS_INF)
+        boundaries = sorted(points)
+        segments = []
+        for start in boundaries:
+            segments.append([
+                template for template in templates
+                if cls._bounds(template)[0] <= start <= cls._bounds(template)[1]
+            ])
+        return boundaries, segments
+
+    def candidates(self, subject: str, score) -> list:
+        """指定科目で score を範囲に含むテンプレート（登録順）"""
+        entry = self._index.get(subject or '')
+        if not entry:
+            return []
+        boundaries, segments = entry
+        position = bisect_right(boundaries, score) - 1
+        if position < 0:
+            return []
+        return segments[position]
+
+    def find(self, subject: str, score, *, include_unfiltered: bool = False, bounded_only: bool = False, key=None):
+        """
+        条件に合うテンプレートを1件返す
+
+        include_unfiltered: 科目フィルター未設定（全科目共通）のテンプレートも対象にする
+        bounded_only: 最小・最大の両方が設定されたテンプレートのみ対象にする
+        key: 複数候補からの選択基準（未指定時は登録順の先頭）
+        """
+        matches = list(self.candidates(subject, score))
+        if include_unfiltered and subject:
+            matches.extend(self.candidates('', score))
+        if bounded_only:
+            matches = [t for t in matches if t.score_range_min is not None and t.score_range_max is not None]
+        if not matches:
+            return None
+        if key is not None:
+            return min(matches, key=key)
+        return matches[0]
+
+
+def resolve_principal_comments(items, template_index: CommentTemplateIndex | None = None) -> dict:
+    """
+    塾長コメントをまとめて解決する
+
+    items: (student, test, score) の反復。score が None の場合は出席分の得点合計を使う。
+    戻り値: {(student.id, test.id): コメント文}
+    """
+    from django.db.models import Sum
+    from .models import SubjectGeneralComment, TestComment, StudentComment, Score
+
+    items = [(student, test, score) for student, test, score in items if student and test]
+    if not items:
+        return {}
+
+    student_ids = {student.id for student, _, _ in items}
+    test_ids = {test.id for _, test, _ in items}
+
+    # 各段は登録順の先頭1件だけを見る（空文なら次の段へ進む。従来の .first() と同じ）
+
+    # 1. 教科別の手動コメント
+    subject_comments = {}
+    for student_id, test_id, subject, text in (
+        SubjectGeneralComment.objects.filter(student_id__in=student_ids, test_id__in=test_ids)
+        .order_by('id')
+        .values_list('student_id', 'test_id', 'subject', 'comment_text')
+    ):
+        subject_comments.setdefault((student_id, test_id, subject), text)
+
+    # 2. テスト全体コメント
+    test_comments = {}
+    for student_id, test_id, content in (
+        TestComment.objects.filter(student_id__in=student_ids, test_id__in=test_ids, scope='test_overall')
+        .order_by('id')
+        .values_list('student_id', 'test_id', 'content')
+    ):
+        test_comments.setdefault((student_id, test_id), content)
+
+    # 得点が渡されていない組だけ出席分の合計を一括集計
+    missing = [(student.id, test.id) for student, test, score in items if score is None]
+    score_totals = {}
+    if missing:
+        for row in (
+            Score.objects.filter(
+                student_id__in={s for s, _ in missing},
+                test_id__in={t for _, t in missing},
+                attendance=True,
+            ).values('student_id', 'test_id').annotate(total=Sum('score'))
+        ):
+            score_totals[(row['student_id'], row['test_id'])] = row['total'] or 0
+
+    # 4. 総合コメント（フォールバック）
+    general_comments = {}
+    for student_id, test_id, content in (
+        StudentComment.objects.filter(student_id__in=student_ids, test_id__in=test_ids, comment_type='general')
+        .order_by('id')
+        .values_list('student_id', 'test_id', 'content')
+    ):
+        general_comments.setdefault((student_id, test_id), content)
+
+    if template_index is None:
+        template_index = CommentTemplateIndex.load()
+
+    resolved = {}
+    for student, test, score in items:
+        key = (student.id, test.id)
+        subject = test.subject
+
+        comment = subject_comments.get((student.id, test.id, subject)) or test_comments.get(key)
+        if not comment:
+            total = score if score is not None else score_totals.get(key, 0)
+            template = template_index.find(
+                SUBJECT_FILTER_NAMES.get(subject, subject), total, bounded_only=True
+            )
+            if template and template.template_text:
+                comment = template.template_text
+        if not comment:
+            comment = general_comments.get(key) or DEFAULT_PRINCIPAL_COMMENT
+
+        resolved[key] = comment
+
+    return resolved
@@ -0,0 +1,256 @@
+"""
+CSVエクスポートのストリーミング出力
+
+行を生成しながらそのままレスポンスへ流すため、件数が増えてもメモリは一定。
+集計値は出力前にテスト×学年単位でまとめて求め、行ごとのクエリは発行しない。
+"""
+from __future__ import annotations
+
+import csv
+from collections import defaultdict
+
+from django.db import connection
+from django.db.models import F
+from django.http import StreamingHttpResponse
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+class _Echo:
+    """csv.writer の書き込み先。書き込まれた文字列をそのまま返す"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv_response(rows, filename: str, bom: bool = False, encoding: str = 'utf-8'):
+    """行の反復をCSVとしてストリーミング配信する"""
+    writer = csv.writer(_Echo())
+
+    def generate():
+        if bom:
+            yield '\ufeff'.encode(encoding)
+        for row in rows:
+            yield writer.writerow(row).encode(encoding)
+
+    response = StreamingHttpResponse(generate(), content_type=f'text/csv; charset={encoding}')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _iter_grade_rankings(test_ids, queryset):
+    """
+    出力対象の結果ごとの (テストID, 結果ID, 学年順位, 学年内総数, 学年平均点) を (テストID, 結果ID) 順に返す
+
+    順位・人数・平均は対象テストの全結果をテスト×学年で区切った RANK()/COUNT()/AVG() の
+    ウィンドウ関数で求め（出力対象の絞り込みに関係なく全国の学年内）、出力対象の行だけを
+    1本の SQL で読み出す。PostgreSQL ではサーバーサイドカーソルでチャンク単位に取得する
+    （QuerySet.iterator() と同じく DISABLE_SERVER_SIDE_CURSORS の指定時は通常のカーソル）。
+    """
+    from .models import TestResult
+
+    results_sql, results_params = TestResult.objects.filter(test_id__in=test_ids).values(
+        result_pk=F('id'), test_pk=F('test_id'), grade=F('student__grade'), score=F('total_score'),
+    ).order_by().query.sql_with_params()
+    targets_sql, targets_params = queryset.order_by().values('id').query.sql_with_params()
+    sql = f'''
+        WITH grade_results AS ({results_sql}),
+        ranked AS (
+            SELECT result_pk, test_pk,
+                   RANK() OVER (PARTITION BY test_pk, grade ORDER BY score DESC) AS grade_rank,
+                   COUNT(*) OVER (PARTITION BY test_pk, grade) AS grade_total,
+                   AVG(score) OVER (PARTITION BY test_pk, grade) AS grade_average
+            FROM grade_results
+        )
+        SELECT test_pk, result_pk, grade_rank, grade_total, grade_average FROM ranked
+        WHERE result_pk IN ({targets_sql})
+        ORDER BY test_pk, result_pk
+    '''
+    if connection.settings_dict.get('DISABLE_SERVER_SIDE_CURSORS'):
+        cursor = connection.cursor()
+    else:
+        cursor = connection.chunked_cursor()
+    with cursor:
+        cursor.execute(sql, list(results_params) + list(targets_params))
+        while True:
+            rows = cursor.fetchmany(EXPORT_CHUNK_SIZE)
+            if not rows:
+                return
+            yield from rows
+
+
+def iter_test_result_export_rows(queryset):
+    """
+    TestResultViewSet.export_data 用の行を生成する
+
+    学年順位・学年人数・学年平均は SQL のウィンドウ関数で求めて行と同じ順に読み出し（全体で1クエリ）、
+    大問平均は事前集計済みの大問別統計を参照する。大問別得点はチャンク単位でまとめて取得する。
+    """
+    from tests.models import QuestionGroup
+    from .models import Score
+    from .question_statistics import get_question_averages_by_number
+
+    queryset = queryset.select_related('student__classroom__school', 'test').order_by('test_id', 'id')
+    test_ids = list(queryset.order_by().values_list('test_id', flat=True).distinct())
+
+    # ヘッダー（大問数は対象テストの最大数に合わせる）
+    headers = [
+        '生徒ID', '生徒名', '学年', '塾名', '教室名',
+        '合計点', '正答率(%)', '学年順位', '学年内総数', '学年平均点'
+    ]
+    group_counts = defaultdict(int)
+    for test_id in QuestionGroup.objects.filter(test_id__in=test_ids).values_list('test_id', flat=True):
+        group_counts[test_id] += 1
+    question_count = max(group_counts.values(), default=0)
+    for i in range(1, question_count + 1):
+        headers.extend([f'大問{i}得点', f'大問{i}平均'])
+    yield headers
+
+    # 行と同じ (テストID, 結果ID) 順に学年順位を読み進める
+    rankings = _iter_grade_rankings(test_ids, queryset)
+    ranking = next(rankings, None)
+
+    question_averages = {}
+
+    for chunk in _chunked(queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE), EXPORT_CHUNK_SIZE):
+        # チャンク内の大問別得点をまとめて取得
+        chunk_scores = defaultdict(list)
+        for student_id, test_id, group_number, score in Score.objects.filter(
+            student_id__in={r.student_id for r in chunk},
+            test_id__in={r.test_id for r in chunk},
+            attendance=True,
+        ).order_by('question_group__group_number').values_list(
+            'student_id', 'test_id', 'question_group__group_number', 'score'
+        ):
+            chunk_scores[(student_id, test_id)].append((group_number, score))
+
+        for test_result in chunk:
+            student = test_result.student
+            classroom = student.classroom
+            row = [
+                student.student_id,
+                student.name,
+                f'{student.grade}年生',
+                classroom.school.name if classroom else '',
+                classroom.name if classroom else '',
+                test_result.total_score,
+                float(test_result.correct_rate),
+            ]
+
+            # 2本のクエリの間に結果が増減した場合は、対応する順位がない行を空欄にする
+            key = (test_result.test_id, test_result.id)
+            while ranking is not None and tuple(ranking[:2]) < key:
+                ranking = next(rankings, None)
+            if ranking is not None and tuple(ranking[:2]) == key:
+                _, _, grade_rank, grade_total, grade_average = ranking
+                row.extend([grade_rank, grade_total, float(grade_average or 0)])
+            else:
+                row.extend(['', '', ''])
+
+            avg_key = (test_result.test_id, student.grade)
+            if avg_key not in question_averages:
+                question_averages[avg_key] = get_question_averages_by_number(
+                    test_result.test_id, grade=student.grade
+                )
+            q_avg_dict = question_averages[avg_key]
+
+            for group_number, score in chunk_scores.get((test_result.student_id, test_result.test_id), []):
+                row.extend([score, float(q_avg_dict.get(group_number, 0))])
+
+            yield row
+
+
+PERIOD_DISPLAY = {'spring': '春期', 'summer': '夏期', 'winter': '冬期'}
+SUBJECT_COLUMN_ORDER = ['国語', '算数', '英語', '数学']
+
+
+def iter_student_score_export_rows(schedule, enrollments):
+    """
+    ScoreViewSet.export_scores_with_students 用の行を生成する
+
+    受講登録（生徒ID順）と大問別得点（生徒ID順）の2本のカーソルを突き合わせて1行ずつ出力する。
+    大問構成は日程全体で1クエリ。保持するのは現在の生徒1人分の行のみ。
+    """
+    from tests.models import TestDefinition, QuestionGroup
+    from .models import Score
+
+    # テストごとの教科名と大問番号（1クエリ）
+    test_subjects = {
+        test_def.id: test_def.get_subject_display()
+        for test_def in TestDefinition.objects.filter(schedule=schedule)
+    }
+    group_numbers_by_test = defaultdict(list)
+    for test_id, group_number in QuestionGroup.objects.filter(
+        test__schedule=schedule
+    ).order_by('group_number').values_list('test_id', 'group_number'):
+        group_numbers_by_test[test_id].append(group_number)
+
+    # 教科ごとの大問列（大問数が最も多いテストの構成を使用）
+    subject_groups = {}
+    for test_id, subject_display in test_subjects.items():
+        group_numbers = group_numbers_by_test.get(test_id, [])
+        if subject_display not in subject_groups or len(group_numbers) > len(subject_groups[subject_display]):
+            subject_groups[subject_display] = group_numbers
+
+    headers = ['塾ID', '塾名', '教室ID', '教室名', '生徒ID', '生徒名', '学年', '年度', '期間', '出席']
+    column_index = {}
+    for subject_display in SUBJECT_COLUMN_ORDER:
+        for group_number in subject_groups.get(subject_display, []):
+            column_index[(subject_display, group_number)] = len(headers)
+            headers.append(f'{subject_display}_大問{group_number}')
+    yield headers
+
+    period_display = PERIOD_DISPLAY.get(schedule.period, schedule.period)
+    attendance_index = headers.index('出席')
+
+    enrollment_rows = enrollments.order_by('student_id').values_list(
+        'student_id',
+        'student__classroom__school__school_id',
+        'student__classroom__school__name',
+        'student__classroom__classroom_id',
+        'student__classroom__name',
+        'student__student_id',
+        'student__name',
+        'student__grade',
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+    score_rows = Score.objects.filter(
+        test__schedule=schedule,
+        student_id__in=enrollments.values('student_id'),
+    ).order_by('student_id').values_list(
+        'student_id', 'test_id', 'question_group__group_number', 'score', 'attendance'
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    pending_score = next(score_rows, None)
+
+    for student_pk, school_id, school_name, classroom_id, classroom_name, student_id, name, grade in enrollment_rows:
+        row = [
+            school_id or '', school_name or '', classroom_id or '', classroom_name or '',
+            student_id, name, grade, schedule.year, period_display, '出席',
+        ]
+        row.extend([''] * (len(headers) - len(row)))  # 未入力は空欄
+
+        # 登録のない生徒の得点は読み飛ばす
+        while pending_score is not None and pending_score[0] < student_pk:
+            pending_score = next(score_rows, None)
+
+        while pending_score is not None and pending_score[0] == student_pk:
+            _, test_id, group_number, score, attendance = pending_score
+            index = column_index.get((test_subjects.get(test_id), group_number))
+            if index is not None:
+                row[index] = score
+            if not attendance:
+                row[attendance_index] = '欠席'
+            pending_score = next(score_rows, None)
+
+        yield row
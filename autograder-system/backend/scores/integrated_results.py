@@ -0,0 +1,183 @@
+"""
+生徒単位の統合テスト結果（国語・算数合算）
+
+教科別合計は ORM で集計し、その SQL を CTE として包んで RANK()/COUNT()/AVG() の
+ウィンドウ関数で学年内・塾内の順位と平均を求める。Python 側で全生徒を走査しないため、
+全塾を対象にしても取得するのは1ページ分の行だけになる。
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+
+from django.db import connection
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+
+# ?ordering= で指定できる並び順 -> SQL の列
+ORDERING_COLUMNS = {
+    'total_score': 'combined_total',
+    'grade': 'grade',
+    'student_id': 'student_code',
+    'grade_rank': 'grade_rank',
+    'school_rank': 'school_rank',
+}
+DEFAULT_ORDERING = '-total_score'
+
+
+def _subject_totals_sql(score_filter):
+    """(生徒, 教科) ごとの合計点を求める SQL とパラメータ"""
+    from .models import Score
+
+    queryset = Score.objects.filter(score_filter).values(
+        student_pk=F('student_id'),
+        student_code=F('student__student_id'),
+        grade=F('student__grade'),
+        school_pk=F('student__classroom__school_id'),
+        subject=F('test__subject'),
+    ).annotate(
+        subject_total=Coalesce(Sum('score'), 0),
+        question_count=Count('question_group'),
+        attended_count=Count('id', filter=Q(attendance=True)),
+    ).order_by()
+    return queryset.query.sql_with_params()
+
+
+def _order_by_clause(ordering: str | None) -> str:
+    ordering = ordering or DEFAULT_ORDERING
+    descending = ordering.startswith('-')
+    column = ORDERING_COLUMNS.get(ordering.lstrip('-'))
+    if column is None:
+        column, descending = ORDERING_COLUMNS['total_score'], True
+    direction = 'DESC' if descending else 'ASC'
+    return f'{column} {direction}, student_pk ASC'
+
+
+def _fetch_dicts(sql: str, params) -> list[dict]:
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        columns = [col[0] for col in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+class IntegratedResultSet:
+    """
+    合算順位付きの生徒一覧
+
+    Django の Paginator にそのまま渡せるよう count() とスライスに対応する。
+    スライスごとに LIMIT/OFFSET 付きの SQL を1本発行する。
+    """
+
+    def __init__(self, score_filter, ordering: str | None = None):
+        self.score_filter = score_filter
+        self.order_by = _order_by_clause(ordering)
+
+    def count(self) -> int:
+        from .models import Score
+        return Score.objects.filter(self.score_filter).values('student_id').distinct().count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            raise TypeError('IntegratedResultSet はスライスのみ対応しています')
+        offset = index.start or 0
+        limit = (index.stop - offset) if index.stop is not None else None
+        return self.fetch(offset, limit)
+
+    def fetch(self, offset: int = 0, limit: int | None = None) -> list[dict]:
+        base_sql, params = _subject_totals_sql(self.score_filter)
+        sql = f'''
+            WITH subject_totals AS ({base_sql}),
+            student_totals AS (
+                SELECT student_pk, student_code, grade, school_pk,
+                       SUM(CASE WHEN attended_count > 0 THEN subject_total ELSE 0 END) AS combined_total,
+                       MAX(CASE WHEN attended_count > 0 THEN 1 ELSE 0 END) AS attended
+                FROM subject_totals
+                GROUP BY student_pk, student_code, grade, school_pk
+            ),
+            ranked AS (
+                SELECT student_pk, student_code, grade, school_pk, combined_total, attended,
+                       RANK() OVER (PARTITION BY grade ORDER BY combined_total DESC) AS grade_rank,
+                       COUNT(*) OVER (PARTITION BY grade) AS grade_total,
+                       AVG(combined_total) OVER (PARTITION BY grade) AS grade_average,
+                       RANK() OVER (PARTITION BY grade, school_pk ORDER BY combined_total DESC) AS school_rank,
+                       COUNT(*) OVER (PARTITION BY grade, school_pk) AS school_total,
+                       AVG(combined_total) OVER (PARTITION BY grade, school_pk) AS school_average
+                FROM student_totals
+            )
+            SELECT * FROM ranked
+            ORDER BY {self.order_by}
+        '''
+        params = list(params)
+        if limit is not None:
+            sql += ' LIMIT %s OFFSET %s'
+            params.extend([limit, offset])
+        elif offset:
+            raise ValueError('OFFSET のみの指定には対応していません')
+        return _fetch_dicts(sql, params)
+
+
+def fetch_subject_rankings(score_filter, student_pks) -> dict:
+    """
+    指定生徒の教科別順位を {student_pk: {subject: {...}}} で返す
+
+    順位・人数・平均は対象範囲全体で計算し、取得する行だけを生徒で絞り込む。
+    """
+    if not student_pks:
+        return {}
+
+    base_sql, params = _subject_totals_sql(score_filter)
+    placeholders = ', '.join(['%s'] * len(student_pks))
+    sql = f'''
+        WITH subject_totals AS ({base_sql}),
+        ranked AS (
+            SELECT student_pk, subject, subject_total, question_count, attended_count,
+                   RANK() OVER (PARTITION BY grade, subject ORDER BY subject_total DESC) AS grade_rank,
+                   COUNT(*) OVER (PARTITION BY grade, subject) AS grade_total,
+                   AVG(subject_total) OVER (PARTITION BY grade, subject) AS grade_average,
+                   RANK() OVER (PARTITION BY grade, school_pk, subject ORDER BY subject_total DESC) AS school_rank,
+                   COUNT(*) OVER (PARTITION BY grade, school_pk, subject) AS school_total,
+                   AVG(subject_total) OVER (PARTITION BY grade, school_pk, subject) AS school_average
+            FROM subject_totals
+        )
+        SELECT * FROM ranked WHERE student_pk IN ({placeholders})
+    '''
+    rankings = defaultdict(dict)
+    for row in _fetch_dicts(sql, list(params) + list(student_pks)):
+        rankings[row['student_pk']][row['subject']] = row
+    return rankings
+
+
+def fetch_question_details(score_filter, student_pks) -> tuple[dict, dict]:
+    """
+    指定生徒の大問別得点と、その大問の学年平均を返す（?include=question_details 指定時のみ）
+
+    戻り値: ({student_pk: {subject: [...]}}, {student_pk: {subject: {大問番号: 平均}}})
+    """
+    from .models import Score
+    from .question_statistics import get_question_averages_by_number
+
+    details = defaultdict(lambda: defaultdict(list))
+    tests_by_student = defaultdict(dict)
+    for student_pk, grade, test_id, subject, group_number, score, max_score in Score.objects.filter(
+        score_filter, student_id__in=student_pks, attendance=True
+    ).order_by('student_id', 'test__subject', 'question_group__group_number').values_list(
+        'student_id', 'student__grade', 'test_id', 'test__subject',
+        'question_group__group_number', 'score', 'question_group__max_score'
+    ):
+        details[student_pk][subject].append({
+            'question_number': group_number,
+            'score': score,
+            'max_score': max_score,
+        })
+        tests_by_student[student_pk][subject] = (test_id, grade)
+
+    averages_cache = {}
+    averages = defaultdict(dict)
+    for student_pk, subjects in tests_by_student.items():
+        for subject, key in subjects.items():
+            if key not in averages_cache:
+                averages_cache[key] = get_question_averages_by_number(key[0], grade=key[1])
+            averages[student_pk][subject] = averages_cache[key]
+    return details, averages
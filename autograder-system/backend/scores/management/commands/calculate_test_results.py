@@ -6,6 +6,7 @@ from django.db.models import Sum, Count, Avg, StdDev
 from django.utils import timezone
 from scores.models import Score, TestResult
 from tests.models import TestDefinition
+from autograder.data_versions import mark_results_changed
 import gc
 
 class Command(BaseCommand):
@@ -193,6 +194,9 @@ class Command(BaseCommand):
         deleted_count = TestResult.objects.filter(total_score=0).delete()[0]
         self.stdout.write(self.style.SUCCESS(f'✓ 欠席者削除: {deleted_count}件'))
 
+        # 一括更新はシグナルを経由しないため、成績系のデータバージョンをまとめて進める
+        mark_results_changed()
+
         self.stdout.write('\n' + '=' * 70)
         self.stdout.write(self.style.SUCCESS('✅ 一括集計完了！'))
         self.stdout.write(f'  TestResult生成/更新: {generated_count}件')
@@ -3,8 +3,8 @@ from django.db import transaction
 from django.utils import timezone
 from scores.models import TestResult
 from tests.models import TestDefinition, TestSchedule
-from scores.utils import calculate_test_results
-from datetime import datetime
+from scores.utils import bulk_calculate_test_results, finalize_test_result_ranks
+from scores.trend_averages import populate_trend_averages
 
 
 class Command(BaseCommand):
@@ -62,7 +62,7 @@ class Command(BaseCommand):
         
         # 対象テストを取得
         if test_id:
-            tests = TestDefinition.objects.filter(id=test_id)
+            tests = TestDefinition.objects.filter(id=test_id).select_related('schedule')
         else:
             query = TestDefinition.objects.filter(
                 schedule__year=year,
@@ -71,7 +71,7 @@ class Command(BaseCommand):
             )
             if subject:
                 query = query.filter(subject=subject)
-            tests = query
+            tests = query.select_related('schedule')
         
         if not tests.exists():
             self.stdout.write(
@@ -97,46 +97,26 @@ class Command(BaseCommand):
                     continue
                 
                 # テスト結果を取得
-                test_results = TestResult.objects.filter(test=test)
+                result_count = TestResult.objects.filter(test=test).count()
                 
-                if not test_results.exists():
+                if not result_count:
                     self.stdout.write(
                         self.style.WARNING(f'スキップ: {test} - テスト結果がありません')
                     )
                     continue
                 
-                result_count = test_results.count()
-                finalized_count = 0
-                
                 with transaction.atomic():
                     if recalculate:
-                        # 順位を再計算
+                        # 一括集計で順位を再計算（締切後は確定順位として保存される）
                         self.stdout.write(f'順位を再計算中...')
-                        for result in test_results:
-                            try:
-                                calculate_test_results(result.student, test, force_temporary=False)
-                                finalized_count += 1
-                            except Exception as e:
-                                self.stdout.write(
-                                    self.style.ERROR(f'再計算エラー: {result.student} - {str(e)}')
-                                )
-                                errors += 1
+                        finalized_count = bulk_calculate_test_results(test, force_recalculate=True)
+                        # 締切前に強制確定する場合は再計算した一時的順位を確定
+                        finalize_test_result_ranks(test)
                     else:
-                        # 既存の一時的順位を確定
-                        for result in test_results:
-                            try:
-                                if not result.is_rank_finalized:
-                                    result.finalize_ranks()
-                                    finalized_count += 1
-                                else:
-                                    self.stdout.write(
-                                        f'既に確定済み: {result.student.name}'
-                                    )
-                            except Exception as e:
-                                self.stdout.write(
-                                    self.style.ERROR(f'確定エラー: {result.student} - {str(e)}')
-                                )
-                                errors += 1
+                        # 既存の一時的順位を確定（テストごとに1回の UPDATE）
+                        finalized_count = finalize_test_result_ranks(test)
+                        if finalized_count < result_count:
+                            self.stdout.write(f'既に確定済み: {result_count - finalized_count}件')
                 
                 self.stdout.write(
                     self.style.SUCCESS(f'完了: {test} - {finalized_count}/{result_count}件確定')
@@ -151,7 +131,14 @@ class Command(BaseCommand):
                     self.style.ERROR(f'テスト処理エラー: {test} - {str(e)}')
                 )
                 errors += 1
-        
+
+        # 日程全体を確定した場合は推移グラフ用の平均点を保存（以後は変化しない）
+        if processed_tests and not test_id and not subject:
+            schedule = TestSchedule.objects.filter(year=year, period=period).first()
+            if schedule and timezone.now() > schedule.deadline_at:
+                result = populate_trend_averages(schedule, force=recalculate)
+                self.stdout.write(f'推移用平均点: {result["created"]}件保存')
+
         # 結果サマリー
         self.stdout.write(
             self.style.SUCCESS(
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schools', '0006_classroom_membershiptype_student_schoolbillingreport_and_more'),
+        ('tests', '0013_alter_testdefinition_answer_pdf_and_more'),
+        ('scores', '0014_commenttemplatev2_classroom_commenttemplatev2_school_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionGroupStatistics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('grade', models.CharField(blank=True, default='', max_length=20, verbose_name='学年（空欄は全学年）')),
+                ('participant_count', models.IntegerField(default=0, verbose_name='受験者数')),
+                ('average_score', models.DecimalField(decimal_places=2, default=0, max_digits=6, verbose_name='平均点')),
+                ('correct_rate', models.DecimalField(decimal_places=2, default=0, max_digits=5, verbose_name='平均正答率')),
+                ('distribution', models.JSONField(default=dict, verbose_name='得点分布')),
+                ('calculated_at', models.DateTimeField(auto_now=True, verbose_name='集計日時')),
+                ('question_group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='statistics', to='tests.questiongroup', verbose_name='大問')),
+                ('school', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='question_group_statistics', to='schools.school', verbose_name='塾（NULLの場合は全国）')),
+                ('test', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='question_group_statistics', to='tests.testdefinition', verbose_name='テスト')),
+            ],
+            options={
+                'verbose_name': '大問別統計',
+                'verbose_name_plural': '大問別統計',
+                'db_table': 'question_group_statistics',
+                'indexes': [models.Index(fields=['test', 'grade', 'school'], name='question_gr_test_id_d76316_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-19 11:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0013_alter_testdefinition_answer_pdf_and_more'),
+        ('scores', '0015_questiongroupstatistics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendAverage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('grade', models.CharField(max_length=20, verbose_name='学年')),
+                ('subject', models.CharField(blank=True, default='', max_length=20, verbose_name='教科（空欄は合算）')),
+                ('average_score', models.DecimalField(decimal_places=2, default=0, max_digits=6, verbose_name='平均点')),
+                ('participant_count', models.IntegerField(default=0, verbose_name='受験者数')),
+                ('calculated_at', models.DateTimeField(auto_now_add=True, verbose_name='集計日時')),
+                ('schedule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trend_averages', to='tests.testschedule', verbose_name='テスト日程')),
+            ],
+            options={
+                'verbose_name': '推移用平均点',
+                'verbose_name_plural': '推移用平均点',
+                'db_table': 'trend_averages',
+                'unique_together': {('schedule', 'grade', 'subject')},
+                'indexes': [models.Index(fields=['grade', 'schedule'], name='trend_avera_grade_6adff7_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:10
+
+from django.db import migrations, models
+
+
+def remove_duplicate_statistics(apps, schema_editor):
+    """一意制約の追加前に、同時の再集計で重複した行を最新の1行だけ残して削除する"""
+    QuestionGroupStatistics = apps.get_model('scores', 'QuestionGroupStatistics')
+
+    keep_ids = set(
+        QuestionGroupStatistics.objects.values('test_id', 'grade', 'school_id', 'question_group_id')
+        .annotate(latest_id=models.Max('id'))
+        .values_list('latest_id', flat=True)
+    )
+    duplicate_ids = [
+        pk for pk in QuestionGroupStatistics.objects.values_list('id', flat=True).iterator()
+        if pk not in keep_ids
+    ]
+    QuestionGroupStatistics.objects.filter(id__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scores', '0016_trendaverage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='questiongroupstatistics',
+            name='is_stale',
+            field=models.BooleanField(default=False, verbose_name='再集計待ち'),
+        ),
+        migrations.RunPython(remove_duplicate_statistics, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='questiongroupstatistics',
+            constraint=models.UniqueConstraint(condition=models.Q(('school__isnull', False)), fields=('test', 'grade', 'school', 'question_group'), name='unique_question_group_statistics_school'),
+        ),
+        migrations.AddConstraint(
+            model_name='questiongroupstatistics',
+            constraint=models.UniqueConstraint(condition=models.Q(('school__isnull', True)), fields=('test', 'grade', 'question_group'), name='unique_question_group_statistics_national'),
+        ),
+    ]
@@ -2,7 +2,7 @@ from django.db import models
 from django.db.models import Sum, Avg, Count
 from django.utils import timezone
 from students.models import Student
-from tests.models import TestDefinition, Question, QuestionGroup
+from tests.models import TestSchedule, TestDefinition, Question, QuestionGroup
 from schools.models import School
 
 class Score(models.Model):
@@ -312,6 +312,78 @@ class SchoolTestSummary(models.Model):
         return f"{self.test_summary} - {self.school.name}"
 
 
+class QuestionGroupStatistics(models.Model):
+    """大問別統計（テスト×学年×塾ごとに再計算時に事前集計）
+
+    grade が空文字の行は全学年、school が NULL の行は全国の集計を表す。
+    """
+    test = models.ForeignKey(TestDefinition, on_delete=models.CASCADE, related_name='question_group_statistics', verbose_name='テスト')
+    question_group = models.ForeignKey(QuestionGroup, on_delete=models.CASCADE, related_name='statistics', verbose_name='大問')
+    grade = models.CharField(max_length=20, blank=True, default='', verbose_name='学年（空欄は全学年）')
+    school = models.ForeignKey(School, on_delete=models.CASCADE, null=True, blank=True, related_name='question_group_statistics', verbose_name='塾（NULLの場合は全国）')
+
+    participant_count = models.IntegerField(default=0, verbose_name='受験者数')
+    average_score = models.DecimalField(max_digits=6, decimal_places=2, default=0, verbose_name='平均点')
+    correct_rate = models.DecimalField(max_digits=5, decimal_places=2, default=0, verbose_name='平均正答率')
+    # 正答率10%刻みの人数分布 {"0": n, "10": n, ..., "100": n}
+    distribution = models.JSONField(default=dict, verbose_name='得点分布')
+    # 得点の更新後、締切後処理で再集計されるまで True（参照は再集計まで保存済みの値を返す）
+    is_stale = models.BooleanField(default=False, verbose_name='再集計待ち')
+
+    calculated_at = models.DateTimeField(auto_now=True, verbose_name='集計日時')
+
+    class Meta:
+        db_table = 'question_group_statistics'
+        verbose_name = '大問別統計'
+        verbose_name_plural = '大問別統計'
+        indexes = [
+            models.Index(fields=['test', 'grade', 'school']),
+        ]
+        # school が NULL（全国）の行は通常の一意制約では重複を防げないため、条件付きで分ける
+        constraints = [
+            models.UniqueConstraint(
+                fields=['test', 'grade', 'school', 'question_group'],
+                condition=models.Q(school__isnull=False),
+                name='unique_question_group_statistics_school',
+            ),
+            models.UniqueConstraint(
+                fields=['test', 'grade', 'question_group'],
+                condition=models.Q(school__isnull=True),
+                name='unique_question_group_statistics_national',
+            ),
+        ]
+
+    def __str__(self):
+        scope = self.school.name if self.school else '全国'
+        return f"{self.test} 大問{self.question_group.group_number} {self.grade or '全学年'} {scope}"
+
+
+class TrendAverage(models.Model):
+    """成績推移グラフ用の平均点（テスト日程×学年×教科）
+
+    締切後の日程は結果が変わらないため、順位確定時に一度だけ集計して保存する。
+    subject が空文字の行は全教科合算の平均を表す。
+    """
+    schedule = models.ForeignKey(TestSchedule, on_delete=models.CASCADE, related_name='trend_averages', verbose_name='テスト日程')
+    grade = models.CharField(max_length=20, verbose_name='学年')
+    subject = models.CharField(max_length=20, blank=True, default='', verbose_name='教科（空欄は合算）')
+    average_score = models.DecimalField(max_digits=6, decimal_places=2, default=0, verbose_name='平均点')
+    participant_count = models.IntegerField(default=0, verbose_name='受験者数')
+    calculated_at = models.DateTimeField(auto_now_add=True, verbose_name='集計日時')
+
+    class Meta:
+        db_table = 'trend_averages'
+        verbose_name = '推移用平均点'
+        verbose_name_plural = '推移用平均点'
+        unique_together = ['schedule', 'grade', 'subject']
+        indexes = [
+            models.Index(fields=['grade', 'schedule']),
+        ]
+
+    def __str__(self):
+        return f"{self.schedule} {self.grade} {self.subject or '合算'}: {self.average_score}"
+
+
 class IndividualProblem(models.Model):
     """個別問題モデル（1-10などのシンプルな問題）"""
     test = models.ForeignKey(TestDefinition, on_delete=models.CASCADE, related_name='individual_problems', verbose_name='テスト')
@@ -889,26 +961,16 @@ class SubjectGeneralComment(models.Model):
 
     @classmethod
     def get_template_for_score(cls, subject, score):
-        """点数に応じた適切なテンプレートを取得"""
+        """点数に応じた適切なテンプレートを取得
+
+        範囲判定と使用回数順の選択はDB側で行い、1件だけ取得する。
+        まとめて照合する場合は comment_resolver.CommentTemplateIndex を使う。
+        """
         from django.db.models import Q
 
-        # 教科と点数範囲に合致するテンプレートを検索
-        templates = CommentTemplateV2.objects.filter(
+        return CommentTemplateV2.objects.filter(
             Q(subject_filter=subject) | Q(subject_filter=''),
+            Q(score_range_min__isnull=True) | Q(score_range_min__lte=score),
+            Q(score_range_max__isnull=True) | Q(score_range_max__gte=score),
             is_active=True
-        )
-
-        # 点数範囲でフィルタリング
-        applicable_templates = []
-        for template in templates:
-            if template.score_range_min is not None and score < template.score_range_min:
-                continue
-            if template.score_range_max is not None and score > template.score_range_max:
-                continue
-            applicable_templates.append(template)
-
-        # 使用回数が少ないテンプレートを優先
-        if applicable_templates:
-            return sorted(applicable_templates, key=lambda t: t.usage_count)[0]
-
-        return None
\ No newline at end of file
+        ).order_by('usage_count', 'id').first()
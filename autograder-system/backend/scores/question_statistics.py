@@ -0,0 +1,244 @@
+"""
+大問別統計の事前集計と参照
+
+再計算パイプライン（bulk_calculate_test_results）でテストごとに1クエリで集計し、
+QuestionGroupStatisticsへ保存する。帳票・詳細結果・CSV出力はキャッシュ経由で参照するため、
+生徒ごとに Score を集計し直す必要はない。
+
+個別の得点更新では保存済みの統計を再集計待ち（is_stale）にするだけで、参照時には集計しない。
+再集計待ちのテストは締切後処理（process_test_deadlines）の定期実行でまとめて再集計する。
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+
+from autograder.after_commit import defer_until_commit
+
+CACHE_TIMEOUT = 60 * 60 * 6
+DISTRIBUTION_BUCKETS = [str(i) for i in range(0, 101, 10)]
+
+
+def _version_key(test_id) -> str:
+    return f'qgstats:ver:{test_id}'
+
+
+def _lookup_key(test_id, grade: str, school_id) -> str:
+    version = cache.get(_version_key(test_id), 0)
+    return f'qgstats:{test_id}:{version}:{grade or "*"}:{school_id or "*"}'
+
+
+def _to_decimal(value: float) -> Decimal:
+    return Decimal(str(value)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def _bucket(score: int, max_score: int) -> str:
+    if not max_score:
+        return '0'
+    rate = max(0, min(100, score * 100 // max_score))
+    return str(rate // 10 * 10)
+
+
+def invalidate_question_group_statistics(test_id) -> None:
+    """参照キャッシュを無効化する（バージョンを進めるだけで既存キーは自然に失効）"""
+    key = _version_key(test_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def _invalidate_tests(test_ids) -> None:
+    for test_id in test_ids:
+        invalidate_question_group_statistics(test_id)
+
+
+def mark_question_group_statistics_stale(test_id) -> None:
+    """
+    個別の得点更新時に呼ぶ
+
+    保存済みの統計は削除せずに再集計待ちにする（再集計は締切後処理で行う）。合計点の統計
+    （get_grade_result_statistics）は同じバージョンで参照しているため、確定時に無効化する。
+    """
+    from .models import QuestionGroupStatistics
+
+    QuestionGroupStatistics.objects.filter(test_id=test_id, is_stale=False).update(is_stale=True)
+    defer_until_commit('question_group_statistics', test_id, _invalidate_tests)
+
+
+def rebuild_question_group_statistics(test) -> dict:
+    """
+    指定テストの大問別統計を再集計して保存する
+
+    全国（全学年）・全国（学年別）・塾（学年別）の3系統をScore 1クエリから同時に集計する。
+    """
+    from tests.models import QuestionGroup
+    from .models import Score, QuestionGroupStatistics
+
+    max_scores = dict(
+        QuestionGroup.objects.filter(test=test).values_list('id', 'max_score')
+    )
+
+    # key: (question_group_id, grade, school_id) -> [count, total, distribution]
+    buckets = defaultdict(lambda: [0, 0, defaultdict(int)])
+    rows = Score.objects.filter(
+        test=test,
+        attendance=True,
+        score__gte=0,
+        question_group__isnull=False,
+    ).values_list('question_group_id', 'student__grade', 'student__classroom__school_id', 'score')
+
+    for group_id, grade, school_id, score in rows.iterator(chunk_size=5000):
+        bucket = _bucket(score, max_scores.get(group_id, 0))
+        keys = [(group_id, '', None)]
+        if grade:
+            keys.append((group_id, grade, None))
+            if school_id:
+                keys.append((group_id, grade, school_id))
+        for key in keys:
+            entry = buckets[key]
+            entry[0] += 1
+            entry[1] += score
+            entry[2][bucket] += 1
+
+    records = []
+    for (group_id, grade, school_id), (count, total, distribution) in buckets.items():
+        average = total / count if count else 0
+        max_score = max_scores.get(group_id, 0)
+        records.append(QuestionGroupStatistics(
+            test=test,
+            question_group_id=group_id,
+            grade=grade,
+            school_id=school_id,
+            participant_count=count,
+            average_score=_to_decimal(average),
+            correct_rate=_to_decimal(average / max_score * 100 if max_score else 0),
+            distribution={b: distribution.get(b, 0) for b in DISTRIBUTION_BUCKETS},
+        ))
+
+    with transaction.atomic():
+        QuestionGroupStatistics.objects.filter(test=test).delete()
+        QuestionGroupStatistics.objects.bulk_create(records, batch_size=1000)
+        transaction.on_commit(lambda: invalidate_question_group_statistics(test.id))
+
+    return {'created': len(records)}
+
+
+def rebuild_stale_question_group_statistics() -> int:
+    """
+    再集計待ちのテストの大問別統計をまとめて再集計する（締切後処理から呼ぶ）
+
+    Returns:
+        int: 再集計したテスト数
+    """
+    from tests.models import TestDefinition
+    from .models import QuestionGroupStatistics
+
+    tests = TestDefinition.objects.filter(
+        id__in=QuestionGroupStatistics.objects.filter(is_stale=True).values('test_id')
+    )
+    rebuilt = 0
+    for test in tests:
+        rebuild_question_group_statistics(test)
+        rebuilt += 1
+    return rebuilt
+
+
+def get_question_group_statistics(test_id, grade: str = '', school_id=None) -> dict:
+    """
+    大問別統計を {question_group_id: {...}} で返す
+
+    grade 省略時は全学年、school_id 省略時は全国。一度も集計していないテストだけはその場で
+    集計して保存する（再集計待ちの統計は再集計まで保存済みの値を返す）。
+    """
+    from .models import QuestionGroupStatistics
+
+    key = _lookup_key(test_id, grade, school_id)
+    stats = cache.get(key)
+    if stats is not None:
+        return stats
+
+    rows = list(
+        QuestionGroupStatistics.objects.filter(test_id=test_id, grade=grade or '', school_id=school_id)
+        .values('question_group_id', 'question_group__group_number', 'participant_count',
+                'average_score', 'correct_rate', 'distribution')
+    )
+    if not rows and not QuestionGroupStatistics.objects.filter(test_id=test_id).exists():
+        from tests.models import TestDefinition
+
+        test = TestDefinition.objects.filter(id=test_id).first()
+        if test is None:
+            return {}
+        try:
+            rebuild_question_group_statistics(test)
+        except IntegrityError:
+            # 同時に集計された場合は保存済みの結果を読む
+            pass
+        rows = list(
+            QuestionGroupStatistics.objects.filter(test_id=test_id, grade=grade or '', school_id=school_id)
+            .values('question_group_id', 'question_group__group_number', 'participant_count',
+                    'average_score', 'correct_rate', 'distribution')
+        )
+
+    stats = {
+        row['question_group_id']: {
+            'group_number': row['question_group__group_number'],
+            'participant_count': row['participant_count'],
+            'average_score': float(row['average_score']),
+            'correct_rate': float(row['correct_rate']),
+            'distribution': row['distribution'],
+        }
+        for row in rows
+    }
+    cache.set(_lookup_key(test_id, grade, school_id), stats, CACHE_TIMEOUT)
+    return stats
+
+
+def get_question_averages_by_number(test_id, grade: str = '', school_id=None) -> dict:
+    """大問番号 -> 平均点 の辞書（CSV・詳細結果向けの簡易参照）"""
+    return {
+        item['group_number']: item['average_score']
+        for item in get_question_group_statistics(test_id, grade, school_id).values()
+    }
+
+
+def get_grade_result_statistics(test_ids) -> dict:
+    """
+    テスト×学年ごとの合計点統計を {(test_id, grade): {...}} で返す
+
+    平均・標準偏差・受験者数をテスト単位でキャッシュし、未キャッシュのテストのみ1クエリで集計する。
+    キャッシュは大問別統計と同じバージョンで無効化される。
+    """
+    from django.db.models import Avg, Count, StdDev
+    from .models import TestResult
+
+    stats = {}
+    missing = []
+    for test_id in set(test_ids):
+        cached = cache.get(_lookup_key(test_id, 'grade-results', None))
+        if cached is None:
+            missing.append(test_id)
+            continue
+        for grade, values in cached.items():
+            stats[(test_id, grade)] = values
+
+    if missing:
+        computed = defaultdict(dict)
+        for row in TestResult.objects.filter(test_id__in=missing).values('test_id', 'student__grade').annotate(
+            avg=Avg('total_score'), std_dev=StdDev('total_score'), count=Count('id')
+        ):
+            computed[row['test_id']][row['student__grade']] = {
+                'average': float(row['avg'] or 0),
+                'std_dev': float(row['std_dev'] or 0),
+                'count': row['count'],
+            }
+        for test_id in missing:
+            grades = computed.get(test_id, {})
+            cache.set(_lookup_key(test_id, 'grade-results', None), grades, CACHE_TIMEOUT)
+            for grade, values in grades.items():
+                stats[(test_id, grade)] = values
+
+    return stats
@@ -5,11 +5,27 @@
 from django.http import HttpResponse
 from django.template.loader import render_to_string
 from django.conf import settings
+from autograder.data_versions import conditional_on_data_version, results_etag_scopes
 from .utils import get_individual_report_data
 import os
-from datetime import datetime
+from datetime import date, datetime
 
 
+def report_preview_scope(request):
+    """帳票プレビューのETagスコープ（発行日を埋め込むため日付も含める）"""
+    from students.models import Student
+
+    year, period = request.GET.get('year'), request.GET.get('period')
+    if not year or not period:
+        return None
+    student_id = request.GET.get('studentId')
+    school = None
+    if student_id:
+        school = Student.objects.filter(student_id=student_id).values_list('classroom__school_id', flat=True).first()
+    return results_etag_scopes(year, period, school), (date.today().isoformat(),)
+
+
+@conditional_on_data_version(report_preview_scope)
 def preview_individual_report(request):
     """個別成績表HTML印刷プレビュー（認証不要）"""
     student_id = request.GET.get('studentId')
@@ -55,6 +71,7 @@ def preview_individual_report(request):
     return HttpResponse(html_content, content_type='text/html; charset=utf-8')
 
 
+@conditional_on_data_version(report_preview_scope)
 def preview_bulk_reports(request):
     """一括成績表HTML印刷プレビュー（認証不要）"""
     year = request.GET.get('year')
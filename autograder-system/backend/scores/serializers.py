@@ -5,17 +5,18 @@ from .models import (
 )
 from students.serializers import StudentSerializer
 from tests.serializers import TestDefinitionSerializer
+from autograder.field_selection import SparseFieldsSerializerMixin
 
-class ScoreSerializer(serializers.ModelSerializer):
+class ScoreSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     student_name = serializers.CharField(source='student.name', read_only=True)
     test_name = serializers.CharField(source='test.name', read_only=True)
-    question_title = serializers.CharField(source='question.group.title', read_only=True)
+    question_title = serializers.CharField(source='question_group.title', read_only=True, allow_null=True)
     
     class Meta:
         model = Score
         fields = '__all__'
 
-class TestResultSerializer(serializers.ModelSerializer):
+class TestResultSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     student_name = serializers.CharField(source='student.name', read_only=True)
     student_id = serializers.CharField(source='student.student_id', read_only=True)
     test_name = serializers.CharField(source='test.name', read_only=True)
@@ -0,0 +1,66 @@
+"""
+成績データのDjangoシグナル
+
+得点・テスト結果・コメント・テスト構成の書き込みを検知し、データバージョンを進める。
+（条件付きGETの ETag とレスポンスキャッシュのキーに使われる）
+"""
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from autograder.data_versions import (
+    mark_student_test_changed, mark_results_changed, mark_schedules_changed, mark_tests_changed
+)
+from tests.models import TestSchedule, TestDefinition, QuestionGroup, Question
+from .models import (
+    Score, TestResult, TestAttendance, StudentComment, TestComment, SubjectGeneralComment,
+    CommentTemplate, CommentTemplateV2,
+)
+
+STUDENT_TEST_MODELS = (Score, TestResult, TestAttendance, StudentComment, TestComment, SubjectGeneralComment)
+COMMENT_TEMPLATE_MODELS = (CommentTemplate, CommentTemplateV2)
+
+
+def student_test_changed(sender, instance, **kwargs):
+    """生徒×テスト単位のデータが変わった（得点・結果・出欠・コメント）"""
+    # テスト指定のない総合コメントは生徒の全期間が対象になる
+    mark_student_test_changed(instance.student_id, instance.test_id)
+
+
+def comment_template_changed(sender, instance, **kwargs):
+    """コメントテンプレートは全帳票に影響するため全体のバージョンを進める"""
+    mark_results_changed()
+
+
+for model in STUDENT_TEST_MODELS:
+    post_save.connect(student_test_changed, sender=model, dispatch_uid=f'data_version_{model.__name__}_save')
+    post_delete.connect(student_test_changed, sender=model, dispatch_uid=f'data_version_{model.__name__}_delete')
+
+for model in COMMENT_TEMPLATE_MODELS:
+    post_save.connect(comment_template_changed, sender=model, dispatch_uid=f'data_version_{model.__name__}_save')
+    post_delete.connect(comment_template_changed, sender=model, dispatch_uid=f'data_version_{model.__name__}_delete')
+
+
+@receiver(post_save, sender=TestDefinition)
+@receiver(post_delete, sender=TestDefinition)
+def test_definition_changed(sender, instance, **kwargs):
+    """テスト構成の変更は日程内の全塾に影響する"""
+    schedule = instance.schedule
+    mark_results_changed(schedule.year, schedule.period)
+    mark_tests_changed()
+
+
+@receiver(post_save, sender=QuestionGroup)
+@receiver(post_delete, sender=QuestionGroup)
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def test_structure_changed(sender, instance, **kwargs):
+    mark_tests_changed()
+
+
+@receiver(post_save, sender=TestSchedule)
+@receiver(post_delete, sender=TestSchedule)
+def test_schedule_changed(sender, instance, **kwargs):
+    """日程一覧（available_periods）と日程内の成績表示に影響する"""
+    mark_schedules_changed()
+    mark_tests_changed()
+    mark_results_changed(instance.year, instance.period)
@@ -1,3 +1,174 @@
+from itertools import product
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from classrooms.models import Classroom
+from schools.models import School
+from students.models import Student
+from tests.models import QuestionGroup, TestDefinition, TestSchedule
+
+from .comment_resolver import DEFAULT_PRINCIPAL_COMMENT, resolve_principal_comments
+from .models import (
+    CommentTemplateV2, Score, StudentComment, SubjectGeneralComment, TestComment,
+)
+
+
+def legacy_principal_comment(student, test):
+    """従来の _get_principal_comment の優先順位（1件ずつ .first() で照会）"""
+    subject_comment = SubjectGeneralComment.objects.filter(student=student, test=test, subject=test.subject).first()
+    if subject_comment and subject_comment.comment_text:
+        return subject_comment.comment_text
+
+    test_comment = TestComment.objects.filter(student=student, test=test, scope='test_overall').first()
+    if test_comment and test_comment.content:
+        return test_comment.content
+
+    score_total = Score.objects.filter(
+        student=student, test=test, attendance=True
+    ).aggregate(total=Sum('score'))['total'] or 0
+    subject_jp = {'japanese': '国語', 'math': '算数'}.get(test.subject, test.subject)
+    template = CommentTemplateV2.objects.filter(
+        subject_filter=subject_jp,
+        score_range_min__lte=score_total,
+        score_range_max__gte=score_total,
+        is_active=True,
+    ).first()
+    if template and template.template_text:
+        return template.template_text
+
+    student_comment = StudentComment.objects.filter(student=student, test=test, comment_type='general').first()
+    if student_comment and student_comment.content:
+        return student_comment.content
+
+    return DEFAULT_PRINCIPAL_COMMENT
+
+
+class PrincipalCommentResolverTests(TestCase):
+    """一括解決（comment_resolver）と従来の1件ずつの解決の優先順位が一致すること"""
+
+    def setUp(self):
+        now = timezone.now()
+        School.objects.bulk_create([School(school_id='100001', name='テスト塾')])
+        school = School.objects.get()
+        Classroom.objects.bulk_create([Classroom(classroom_id='100001', name='テスト教室', school=school)])
+        classroom = Classroom.objects.get()
+        schedule = TestSchedule.objects.create(
+            year=2026, period='summer', planned_date=now.date(), actual_date=now.date(), deadline_at=now
+        )
+        TestDefinition.objects.bulk_create([
+            TestDefinition(schedule=schedule, grade_level='elementary_1', subject=subject, max_score=100)
+            for subject in ('japanese', 'math')
+        ])
+        self.tests = list(TestDefinition.objects.order_by('id'))
+        Student.objects.bulk_create([Student(student_id='S1', name='生徒', classroom=classroom, grade='1')])
+        self.student = Student.objects.get()
+        for test in self.tests:
+            question_group = QuestionGroup.objects.create(test=test, group_number=1, title='大問', max_score=100)
+            Score.objects.create(student=self.student, test=test, question_group=question_group, score=45)
+
+        # 照合されないテンプレート（科目違い・科目未設定・範囲外・範囲の片側なし・無効）
+        for subject_filter, low, high, active in [
+            ('国語', 0, 100, True), ('', 0, 100, True), ('算数', 60, 100, True),
+            ('算数', None, 100, True), ('算数', 0, 100, False),
+        ]:
+            self.create_template(f'対象外 {subject_filter} {low}-{high}', subject_filter, low, high, is_active=active)
+
+    def create_template(self, text, subject_filter='算数', low=0, high=100, is_active=True):
+        return CommentTemplateV2.objects.create(
+            title='テンプレート', category='neutral', applicable_scope='any', template_text=text,
+            subject_filter=subject_filter, score_range_min=low, score_range_max=high, is_active=is_active,
+        )
+
+    def test_priority_matches_legacy_resolver(self):
+        math = self.tests[1]
+        subject_comments = [None, '', '教科別コメント']
+        test_comments = [[], ['', 'テスト全体コメント'], ['テスト全体コメント']]
+        templates = [[], ['', '得点テンプレート'], ['得点テンプレート']]
+        general_comments = [[], ['', '総合コメント'], ['総合コメント']]
+
+        for subject_comment, test_texts, template_texts, general_texts in product(
+            subject_comments, test_comments, templates, general_comments
+        ):
+            with self.subTest(subject=subject_comment, test=test_texts, template=template_texts, general=general_texts):
+                with transaction.atomic():
+                    if subject_comment is not None:
+                        SubjectGeneralComment.objects.create(
+                            student=self.student, test=math, subject='math', score=45, comment_text=subject_comment
+                        )
+                    for content in test_texts:
+                        TestComment.objects.create(student=self.student, test=math, content=content)
+                    for text in template_texts:
+                        self.create_template(text, low=40, high=50)
+                    for content in general_texts:
+                        StudentComment.objects.create(
+                            student=self.student, test=math, title='総合', content=content, created_by='テスト'
+                        )
+                    StudentComment.objects.create(
+                        student=self.student, test=math, comment_type='academic', title='学習',
+                        content='対象外の種別', created_by='テスト',
+                    )
+
+                    expected = legacy_principal_comment(self.student, math)
+                    resolved = resolve_principal_comments([(self.student, math, None)])
+                    self.assertEqual(resolved[(self.student.id, math.id)], expected)
+                    transaction.set_rollback(True)
+
+    def test_batch_resolves_each_subject_separately(self):
+        japanese, math = self.tests
+        SubjectGeneralComment.objects.create(
+            student=self.student, test=japanese, subject='japanese', score=45, comment_text='国語の手動コメント'
+        )
+        self.create_template('算数テンプレート', low=40, high=50)
+
+        resolved = resolve_principal_comments([(self.student, japanese, None), (self.student, math, 45)])
+        self.assertEqual(resolved[(self.student.id, japanese.id)], legacy_principal_comment(self.student, japanese))
+        self.assertEqual(resolved[(self.student.id, math.id)], legacy_principal_comment(self.student, math))
+        self.assertEqual(resolved[(self.student.id, math.id)], '算数テンプレート')
+
+
+class IntegratedResultsCacheTests(TestCase):
+    """生徒の変更でレスポンスキャッシュが参照されなくなること"""
+
+    def setUp(self):
+        cache.clear()
+        now = timezone.now()
+        School.objects.bulk_create([School(school_id='100001', name='テスト塾')])
+        self.school = School.objects.get()
+        Classroom.objects.bulk_create([Classroom(classroom_id='100001', name='テスト教室', school=self.school)])
+        schedule = TestSchedule.objects.create(
+            year=2026, period='summer', planned_date=now.date(), actual_date=now.date(), deadline_at=now
+        )
+        test = TestDefinition.objects.create(schedule=schedule, grade_level='elementary_1', subject='math', max_score=100)
+        question_group = QuestionGroup.objects.create(test=test, group_number=1, title='大問', max_score=100)
+        Student.objects.bulk_create([Student(student_id='1', name='変更前', classroom=Classroom.objects.get(), grade='1')])
+        self.student = Student.objects.get()
+        Score.objects.create(student=self.student, test=test, question_group=question_group, score=45)
+        self.client = APIClient()
+        self.client.force_authenticate(
+            get_user_model().objects.create_superuser(username='admin', password='x', email='a@example.com')
+        )
+
+    def student_names(self):
+        response = self.client.get(
+            '/api/test-results/integrated_student_results/',
+            {'year': 2026, 'period': 'summer', 'school': self.school.pk},
+        )
+        return [row['student_name'] for row in response.json()['results']]
+
+    def test_student_edit_misses_cached_response(self):
+        self.assertEqual(self.student_names(), ['変更前'])
+        # シグナルを通らない更新ではキャッシュ済みのレスポンスが返る
+        Student.objects.filter(pk=self.student.pk).update(name='未通知')
+        self.assertEqual(self.student_names(), ['変更前'])
 
-# Create your tests here.
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.student.name = '変更後'
+                self.student.save()
+        self.assertEqual(self.student_names(), ['変更後'])
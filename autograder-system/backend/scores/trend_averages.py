@@ -0,0 +1,111 @@
+"""
+成績推移グラフ用の平均点キャッシュ
+
+締切済みの日程は結果が変わらないため、(日程, 学年, 教科) ごとの平均点を順位確定時に
+一度だけ TrendAverage へ保存する。推移データの組み立ては保存済みの値を辞書で引くだけになる。
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+from django.db.models import Avg, Count, Sum
+
+COMBINED = ''
+
+
+def _aggregate(schedule_ids, grade: str | None = None) -> dict:
+    """
+    {(schedule_id, grade, subject): (平均点, 受験者数)} を集計する
+
+    subject が空文字のキーは生徒ごとの全教科合計の平均。
+    """
+    from .models import TestResult
+
+    base = TestResult.objects.filter(test__schedule_id__in=list(schedule_ids))
+    if grade is not None:
+        base = base.filter(student__grade=grade)
+
+    aggregated = {}
+    for row in base.values('test__schedule_id', 'student__grade', 'test__subject').annotate(
+        avg=Avg('total_score'), count=Count('id')
+    ):
+        key = (row['test__schedule_id'], row['student__grade'], row['test__subject'])
+        aggregated[key] = (float(row['avg'] or 0), row['count'])
+
+    combined = defaultdict(lambda: [0, 0])
+    for row in base.values('test__schedule_id', 'student__grade', 'student').annotate(total=Sum('total_score')):
+        entry = combined[(row['test__schedule_id'], row['student__grade'], COMBINED)]
+        entry[0] += row['total'] or 0
+        entry[1] += 1
+    for key, (total, count) in combined.items():
+        aggregated[key] = (total / count if count else 0.0, count)
+
+    return aggregated
+
+
+def populate_trend_averages(schedule, force: bool = False) -> dict:
+    """
+    締切済み日程の推移用平均点を保存する
+
+    既に保存済みの日程は何もしない（force=True の場合のみ作り直す）。
+    """
+    from .models import TrendAverage
+
+    schedule_id = getattr(schedule, 'id', schedule)
+    exists = TrendAverage.objects.filter(schedule_id=schedule_id).exists()
+    if exists and not force:
+        return {'created': 0, 'reason': 'already_populated'}
+
+    records = [
+        TrendAverage(
+            schedule_id=sid,
+            grade=grade or '',
+            subject=subject or '',
+            average_score=Decimal(str(avg)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP),
+            participant_count=count,
+        )
+        for (sid, grade, subject), (avg, count) in _aggregate([schedule_id]).items()
+    ]
+
+    # 削除と再作成の間に参照されても、日程の平均点が欠けて見えないようにする
+    with transaction.atomic():
+        if force:
+            TrendAverage.objects.filter(schedule_id=schedule_id).delete()
+        TrendAverage.objects.bulk_create(records, ignore_conflicts=True)
+    return {'created': len(records)}
+
+
+def get_trend_averages(schedule_ids, grade: str) -> dict:
+    """
+    {(schedule_id, subject): 平均点} を返す（subject='' は合算）
+
+    保存済みの日程は1クエリで取得し、未確定の日程のみその場で集計する（保存はしない）。
+    """
+    from .models import TrendAverage
+
+    schedule_ids = set(schedule_ids)
+    if not schedule_ids:
+        return {}
+
+    averages = {}
+    stored = set()
+    for schedule_id, subject, average in TrendAverage.objects.filter(
+        schedule_id__in=schedule_ids, grade=grade
+    ).values_list('schedule_id', 'subject', 'average_score'):
+        averages[(schedule_id, subject)] = float(average)
+        stored.add(schedule_id)
+
+    pending = schedule_ids - stored
+    if pending:
+        # 保存済みだがこの学年の受験者がいなかった日程は集計し直さない
+        pending -= set(
+            TrendAverage.objects.filter(schedule_id__in=pending)
+            .values_list('schedule_id', flat=True).distinct()
+        )
+    if pending:
+        for (schedule_id, _, subject), (avg, _) in _aggregate(pending, grade=grade).items():
+            averages[(schedule_id, subject)] = avg
+
+    return averages
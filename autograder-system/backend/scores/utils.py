@@ -6,17 +6,17 @@ from django.db import transaction
 from django.conf import settings
 from django.utils import timezone
 from decimal import Decimal
+import bisect
 import io
 import json
 import os
 import zipfile
 import statistics
-import tempfile
 from datetime import datetime
 
 import pandas as pd
 
-from .models import Score, TestResult, CommentTemplate, StudentComment, TestComment, SubjectGeneralComment
+from .models import Score, TestResult, CommentTemplate, SubjectGeneralComment
 from schools.models import School
 from students.models import Student
 from tests.models import TestDefinition, QuestionGroup
@@ -75,6 +75,11 @@ def calculate_test_results(student, test, force_temporary=False):
         test=test,
         defaults=defaults
     )
+
+    # 大問別統計は再集計待ちにする（参照時には再集計せず、締切後処理の定期実行
+    # rebuild_stale_question_group_statistics でまとめて再集計する）
+    from .question_statistics import mark_question_group_statistics_stale
+    mark_question_group_statistics_stale(test.id)
     
     return result
 
@@ -283,18 +288,25 @@ def bulk_calculate_test_results(test, force_recalculate=False):
             attendance=True
         ).values('student').annotate(
             total_score=Sum('score')
-        ).select_related('student')
+        ).order_by('student')
+
+        # 学生・既存結果はまとめて取得（1件ずつ引かない）
+        student_totals = {row['student']: row['total_score'] or 0 for row in student_scores}
+        students = Student.objects.select_related('classroom__school').in_bulk(student_totals.keys())
+        existing_results = {
+            result.student_id: result
+            for result in TestResult.objects.filter(test=test, student_id__in=student_totals.keys())
+        }
 
         # 学生別の合計点辞書を作成
         score_dict = {}
         students_data = []
 
-        for score_data in student_scores:
-            student_id = score_data['student']
-            total_score = score_data['total_score'] or 0
-
+        for student_id, total_score in student_totals.items():
             try:
-                student = Student.objects.get(id=student_id)
+                student = students.get(student_id)
+                if student is None:
+                    raise Student.DoesNotExist
                 score_dict[student_id] = total_score
 
                 # 正答率計算
@@ -318,6 +330,12 @@ def bulk_calculate_test_results(test, force_recalculate=False):
         test_results_to_update = []
         test_results_to_create = []
 
+        # 締切状況確認
+        is_deadline_passed = timezone.now() > test.schedule.deadline_at
+
+        # コメントは (塾, 点数) ごとに1回だけ検索
+        comments = {}
+
         for student_data in students_data:
             student = student_data['student']
             total_score = student_data['total_score']
@@ -327,18 +345,17 @@ def bulk_calculate_test_results(test, force_recalculate=False):
             rankings = rankings_data.get(student.id, {})
 
             # コメント生成
-            comment = generate_comment(
-                student.classroom.school if student.classroom else None,
-                test.subject,
-                total_score
-            )
-
-            # 締切状況確認
-            is_deadline_passed = timezone.now() > test.schedule.deadline_at
+            school = student.classroom.school if student.classroom else None
+            comment_key = (school.id if school else None, total_score)
+            if comment_key not in comments:
+                comments[comment_key] = generate_comment(school, test.subject, total_score)
+            comment = comments[comment_key]
 
             # TestResultの既存レコードを確認
             try:
-                test_result = TestResult.objects.get(student=student, test=test)
+                test_result = existing_results.get(student.id)
+                if test_result is None:
+                    raise TestResult.DoesNotExist
                 # 既存レコードを更新
                 test_result.total_score = total_score
                 test_result.correct_rate = correct_rate
@@ -413,9 +430,55 @@ def bulk_calculate_test_results(test, force_recalculate=False):
             TestResult.objects.bulk_create(test_results_to_create)
             print(f"新規作成: {len(test_results_to_create)}件")
 
+    # 大問別統計を事前集計（帳票・詳細結果・CSVはこれを参照する）
+    from .question_statistics import rebuild_question_group_statistics
+    rebuild_question_group_statistics(test)
+
+    # 一括更新はシグナルを経由しないため、日程単位でデータバージョンを進める
+    from autograder.data_versions import mark_results_changed
+    mark_results_changed(test.schedule.year, test.schedule.period)
+
     print(f"=== 一括集計完了: {test} ===")
     return len(students_data)
 
+def finalize_test_result_ranks(test):
+    """
+    指定テストの一時的順位を確定順位にまとめてコピー（テストごとに1回の UPDATE）
+
+    未確定の結果のみ対象。後方互換フィールドも TestResult.save と同じく一時的順位から更新する。
+
+    Returns:
+        int: 確定した結果の件数
+    """
+    from django.db.models import F
+
+    now = timezone.now()
+    finalized = TestResult.objects.filter(test=test, is_rank_finalized=False).update(
+        school_rank_final=F('school_rank_temporary'),
+        national_rank_final=F('national_rank_temporary'),
+        school_total_final=F('school_total_temporary'),
+        national_total_final=F('national_total_temporary'),
+        school_rank=F('school_rank_temporary'),
+        national_rank=F('national_rank_temporary'),
+        school_total_students=F('school_total_temporary'),
+        national_total_students=F('national_total_temporary'),
+        is_rank_finalized=True,
+        rank_finalized_at=now,
+        updated_at=now,
+    )
+
+    if finalized:
+        # UPDATE はシグナルを経由しないため、日程単位でデータバージョンを進める
+        from autograder.data_versions import mark_results_changed
+        mark_results_changed(test.schedule.year, test.schedule.period)
+
+    return finalized
+
+def _competition_rank(ascending_scores, score):
+    """昇順の点数リストでの順位（自分より高い点数の人数 + 1、同点は同順位）"""
+    return len(ascending_scores) - bisect.bisect_right(ascending_scores, score) + 1
+
+
 def calculate_bulk_rankings(students_data, test):
     """学生データから一括で順位を計算"""
     rankings_data = {}
@@ -444,17 +507,13 @@ def calculate_bulk_rankings(students_data, test):
         grade_groups[grade].append(student_data)
 
     # 全国順位計算
+    national_scores = sorted(data['total_score'] for data in students_data)
     for i, student_data in enumerate(sorted_students):
         student = student_data['student']
         total_score = student_data['total_score']
 
         # 全国順位（同点は同順位）
-        national_rank = 1
-        for other_data in sorted_students:
-            if other_data['total_score'] > total_score:
-                national_rank += 1
-            else:
-                break
+        national_rank = _competition_rank(national_scores, total_score)
 
         rankings_data[student.id] = {
             'national_rank': national_rank,
@@ -463,39 +522,25 @@ def calculate_bulk_rankings(students_data, test):
 
     # 塾別順位計算
     for school_id, school_students in school_groups.items():
-        school_sorted = sorted(school_students, key=lambda x: x['total_score'], reverse=True)
+        school_scores = sorted(data['total_score'] for data in school_students)
 
         for student_data in school_students:
             student = student_data['student']
             total_score = student_data['total_score']
 
-            school_rank = 1
-            for other_data in school_sorted:
-                if other_data['total_score'] > total_score:
-                    school_rank += 1
-                else:
-                    break
-
-            rankings_data[student.id]['school_rank'] = school_rank
-            rankings_data[student.id]['school_total'] = len(school_sorted)
+            rankings_data[student.id]['school_rank'] = _competition_rank(school_scores, total_score)
+            rankings_data[student.id]['school_total'] = len(school_scores)
 
     # 学年順位計算
     for grade, grade_students in grade_groups.items():
-        grade_sorted = sorted(grade_students, key=lambda x: x['total_score'], reverse=True)
+        grade_scores = sorted(data['total_score'] for data in grade_students)
 
         for student_data in grade_students:
             student = student_data['student']
             total_score = student_data['total_score']
 
-            grade_rank = 1
-            for other_data in grade_sorted:
-                if other_data['total_score'] > total_score:
-                    grade_rank += 1
-                else:
-                    break
-
-            rankings_data[student.id]['grade_rank'] = grade_rank
-            rankings_data[student.id]['grade_total'] = len(grade_sorted)
+            rankings_data[student.id]['grade_rank'] = _competition_rank(grade_scores, total_score)
+            rankings_data[student.id]['grade_total'] = len(grade_scores)
 
     return rankings_data
 
@@ -526,7 +571,6 @@ def create_beautiful_word_report(report_data):
     A3横向きサイズで見やすいレイアウト
     """
     try:
-        import tempfile
         import os
         from datetime import datetime
         try:
@@ -758,72 +802,9 @@ def create_bar_chart(doc, subject_data):
     得点と平均点の比較棒グラフを生成してWordに挿入
     """
     try:
-        import matplotlib.pyplot as plt
-        import matplotlib
-        matplotlib.use('Agg')
-        import numpy as np
-        import os
-        from django.conf import settings
-        from docx.shared import Cm
-        from docx.enum.text import WD_ALIGN_PARAGRAPH
-        
-        # 日本語フォント設定
-        matplotlib.rcParams['font.family'] = ['DejaVu Sans', 'Hiragino Sans', 'Yu Gothic', 'Meiryo', 'Takao', 'IPAexGothic', 'IPAPGothic', 'VL PGothic', 'Noto Sans CJK JP']
-        
-        # データ準備
-        categories = ['全国', '塾内']
-        my_scores = [subject_data['total_score'], subject_data['total_score']]
-        averages = [subject_data['average_score'], subject_data['school_average']]
-        
-        x = np.arange(len(categories))
-        width = 0.35
-        
-        # グラフ作成
-        fig, ax = plt.subplots(figsize=(8, 5))
-        bars1 = ax.bar(x - width/2, my_scores, width, label='あなたの得点', color='#1f73b5')
-        bars2 = ax.bar(x + width/2, averages, width, label='平均点', color='#ff7f0e')
-        
-        # 軸とラベル設定
-        ax.set_xlabel('比較対象')
-        ax.set_ylabel('得点')
-        ax.set_title(f'{subject_data["name"]} 得点比較')
-        ax.set_xticks(x)
-        ax.set_xticklabels(categories)
-        ax.legend()
-        ax.grid(True, alpha=0.3)
-        
-        # 棒の上に数値表示
-        for bar in bars1:
-            height = bar.get_height()
-            ax.text(bar.get_x() + bar.get_width()/2., height + 1,
-                   f'{height:.0f}', ha='center', va='bottom')
-        
-        for bar in bars2:
-            height = bar.get_height()
-            ax.text(bar.get_x() + bar.get_width()/2., height + 1,
-                   f'{height:.1f}', ha='center', va='bottom')
-        
-        # 保存
-        media_reports_dir = os.path.join(settings.MEDIA_ROOT, 'reports')
-        os.makedirs(media_reports_dir, exist_ok=True)
-        chart_path = os.path.join(media_reports_dir, f'bar_{subject_data["name"]}_{np.random.randint(1000, 9999)}.png')
-        
-        plt.tight_layout()
-        plt.savefig(chart_path, dpi=150, bbox_inches='tight')
-        plt.close()
-        
-        # Wordに挿入
-        paragraph = doc.add_paragraph()
-        run = paragraph.runs[0] if paragraph.runs else paragraph.add_run()
-        run.add_picture(chart_path, width=Cm(12))  # チャートサイズ縮小
-        paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        
-        # 一時ファイル削除
-        try:
-            os.remove(chart_path)
-        except:
-            pass
-            
+        from .charts import score_comparison_chart, add_chart_to_docx
+
+        add_chart_to_docx(doc, score_comparison_chart(subject_data), width_cm=12)  # チャートサイズ縮小
     except Exception as e:
         print(f"棒グラフ生成エラー: {str(e)}")
 
@@ -1654,18 +1635,6 @@ def _register_pdf_fonts() -> None:
     PDF_FONTS_REGISTERED = True
 
 
-def _calculate_combined_average(grade: str, year: int, period: str) -> float:
-    grade_totals = TestResult.objects.filter(
-        test__schedule__year=year,
-        test__schedule__period=period,
-        student__grade=grade
-    ).values('student').annotate(total=Sum('total_score'))
-    if not grade_totals:
-        return 0.0
-    total_sum = sum(item['total'] for item in grade_totals)
-    return float(total_sum / len(grade_totals))
-
-
 def _calculate_combined_metrics(student: Student, year: int, period: str, total_score: float) -> dict:
     base_qs = TestResult.objects.filter(
         test__schedule__year=year,
@@ -1729,58 +1698,61 @@ def _calculate_combined_metrics(student: Student, year: int, period: str, total_
 
 
 def _collect_trend_data(student: Student, grade_level: str) -> dict:
+    from .trend_averages import get_trend_averages, COMBINED
+
     if not grade_level:
         return {'overall': [], 'subjects': {}}
 
     results_qs = TestResult.objects.filter(
         student=student,
         test__grade_level=grade_level
-    ).select_related('test__schedule').order_by('test__schedule__year', 'test__schedule__period')
+    ).values_list(
+        'test__schedule_id', 'test__schedule__year', 'test__schedule__period', 'test__subject', 'total_score'
+    )
 
     timeline: dict[tuple[int, str], dict] = {}
-    for result in results_qs:
-        schedule = result.test.schedule
-        key = (schedule.year, schedule.period)
+    for schedule_id, year_value, period_value, subject_code, total_score in results_qs:
+        key = (year_value, period_value)
         entry = timeline.setdefault(key, {
-            'label': f"{str(schedule.year)[2:]}{_short_period_label(schedule.period)}",
+            'schedule_id': schedule_id,
+            'label': f"{str(year_value)[2:]}{_short_period_label(period_value)}",
             'subjects': {},
         })
-        entry['subjects'][result.test.subject] = result.total_score
+        entry['subjects'][subject_code] = total_score
 
     sorted_keys = sorted(timeline.keys(), key=lambda x: (x[0], PERIOD_ORDER.get(x[1], 9)))
 
+    # 確定済み日程の平均点は保存済みの値を使う
+    averages = get_trend_averages({entry['schedule_id'] for entry in timeline.values()}, student.grade)
+
     overall_trend = []
     subject_trend: dict[str, list] = {}
 
-    for year_value, period_value in sorted_keys:
-        entry = timeline[(year_value, period_value)]
+    for key in sorted_keys:
+        entry = timeline[key]
         subject_scores = [score for score in entry['subjects'].values() if score is not None]
         total_score = sum(subject_scores)
-        overall_average = _calculate_combined_average(student.grade, year_value, period_value)
         overall_trend.append({
             'label': entry['label'],
             'score': total_score,
-            'average': overall_average,
+            'average': averages.get((entry['schedule_id'], COMBINED), 0.0),
         })
 
         for subject_code, score in entry['subjects'].items():
-            subject_avg = TestResult.objects.filter(
-                test__schedule__year=year_value,
-                test__schedule__period=period_value,
-                test__subject=subject_code,
-                student__grade=student.grade
-            ).aggregate(avg=Avg('total_score'))['avg'] or 0
             subject_trend.setdefault(subject_code, [])
             subject_trend[subject_code].append({
                 'label': entry['label'],
                 'score': score,
-                'average': float(subject_avg),
+                'average': averages.get((entry['schedule_id'], subject_code), 0.0),
             })
 
     return {'overall': overall_trend, 'subjects': subject_trend}
 
 
 def _collect_individual_report_data(student_id: str, year: int, period: str) -> tuple[dict | None, str | None]:
+    from .question_statistics import get_question_group_statistics
+    from .comment_resolver import resolve_principal_comments
+
     student = Student.objects.select_related('classroom__school').filter(student_id=student_id).first()
     if not student:
         return None, '対象の生徒が見つかりません'
@@ -1832,7 +1804,6 @@ def _collect_individual_report_data(student_id: str, year: int, period: str) ->
     subjects_data = {}
 
     # 手動保存されたコメントを一括取得
-    from .models import SubjectGeneralComment
     manual_comments = {
         c.test_id: c.comment_text
         for c in SubjectGeneralComment.objects.filter(student=student, test__in=tests)
@@ -1850,19 +1821,10 @@ def _collect_individual_report_data(student_id: str, year: int, period: str) ->
         student_scores = {score.question_group_id: score for score in student_scores_qs}
         attended = any(score.attendance for score in student_scores_qs)
 
-        group_averages = {
-            item['question_group_id']: item['avg']
-            for item in Score.objects.filter(test=test)
-            .values('question_group_id')
-            .annotate(avg=Avg('score'))
-        }
-
-        # 問題ごとの学年平均
+        # 問題ごとの学年平均（事前集計済みの大問別統計から取得）
         grade_group_averages = {
-            item['question_group_id']: item['avg']
-            for item in Score.objects.filter(test=test, student__grade=student.grade, attendance=True)
-            .values('question_group_id')
-            .annotate(avg=Avg('score'))
+            group_id: item['average_score']
+            for group_id, item in get_question_group_statistics(test.id, grade=student.grade).items()
         }
 
         subject_results_qs = TestResult.objects.filter(test=test)
@@ -1941,6 +1903,16 @@ def _collect_individual_report_data(student_id: str, year: int, period: str) ->
     if not subject_entries:
         return None, '成績データが見つかりません'
 
+    # 塾長コメントを教科分まとめて解決
+    principal_comments = resolve_principal_comments([
+        (student, test, results_map[test.id].total_score)
+        for test in tests if test.id in results_map and test.subject in subjects_data
+    ])
+    for test in tests:
+        comment = principal_comments.get((student.id, test.id))
+        if comment and test.subject in subjects_data:
+            subjects_data[test.subject]['principal_comment'] = comment
+
     subject_entries.sort(key=lambda code: SUBJECT_ORDER.get(code, 99))
 
     total_score = sum(subjects_data[code]['total_score'] for code in subject_entries)
@@ -2007,52 +1979,44 @@ def _format_score(value) -> str:
 
 
 def _generate_trend_chart(points: list[dict], title: str) -> str | None:
-    if len(points) < 2:
-        return None
-    try:
-        import matplotlib
-        matplotlib.use('Agg')
-        import matplotlib.pyplot as plt
-        matplotlib.rcParams['font.family'] = [
-            'Noto Sans CJK JP', 'Yu Gothic', 'Hiragino Sans', 'Meiryo',
-            'IPAexGothic', 'TakaoGothic', 'MS Gothic', 'DejaVu Sans'
-        ]
-        labels = [p['label'] for p in points]
-        scores = [p['score'] for p in points]
-        averages = [p.get('average', 0) for p in points]
-        fig, ax = plt.subplots(figsize=(3.3, 2.0), dpi=160)
-        ax.plot(labels, scores, marker='o', linewidth=2, label='あなた')
-        if any(averages):
-            ax.plot(labels, averages, marker='o', linestyle='--', linewidth=1.6, label='平均')
-        ax.set_title(title)
-        ax.grid(True, alpha=0.3)
-        ax.set_ylim(bottom=0)
-        ax.legend(fontsize=8, loc='lower right')
-        fig.tight_layout()
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.png')
-        fig.savefig(temp_file.name, transparent=True)
-        plt.close(fig)
-        return temp_file.name
-    except Exception:
-        return None
+    """得点推移の折れ線グラフをSVG文字列で返す（WeasyPrintにそのまま埋め込める）"""
+    from .charts import score_trend_chart
+
+    chart = score_trend_chart(points, title)
+    return chart.to_svg() if chart else None
 
 
 def get_individual_report_data(student_id: str, year: str, period: str) -> dict | None:
-    """個別成績表データ取得（HTML用）"""
-    report_data, error = _collect_individual_report_data(student_id, int(year), period)
-    if error or not report_data:
-        return None
-    return _prepare_template_data(report_data, '')
+    """個別成績表データ取得（HTML用）
+
+    生徒の塾・日程のデータバージョン単位でキャッシュする（得点・コメントの更新で無効化）。
+    """
+    from autograder.data_versions import results_etag_scopes
+    from autograder.response_cache import get_or_set_versioned
+
+    def build():
+        report_data, error = _collect_individual_report_data(student_id, int(year), period)
+        if error or not report_data:
+            return None
+        return _prepare_template_data(report_data, '')
+
+    school = Student.objects.filter(student_id=student_id).values_list('classroom__school_id', flat=True).first()
+    return get_or_set_versioned(
+        'individual_report', results_etag_scopes(year, period, school), (student_id, year, period), build
+    )
 
 
 def _get_principal_comment(student_id: str, year: int, period: str, subject: str) -> str:
-    """塾長コメントを取得（登録されたコメントを優先、なければテンプレート、最後にデフォルト）"""
-    default_comment = '今回の結果は、未来へのヒントです。今の努力が、これからの可能性を広げていきます。'
+    """塾長コメントを取得（登録されたコメントを優先、なければテンプレート、最後にデフォルト）
+
+    単発呼び出し用。複数件をまとめて扱う場合は comment_resolver.resolve_principal_comments を使う。
+    """
+    from .comment_resolver import resolve_principal_comments, DEFAULT_PRINCIPAL_COMMENT
 
     # 生徒とテストを取得
     student = Student.objects.filter(student_id=student_id).first()
     if not student:
-        return default_comment
+        return DEFAULT_PRINCIPAL_COMMENT
 
     # 該当する学年レベルのテストを取得
     grade_level = get_grade_level_from_student_grade(student.grade)
@@ -2066,138 +2030,17 @@ def _get_principal_comment(student_id: str, year: int, period: str, subject: str
 
     test = tests.first()
     if not test:
-        return default_comment
-
-    # 1. SubjectGeneralCommentから保存されたオリジナルコメントを取得
-    from .models import SubjectGeneralComment, CommentTemplateV2
-    subject_comment = SubjectGeneralComment.objects.filter(
-        student=student,
-        test=test,
-        subject=subject
-    ).first()
-
-    if subject_comment and subject_comment.comment_text:
-        return subject_comment.comment_text
-
-    # 2. TestCommentからテスト全体のコメントを取得（後方互換性）
-    test_comment = TestComment.objects.filter(
-        student=student,
-        test=test,
-        scope='test_overall'
-    ).first()
-
-    if test_comment and test_comment.content:
-        return test_comment.content
-
-    # 3. 点数に応じたCommentTemplateV2を取得
-    # まず得点を取得
-    from .models import Score
-    from django.db.models import Sum
-    score_total = Score.objects.filter(
-        student=student,
-        test=test,
-        attendance=True
-    ).aggregate(total=Sum('score'))['total'] or 0
-
-    # subject を日本語に変換（CommentTemplateV2のsubject_filterは日本語）
-    subject_jp_map = {
-        'japanese': '国語',
-        'math': '算数'
-    }
-    subject_jp = subject_jp_map.get(subject, subject)
-
-    # テンプレートを取得（得点範囲でフィルタ）
-    template = CommentTemplateV2.objects.filter(
-        subject_filter=subject_jp,
-        score_range_min__lte=score_total,
-        score_range_max__gte=score_total,
-        is_active=True
-    ).first()
-
-    if template and template.template_text:
-        return template.template_text
-
-    # 4. StudentCommentから総合コメントを取得（フォールバック）
-    student_comment = StudentComment.objects.filter(
-        student=student,
-        test=test,
-        comment_type='general'
-    ).first()
+        return DEFAULT_PRINCIPAL_COMMENT
 
-    if student_comment and student_comment.content:
-        return student_comment.content
-
-    return default_comment
+    return resolve_principal_comments([(student, test, None)])[(student.id, test.id)]
 
 
 def _generate_svg_bar_chart(scores: list[float], avg_score: float, color: str, chart_id: str, max_score: float = 100) -> str:
     """成績推移の棒グラフをSVGで生成"""
-    if not scores:
-        return ''
-
-    svg_parts = [
-        f'<svg viewBox="0 0 200 140" class="line-chart" id="{chart_id}" xmlns="http://www.w3.org/2000/svg">',
-        '<!-- グリッド線と軸ラベル -->',
-        '<line x1="40" y1="20" x2="40" y2="110" stroke="#bdc3c7" stroke-width="2"/>',
-        '<line x1="40" y1="110" x2="190" y2="110" stroke="#bdc3c7" stroke-width="2"/>',
-        '<!-- Y軸ラベル -->',
-        '<text x="20" y="20" font-size="9" fill="#666">100</text>',
-        '<text x="20" y="65" font-size="9" fill="#666">50</text>',
-        '<text x="28" y="115" font-size="9" fill="#666">0</text>',
-        '<!-- グリッド線 -->',
-        '<line x1="40" y1="20" x2="190" y2="20" stroke="#e0e0e0" stroke-width="1" stroke-dasharray="2,2"/>',
-        '<line x1="40" y1="65" x2="190" y2="65" stroke="#e0e0e0" stroke-width="1" stroke-dasharray="2,2"/>',
-    ]
-
-    min_score = 0
-    bar_width = 25
-    spacing = 50
+    from .charts import score_history_chart
 
-    # 棒グラフとラベルを生成
-    for index, score in enumerate(scores):
-        x = 60 + (index * spacing)
-        bar_height = ((score - min_score) / (max_score - min_score)) * 90
-        y = 110 - bar_height
-
-        # 棒グラフ
-        svg_parts.append(
-            f'<rect x="{x - bar_width/2}" y="{y}" width="{bar_width}" height="{bar_height}" '
-            f'fill="{color}" opacity="0.8"/>'
-        )
-
-        # 点数表示
-        svg_parts.append(
-            f'<text x="{x}" y="{y - 5}" text-anchor="middle" font-size="10" fill="{color}" '
-            f'font-weight="700">{round(score)}</text>'
-        )
-
-        # 回数ラベル
-        svg_parts.append(
-            f'<text x="{x}" y="130" text-anchor="middle" font-size="10" fill="#666" '
-            f'font-weight="600">{index + 1}回</text>'
-        )
-
-    # 学年平均の星印とライン
-    avg_y = 110 - ((avg_score - min_score) / (max_score - min_score)) * 90
-    for index in range(len(scores)):
-        x = 60 + (index * spacing)
-
-        # 星印
-        svg_parts.append(
-            f'<text x="{x}" y="{avg_y + 4}" text-anchor="middle" font-size="14" fill="#ffd700" '
-            f'filter="drop-shadow(0 0 2px rgba(0,0,0,0.3))">★</text>'
-        )
-
-        # 星を線で繋ぐ（2回目以降）
-        if index > 0:
-            prev_x = 60 + ((index - 1) * spacing)
-            svg_parts.insert(11,  # グリッド線の後に挿入
-                f'<line x1="{prev_x}" y1="{avg_y}" x2="{x}" y2="{avg_y}" '
-                f'stroke="#ffd700" stroke-width="2" stroke-dasharray="4,3"/>'
-            )
-
-    svg_parts.append('</svg>')
-    return '\n'.join(svg_parts)
+    chart = score_history_chart(scores, avg_score, color, chart_id, max_score)
+    return chart.to_svg() if chart else ''
 
 
 def _prepare_template_data(report_data: dict, logo_path: str) -> dict:
@@ -2349,8 +2192,8 @@ def _prepare_template_data(report_data: dict, logo_path: str) -> dict:
         # コメント
         'math_comment': math_data.get('comment') or 'この科目では、基礎から応用まで幅広い問題に取り組みました。今後も継続した学習を心がけましょう。',
         'japanese_comment': japanese_data.get('comment') or 'この科目では、読解力や表現力を総合的に評価しました。引き続き努力を続けてください。',
-        'principal_math_comment': _get_principal_comment(student_info['id'], test_info['year'], test_info['period'], 'math'),
-        'principal_japanese_comment': _get_principal_comment(student_info['id'], test_info['year'], test_info['period'], 'japanese'),
+        'principal_math_comment': math_data.get('principal_comment') or _get_principal_comment(student_info['id'], test_info['year'], test_info['period'], 'math'),
+        'principal_japanese_comment': japanese_data.get('principal_comment') or _get_principal_comment(student_info['id'], test_info['year'], test_info['period'], 'japanese'),
 
         # 推移
         'trends': json.dumps(trends),
@@ -2432,13 +2275,8 @@ def generate_individual_report_template(student_id: str, year: int, period: str,
         return {'success': False, 'error': f'未対応の出力形式です: {format_type}'}
 
 
-def generate_bulk_reports_template(student_ids: list[str], year: int, period: str, format_type: str = 'pdf') -> dict:
-    if not student_ids:
-        return {'success': False, 'error': '生徒IDが指定されていません'}
-
-    generated_files = []
-    errors = []
-
+def _iter_bulk_report_files(student_ids: list[str], year: int, period: str, format_type: str, errors: list[str]):
+    """生徒ごとに帳票ファイルを生成し、完成した順にファイルパスを返す"""
     for student_id in student_ids:
         report_data, data_error = _collect_individual_report_data(student_id, year, period)
         if data_error:
@@ -2456,23 +2294,36 @@ def generate_bulk_reports_template(student_ids: list[str], year: int, period: st
             else:
                 errors.append(f"{student_id}: 未対応の出力形式です ({format_type})")
                 continue
-
-            generated_files.append(file_path)
         except Exception as exc:  # noqa: BLE001
             errors.append(f"{student_id}: {exc}")
+            continue
 
-    if not generated_files:
-        return {'success': False, 'error': errors[0] if errors else '帳票生成に失敗しました'}
+        yield file_path
 
-    reports_dir = _ensure_reports_dir()
-    zip_name = "individual_reports_{year}_{period}_{stamp}.zip".format(
+
+def _bulk_report_zip_name(year: int, period: str) -> str:
+    return "individual_reports_{year}_{period}_{stamp}.zip".format(
         year=year,
         period=period,
         stamp=datetime.now().strftime('%Y%m%d_%H%M%S')
     )
-    zip_path = os.path.join(reports_dir, zip_name)
 
-    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+
+def generate_bulk_reports_template(student_ids: list[str], year: int, period: str, format_type: str = 'pdf') -> dict:
+    if not student_ids:
+        return {'success': False, 'error': '生徒IDが指定されていません'}
+
+    errors: list[str] = []
+    generated_files = list(_iter_bulk_report_files(student_ids, year, period, format_type, errors))
+
+    if not generated_files:
+        return {'success': False, 'error': errors[0] if errors else '帳票生成に失敗しました'}
+
+    reports_dir = _ensure_reports_dir()
+    zip_path = os.path.join(reports_dir, _bulk_report_zip_name(year, period))
+
+    # PDF/docxは圧縮済みのためSTOREDで格納する
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED) as zip_file:
         for file_path in generated_files:
             arcname = os.path.basename(file_path)
             zip_file.write(file_path, arcname)
@@ -2493,3 +2344,36 @@ def generate_bulk_reports_template(student_ids: list[str], year: int, period: st
         response['warnings'] = errors
 
     return response
+
+
+def iter_bulk_report_zip_members(student_ids: list[str], year: int, period: str, format_type: str = 'pdf'):
+    """
+    ストリーミングZIP用のメンバー反復子
+
+    1生徒分の帳票が完成するたびに (ファイル名, bytes) を返し、読み込み後は
+    中間ファイルを削除する。エラーがあった場合は末尾に errors.txt を付与する。
+    """
+    errors: list[str] = []
+    for file_path in _iter_bulk_report_files(student_ids, year, period, format_type, errors):
+        try:
+            with open(file_path, 'rb') as f:
+                data = f.read()
+        except OSError as exc:
+            errors.append(f"{os.path.basename(file_path)}: {exc}")
+            continue
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+        yield os.path.basename(file_path), data
+
+    if errors:
+        yield 'errors.txt', '\n'.join(errors).encode('utf-8')
+
+
+def stream_bulk_reports_template(student_ids: list[str], year: int, period: str, format_type: str = 'pdf'):
+    """一括帳票をZIPとしてストリーミング配信するレスポンスを返す"""
+    from autograder.zip_stream import streaming_zip_response
+
+    members = iter_bulk_report_zip_members(student_ids, year, period, format_type)
+    return streaming_zip_response(members, _bulk_report_zip_name(year, period))
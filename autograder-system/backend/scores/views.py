@@ -4,11 +4,20 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.renderers import JSONRenderer
 from django.shortcuts import render
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
 from django.http import HttpResponseRedirect, HttpResponse
 from django.db import models
+from autograder.pagination import AdaptivePagination
+from autograder.data_versions import (
+    conditional_on_data_version, results_etag_scopes, SCHEDULES_SCOPE
+)
+from autograder.scoping import get_role_scope, is_classroom_page
+from autograder.response_cache import cached_by_data_version
+from autograder.field_selection import SparseFieldsViewMixin, ColumnarJSONRenderer
+from .report_views import report_preview_scope
 from .models import (
     Score, TestResult, CommentTemplate, CommentTemplateV2, StudentComment, TestComment, SubjectGeneralComment,
     QuestionScore, TestAttendance, IndividualProblem, IndividualProblemScore
@@ -20,9 +29,44 @@ from .serializers import (
     IndividualProblemSerializer, IndividualProblemScoreSerializer
 )
 
-class ScoreViewSet(viewsets.ModelViewSet):
+
+# --- 条件付きGET（ETag）のスコープ ---
+
+def _available_periods_scope(request):
+    return [SCHEDULES_SCOPE], ()
+
+
+def _integrated_results_scope(request):
+    year, period = request.GET.get('year'), request.GET.get('period')
+    if not year or not period:
+        return None
+    scope = get_role_scope(request)
+    if scope.is_school_admin or (scope.is_classroom_admin and is_classroom_page(request)):
+        school = scope.school_pk
+    else:
+        school = request.GET.get('school')
+    return results_etag_scopes(year, period, school), ()
+
+
+def _detailed_results_scope(request):
+    scope = get_role_scope(request)
+    year, period = request.GET.get('year'), request.GET.get('period')
+    if request.GET.get('test'):
+        year = period = None
+    if scope.is_classroom_admin and is_classroom_page(request):
+        school = scope.school_pk
+    elif not scope.is_classroom_admin:
+        school = request.GET.get('school')
+    else:
+        school = None
+    return results_etag_scopes(year, period, school), ()
+
+
+class ScoreViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     serializer_class = ScoreSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = AdaptivePagination
+    renderer_classes = [JSONRenderer, ColumnarJSONRenderer]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['test', 'student', 'attendance']
     search_fields = ['student__name', 'student__student_id']
@@ -223,12 +267,9 @@ class ScoreViewSet(viewsets.ModelViewSet):
                     'error': 'year と period パラメータが必要です'
                 }, status=400)
 
-            from students.models import Student, StudentEnrollment
-            from tests.models import TestDefinition, TestSchedule, QuestionGroup
-            from django.db.models import Q
-            import pandas as pd
-            import tempfile
-            import os
+            from students.models import StudentEnrollment
+            from tests.models import TestSchedule
+            from .exports import stream_csv_response, iter_student_score_export_rows, PERIOD_DISPLAY
 
             # 指定された年度・期間のテストスケジュールを取得
             try:
@@ -243,83 +284,12 @@ class ScoreViewSet(viewsets.ModelViewSet):
             enrollments = StudentEnrollment.objects.filter(
                 year=int(year),
                 period=period
-            ).select_related('student', 'student__classroom', 'student__classroom__school')
-
-            # ユーザーの権限に応じてフィルタリング
-            user = request.user
-            if user.role == 'school_admin' and hasattr(user, 'school_id'):
-                enrollments = enrollments.filter(
-                    student__classroom__school__school_id=user.school_id
-                )
-            elif user.role == 'classroom_admin' and hasattr(user, 'classroom_id'):
-                enrollments = enrollments.filter(
-                    student__classroom__classroom_id=user.classroom_id
-                )
-
-            # 全テスト定義を取得
-            test_definitions = TestDefinition.objects.filter(schedule=schedule)
-
-            # 大問グループ情報を事前に取得
-            question_groups_by_test = {}
-            for test_def in test_definitions:
-                question_groups = list(QuestionGroup.objects.filter(test=test_def).order_by('group_number'))
-                question_groups_by_test[test_def.id] = question_groups
-
-            # CSVのカラムを動的に生成
-            columns = ['塾ID', '塾名', '教室ID', '教室名', '生徒ID', '生徒名', '学年', '年度', '期間', '出席']
-
-            # 教科ごとの大問列を追加（大問数が最も多いテストを使用して重複を防ぐ）
-            subject_columns = {}
-            subject_max_questions = {}  # 各教科の最大大問数を記録
-
-            for test_def in test_definitions:
-                subject_display = test_def.get_subject_display()
-                question_groups = question_groups_by_test[test_def.id]
-
-                # 各教科で最も大問数が多いテスト構造を使用
-                if subject_display not in subject_max_questions or len(question_groups) > subject_max_questions[subject_display]:
-                    subject_max_questions[subject_display] = len(question_groups)
-                    subject_columns[subject_display] = []
-
-                    for qg in question_groups:
-                        subject_columns[subject_display].append(f'{subject_display}_大問{qg.group_number}')
-
-
-            # カラムを追加（国語、算数の順）
-            for subject in ['国語', '算数', '英語', '数学']:
-                if subject in subject_columns:
-                    columns.extend(subject_columns[subject])
-
-
-            # 全ての生徒IDを取得
-            student_ids = [enrollment.student.id for enrollment in enrollments]
-
-            # 全生徒の全スコアを一括取得（N+1問題を解決）
-            all_scores = Score.objects.filter(
-                student__id__in=student_ids,
-                test__schedule=schedule
-            ).select_related('student', 'test', 'question_group').values(
-                'student_id',
-                'test_id',
-                'question_group_id',
-                'score',
-                'attendance',
-                'question_group__group_number'
             )
 
-            # スコアを辞書形式で整理: student_id -> test_id -> question_group_id -> score_data
-            scores_dict = {}
-            for score_data in all_scores:
-                student_id = score_data['student_id']
-                test_id = score_data['test_id']
-                qg_id = score_data['question_group_id']
-
-                if student_id not in scores_dict:
-                    scores_dict[student_id] = {}
-                if test_id not in scores_dict[student_id]:
-                    scores_dict[student_id][test_id] = {}
-
-                scores_dict[student_id][test_id][qg_id] = score_data
+            # ユーザーの権限に応じてフィルタリング（教室の主キーで絞り込む）
+            scope = get_role_scope(request)
+            if scope.is_school_admin or scope.is_classroom_admin:
+                enrollments = scope.filter_classrooms(enrollments, 'student__classroom')
 
             # 登録がない場合のチェック
             if not enrollments.exists():
@@ -328,74 +298,14 @@ class ScoreViewSet(viewsets.ModelViewSet):
                     'error': f'{year}年度{period}期の登録生徒が見つかりません。権限設定を確認してください。'
                 }, status=404)
 
-            # データ行を生成
-            data_rows = []
-
-            for enrollment in enrollments:
-                student = enrollment.student
-
-                row_data = {
-                    '塾ID': student.classroom.school.school_id if student.classroom else '',
-                    '塾名': student.classroom.school.name if student.classroom else '',
-                    '教室ID': student.classroom.classroom_id if student.classroom else '',
-                    '教室名': student.classroom.name if student.classroom else '',
-                    '生徒ID': student.student_id,
-                    '生徒名': student.name,
-                    '学年': student.grade,
-                    '年度': year,
-                    '期間': {'spring': '春期', 'summer': '夏期', 'winter': '冬期'}.get(period, period),
-                    '出席': '出席',  # デフォルトは出席
-                }
-
-                total_score = 0
-                student_scores = scores_dict.get(student.id, {})
-
-                # 各教科の点数を取得
-                for test_def in test_definitions:
-                    subject_display = test_def.get_subject_display()
-                    question_groups = question_groups_by_test[test_def.id]
-                    test_scores = student_scores.get(test_def.id, {})
-
-                    # 生徒のこの教科のテストの全スコアを取得
-                    for qg in question_groups:
-                        col_name = f'{subject_display}_大問{qg.group_number}'
-
-                        # 既存の点数を辞書から取得（キーはquestion_group_id）
-                        score_data = test_scores.get(qg.id)
-
-                        if score_data:
-                            row_data[col_name] = score_data['score']
-                            if not score_data['attendance']:
-                                row_data['出席'] = '欠席'
-                        else:
-                            row_data[col_name] = ''  # 未入力は空欄
-
-                data_rows.append(row_data)
-
-
-            # DataFrameを作成
-            df = pd.DataFrame(data_rows, columns=columns)
-
-            # CSVファイルとしてHTTPレスポンスを生成（BOM付きUTF-8）
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.csv', mode='w', encoding='utf-8-sig') as tmp_file:
-                df.to_csv(tmp_file, index=False)
-                tmp_file_path = tmp_file.name
-
-            try:
-                # ファイル名を生成
-                period_display = {'spring': '春期', 'summer': '夏期', 'winter': '冬期'}.get(period, period)
-                filename = f"生徒データ_得点入り_{year}年{period_display}.csv"
-
-                with open(tmp_file_path, 'rb') as f:
-                    response = HttpResponse(
-                        f.read(),
-                        content_type='text/csv; charset=utf-8-sig'
-                    )
-                    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-
-                return response
-            finally:
-                os.unlink(tmp_file_path)
+            # 受講登録と得点のカーソルを突き合わせながらCSVを配信（BOM付きUTF-8）
+            period_display = PERIOD_DISPLAY.get(period, period)
+            filename = f"生徒データ_得点入り_{year}年{period_display}.csv"
+            return stream_csv_response(
+                iter_student_score_export_rows(schedule, enrollments),
+                filename,
+                bom=True,
+            )
 
         except Exception as e:
             import traceback
@@ -665,9 +575,11 @@ class ScoreViewSet(viewsets.ModelViewSet):
                 'error': str(e)
             }, status=500)
 
-class TestResultViewSet(viewsets.ModelViewSet):
+class TestResultViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     serializer_class = TestResultSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = AdaptivePagination
+    renderer_classes = [JSONRenderer, ColumnarJSONRenderer]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['test', 'student']
     search_fields = ['student__name', 'student__student_id']
@@ -677,40 +589,31 @@ class TestResultViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         # 出席者のみを返す（欠席者は除外）
         # TestResultがあるということは出席者のスコアから生成されているため、基本的に出席者のみ
-        return TestResult.objects.all().select_related('student', 'test')
+        return TestResult.objects.all().select_related('student__classroom__school', 'test')
 
     @action(detail=False, methods=['get'], permission_classes=[])
+    @conditional_on_data_version(_available_periods_scope)
     def available_periods(self, request):
-        """利用可能な年度と期間の一覧を返す"""
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.info("available_periods called")
-        
-        from tests.models import TestSchedule
-
-        # 全てのTestScheduleから年度と期間を取得
-        schedules = TestSchedule.objects.all().values('year', 'period').distinct().order_by('-year', 'period')
+        """利用可能な年度と期間の一覧を返す（プロセス内の参照データキャッシュから返す）"""
+        from tests.reference_data import get_available_periods
 
-        # 年度のリストを作成
-        years = sorted(list(set([s['year'] for s in schedules])), reverse=True)
-
-        # 期間のリストを作成（期間の順序を定義）
-        period_order = {'spring': 1, 'summer': 2, 'winter': 3}
-        periods_set = set([s['period'] for s in schedules])
-        periods = sorted(list(periods_set), key=lambda x: period_order.get(x, 999))
-
-        return Response({
-            'years': years,
-            'periods': periods
-        })
+        return Response(get_available_periods())
 
     @action(detail=False, methods=['get'])
+    @conditional_on_data_version(_integrated_results_scope)
+    @cached_by_data_version(_integrated_results_scope)
     def integrated_student_results(self, request):
-        """生徒ID単位での統合テスト結果（国語・算数合算）"""
+        """
+        生徒ID単位での統合テスト結果（国語・算数合算）
+
+        ?page / ?page_size を指定した場合のみページ分割する（指定なしは従来どおり全件）。
+        ?ordering=total_score|grade|student_id|grade_rank|school_rank
+        （先頭に - で降順）。大問別の得点・平均は ?include=question_details 指定時のみ返す。
+        """
         import logging
-        from django.db.models import Avg, Sum, Count, Q
-        from .models import Score
-        from students.models import Student
+        from django.db.models import Q
+        from autograder.pagination import CustomPageNumberPagination, is_pagination_requested
+        from .integrated_results import IntegratedResultSet, fetch_subject_rankings, fetch_question_details
         
         logger = logging.getLogger(__name__)
         logger.info(f"integrated_student_results called with params: {request.query_params}")
@@ -731,15 +634,15 @@ class TestResultViewSet(viewsets.ModelViewSet):
             
             # リクエスト元を判別してフィルタリングを決定
             # classroom管理者かつclassroomページからのリクエストの場合のみ、自分の教室に制限
-            is_classroom_page = 'classroom' in request.META.get('HTTP_REFERER', '') or request.query_params.get('app_context') == 'classroom'
+            scope = get_role_scope(request)
 
-            if request.user.role == 'classroom_admin' and hasattr(request.user, 'classroom_id') and request.user.classroom_id and is_classroom_page:
+            if scope.is_classroom_admin and request.user.classroom_id and is_classroom_page(request):
                 # 教室管理者は自分の教室のみに制限
-                test_filter &= Q(student__classroom__classroom_id=request.user.classroom_id)
-            elif request.user.role == 'school_admin':
+                test_filter &= Q(student__classroom=scope.classroom_pk)
+            elif scope.is_school_admin:
                 # 塾管理者は必ず自分の塾のみに制限
-                if hasattr(request.user, 'school_id') and request.user.school_id:
-                    test_filter &= Q(student__classroom__school__school_id=request.user.school_id)
+                if request.user.school_id:
+                    test_filter &= Q(student__classroom__in=scope.classroom_pks)
                 else:
                     # school_idが取得できない場合はエラー
                     return Response({'error': 'School ID not found for this user'}, status=403)
@@ -753,210 +656,100 @@ class TestResultViewSet(viewsets.ModelViewSet):
                 # 本番環境では厳密にするべきだが、現状のエラー回避のため
                 pass
             
-            # 生徒別の科目ごと合計点を計算
-            student_subject_totals = Score.objects.filter(test_filter).values(
-                'student__student_id',
-                'student__name', 
-                'student__grade',
-                'student__classroom__school__name',
-                'student__classroom__name',
-                'test__subject',
-                'attendance'
-            ).annotate(
-                subject_total=Sum('score'),
-                question_count=Count('question_group')
-            )
-            
-            # 生徒別にデータを整理
-            student_data = {}
-            
-            for record in student_subject_totals:
-                student_id = record['student__student_id']
-                subject = record['test__subject']
-                
-                if student_id not in student_data:
-                    student_data[student_id] = {
-                        'student_id': student_id,
-                        'student_name': record['student__name'],
-                        'grade': record['student__grade'],
-                        'school_name': record['student__classroom__school__name'],
-                        'classroom_name': record['student__classroom__name'],
-                        'subjects': {},
-                        'combined_total': 0
-                    }
-            
-                student_data[student_id]['subjects'][subject] = {
-                    'total_score': record['subject_total'],
-                    'question_count': record['question_count'],
-                    'attendance': record['attendance']
-                }
-                # 出席者のみ合計点に加算
-                if record['attendance']:
-                    student_data[student_id]['combined_total'] += (record['subject_total'] or 0)
-            
-            # 【最適化】全生徒の大問別得点を一括取得
-            all_question_scores = Score.objects.filter(
-                test_filter,
-                attendance=True
-            ).select_related('student', 'question_group').values(
-                'student__student_id',
-                'test__subject',
-                'question_group__group_number',
-                'score',
-                'question_group__max_score'
-            ).order_by('student__student_id', 'test__subject', 'question_group__group_number')
-
-            # 生徒別・科目別の大問得点を整理
-            student_question_scores = {}
-            for qs in all_question_scores:
-                student_id = qs['student__student_id']
-                subject = qs['test__subject']
-
-                if student_id not in student_question_scores:
-                    student_question_scores[student_id] = {}
-                if subject not in student_question_scores[student_id]:
-                    student_question_scores[student_id][subject] = []
-
-                student_question_scores[student_id][subject].append({
-                    'question_number': qs['question_group__group_number'],
-                    'score': qs['score'],
-                    'max_score': qs['question_group__max_score']
-                })
-
-            # 【最適化】大問別平均を一括計算（学年・科目・大問ごと）
-            all_question_averages = Score.objects.filter(
-                test__schedule__year=year,
-                test__schedule__period=period,
-                attendance=True
-            ).values(
-                'student__grade',
-                'test__subject',
-                'question_group__group_number'
-            ).annotate(
-                avg_score=Avg('score')
-            )
-
-            # 辞書形式で整理: grade -> subject -> question_number -> avg_score
-            question_avg_cache = {}
-            for q_avg in all_question_averages:
-                grade = q_avg['student__grade']
-                subject = q_avg['test__subject']
-                q_num = q_avg['question_group__group_number']
+            # 合算・教科別の順位はSQLのウィンドウ関数で算出し、1ページ分だけ取得する
+            result_set = IntegratedResultSet(test_filter, ordering=request.query_params.get('ordering'))
+            if is_pagination_requested(request):
+                paginator = CustomPageNumberPagination()
+                page = paginator.paginate_queryset(result_set, request, view=self)
+            else:
+                # ページ指定なしのクライアント（結果一覧・帳票ダウンロード画面）には全件を返す
+                paginator = None
+                page = result_set.fetch()
+            student_pks = [row['student_pk'] for row in page]
 
-                if grade not in question_avg_cache:
-                    question_avg_cache[grade] = {}
-                if subject not in question_avg_cache[grade]:
-                    question_avg_cache[grade][subject] = {}
+            students = Student.objects.filter(pk__in=student_pks).select_related('classroom__school')
+            students_by_pk = {student.pk: student for student in students}
+            subject_rankings = fetch_subject_rankings(test_filter, student_pks)
 
-                question_avg_cache[grade][subject][q_num] = q_avg['avg_score']
+            # 大問別の詳細は指定時のみ（?include=question_details）
+            include = set(filter(None, request.query_params.get('include', '').split(',')))
+            include_details = 'question_details' in include
+            if include_details:
+                question_details, question_averages = fetch_question_details(test_filter, student_pks)
 
-            # 各生徒の詳細情報を追加
             results = []
-
-            for student_id, data in student_data.items():
-                # 大問別得点を取得（既に一括取得済み）
-                detailed_scores = student_question_scores.get(student_id, {})
-                
-                # 学年ごとの順位と平均を計算
-                grade = data['grade']
-                
-                # 合算での学年順位（全国）
-                combined_grade_rank = len([s for s in student_data.values() 
-                                         if s['grade'] == grade and s['combined_total'] > data['combined_total']]) + 1
-                combined_grade_total = len([s for s in student_data.values() if s['grade'] == grade])
-                combined_grade_avg = sum([s['combined_total'] for s in student_data.values() if s['grade'] == grade]) / combined_grade_total if combined_grade_total > 0 else 0
-                
-                # 塾内順位と平均（同じ学校の生徒のみ）
-                school_students = [s for s in student_data.values() 
-                                 if s['grade'] == grade and s['school_name'] == data['school_name']]
-                combined_school_rank = len([s for s in school_students if s['combined_total'] > data['combined_total']]) + 1
-                combined_school_total = len(school_students)
-                combined_school_avg = sum([s['combined_total'] for s in school_students]) / combined_school_total if combined_school_total > 0 else 0
-                
-                # 科目別順位・平均
-                subject_rankings = {}
-                subject_averages = {}
-                
-                for subject in data['subjects'].keys():
-                    # 科目別学年順位（全国）
-                    subject_students = [s for s in student_data.values() 
-                                      if s['grade'] == grade and subject in s['subjects']]
-                    subject_score = data['subjects'][subject]['total_score']
-                    
-                    subject_grade_rank = len([s for s in subject_students 
-                                            if s['subjects'][subject]['total_score'] > subject_score]) + 1
-                    subject_grade_total = len(subject_students)
-                    subject_grade_avg = sum([s['subjects'][subject]['total_score'] for s in subject_students]) / subject_grade_total if subject_grade_total > 0 else 0
-                    
-                    # 科目別塾内順位
-                    subject_school_students = [s for s in subject_students 
-                                             if s['school_name'] == data['school_name']]
-                    subject_school_rank = len([s for s in subject_school_students 
-                                             if s['subjects'][subject]['total_score'] > subject_score]) + 1
-                    subject_school_total = len(subject_school_students)
-                    subject_school_avg = sum([s['subjects'][subject]['total_score'] for s in subject_school_students]) / subject_school_total if subject_school_total > 0 else 0
-                    
-                    subject_rankings[subject] = {
-                        'grade_rank': subject_grade_rank,
-                        'grade_total': subject_grade_total,
-                        'school_rank': subject_school_rank,
-                        'school_total': subject_school_total
-                    }
-                    
-                    subject_averages[subject] = {
-                        'grade_average': subject_grade_avg,
-                        'school_average': subject_school_avg
+            for row in page:
+                student = students_by_pk.get(row['student_pk'])
+                classroom = student.classroom if student else None
+                subjects = subject_rankings.get(row['student_pk'], {})
+
+                subject_results = {}
+                for subject, subject_row in subjects.items():
+                    subject_result = {
+                        'total_score': subject_row['subject_total'],
+                        'rankings': {
+                            'grade_rank': subject_row['grade_rank'],
+                            'grade_total': subject_row['grade_total'],
+                            'school_rank': subject_row['school_rank'],
+                            'school_total': subject_row['school_total'],
+                        },
+                        'averages': {
+                            'grade_average': float(subject_row['grade_average'] or 0),
+                            'school_average': float(subject_row['school_average'] or 0),
+                        },
+                        'attendance': subject_row['attended_count'] > 0,
                     }
+                    if include_details:
+                        subject_result['averages']['question_averages'] = (
+                            question_averages.get(row['student_pk'], {}).get(subject, {})
+                        )
+                        subject_result['question_details'] = (
+                            question_details.get(row['student_pk'], {}).get(subject, [])
+                        )
+                    subject_results[subject] = subject_result
 
-                    # 【最適化】大問別平均をキャッシュから取得
-                    subject_averages[subject]['question_averages'] = question_avg_cache.get(grade, {}).get(subject, {})
-                
                 results.append({
-                    'student_id': student_id,
-                    'student_name': data['student_name'],
-                    'grade': grade,
-                    'school_name': data['school_name'],
-                    'classroom_name': data['classroom_name'],
+                    'student_id': row['student_code'],
+                    'student_name': student.name if student else '',
+                    'grade': row['grade'],
+                    'school_name': classroom.school.name if classroom else '',
+                    'classroom_name': classroom.name if classroom else '',
                     'test_info': {
                         'year': int(year),
                         'period': period,
                     },
                     'combined_results': {
-                        'total_score': data['combined_total'],
-                        'grade_rank': combined_grade_rank,
-                        'grade_total': combined_grade_total,
-                        'grade_average': combined_grade_avg,
-                        'school_rank': combined_school_rank,
-                        'school_total': combined_school_total,
-                        'school_average': combined_school_avg,
-                        'attendance': any(data['subjects'][subject]['attendance'] for subject in data['subjects'].keys())
+                        'total_score': row['combined_total'],
+                        'grade_rank': row['grade_rank'],
+                        'grade_total': row['grade_total'],
+                        'grade_average': float(row['grade_average'] or 0),
+                        'school_rank': row['school_rank'],
+                        'school_total': row['school_total'],
+                        'school_average': float(row['school_average'] or 0),
+                        'attendance': bool(row['attended']),
                     },
-                    'subject_results': {
-                        subject: {
-                            'total_score': data['subjects'][subject]['total_score'],
-                            'rankings': subject_rankings[subject],
-                            'averages': subject_averages[subject],
-                            'question_details': detailed_scores.get(subject, []),
-                            'attendance': data['subjects'][subject]['attendance']
-                        } for subject in data['subjects'].keys()
-                    }
+                    'subject_results': subject_results,
                 })
-            # 合算点数でソート
-            results.sort(key=lambda x: x['combined_results']['total_score'], reverse=True)
-            
-            return Response({
-                'results': results,
-                'total_count': len(results),
-                'summary': {
-                    'year': int(year),
-                    'period': period,
-                    'subjects_available': list(set().union(*[list(r['subject_results'].keys()) for r in results])),
-                    'averages': {
-                        'grade': combined_grade_avg,
-                        'school': combined_school_avg
-                    }
+
+            subjects_available = list(
+                Score.objects.filter(test_filter).order_by().values_list('test__subject', flat=True).distinct()
+            )
+
+            if paginator is None:
+                response = Response({'results': results, 'total_count': len(results)})
+            else:
+                response = paginator.get_paginated_response(results)
+                response.data['total_count'] = paginator.page.paginator.count
+            response.data['summary'] = {
+                'year': int(year),
+                'period': period,
+                'subjects_available': subjects_available,
+                'averages': {
+                    'grade': results[0]['combined_results']['grade_average'] if results else 0,
+                    'school': results[0]['combined_results']['school_average'] if results else 0,
                 }
-            })
+            }
+            return response
 
         except Exception as e:
             import logging
@@ -970,10 +763,20 @@ class TestResultViewSet(viewsets.ModelViewSet):
             }, status=500)
     
     @action(detail=False, methods=['get'])
+    @conditional_on_data_version(_detailed_results_scope)
+    @cached_by_data_version(_detailed_results_scope)
     def detailed_results(self, request):
-        """生徒管理・帳票ダウンロード用の詳細データ"""
-        from django.db.models import Avg
+        """
+        生徒管理・帳票ダウンロード用の詳細データ
+
+        ?page / ?page_size を指定した場合のみページ分割する（指定なしは従来どおり全件）。
+        """
+        from bisect import bisect_right
+        from django.db.models import F, Window
+        from django.db.models.functions import RowNumber
+        from autograder.pagination import CustomPageNumberPagination, is_pagination_requested
         from .models import Score
+        from .question_statistics import get_question_averages_by_number, get_grade_result_statistics
         
         # フィルタパラメータ
         test_id = request.query_params.get('test')
@@ -987,10 +790,10 @@ class TestResultViewSet(viewsets.ModelViewSet):
         
         # リクエスト元を判別してフィルタリングを決定
         # classroom管理者かつclassroomページからのリクエストの場合のみ、自分の教室に制限
-        is_classroom_page = 'classroom' in request.META.get('HTTP_REFERER', '') or request.query_params.get('app_context') == 'classroom'
+        scope = get_role_scope(request)
         
-        if request.user.role == 'classroom_admin' and hasattr(request.user, 'classroom_id') and is_classroom_page:
-            queryset = queryset.filter(student__classroom__classroom_id=request.user.classroom_id)
+        if scope.is_classroom_admin and is_classroom_page(request):
+            queryset = scope.filter_own_classroom(queryset, 'student__classroom')
         
         if test_id:
             queryset = queryset.filter(test_id=test_id)
@@ -1008,91 +811,94 @@ class TestResultViewSet(viewsets.ModelViewSet):
         if student_id:
             queryset = queryset.filter(student__student_id=student_id)
         
-        # 重複を避けるため、教科・年度・期間の組み合わせごとに最高得点の結果のみ取得
-        unique_results = {}
-        
-        for test_result in queryset:
-            subject = test_result.test.get_subject_display()
-            year = test_result.test.schedule.year
-            period = test_result.test.schedule.period
-            
-            key = f"{subject}-{year}-{period}"
-            
-            # 同じキーで既存の結果がない、または現在の結果がより高い得点の場合のみ保持
-            if key not in unique_results or test_result.total_score > unique_results[key].total_score:
-                unique_results[key] = test_result
-        
+        # 重複を避けるため、教科・年度・期間の組み合わせごとに最高得点の結果のみ取得（DB側で判定）
+        queryset = queryset.annotate(
+            subject_rank=Window(
+                expression=RowNumber(),
+                partition_by=[F('test__subject'), F('test__schedule__year'), F('test__schedule__period')],
+                order_by=[F('total_score').desc(), F('id').asc()],
+            )
+        ).filter(subject_rank=1).select_related(
+            'student__classroom__school', 'test__schedule'
+        ).order_by('-test__schedule__year', 'test__schedule__period', 'test__subject', 'id')
+
+        if is_pagination_requested(request):
+            paginator = CustomPageNumberPagination()
+            page = paginator.paginate_queryset(queryset, request, view=self)
+        else:
+            # ページ指定なしのクライアント（教室管理画面など）には全件を返す
+            paginator = None
+            page = list(queryset)
+
+        # ページ内の大問別得点を一括取得（有効な得点のみ）
+        question_scores = {}
+        for score in Score.objects.filter(
+            student_id__in={r.student_id for r in page},
+            test_id__in={r.test_id for r in page},
+            attendance=True,
+            score__gte=0  # 0点以上の有効な得点のみ
+        ).select_related('question_group').order_by('question_group__group_number'):
+            question_scores.setdefault((score.student_id, score.test_id), []).append(score)
+
+        # 学年平均・標準偏差は統計レイヤーから取得
+        grade_stats = get_grade_result_statistics({r.test_id for r in page})
+
+        # 学年順位が保存されていない結果のみ、対象テスト×学年の得点一覧から算出
+        missing_rank_keys = {
+            (r.test_id, r.student.grade) for r in page if not (r.grade_rank and r.grade_total)
+        }
+        grade_score_lists = {}
+        if missing_rank_keys:
+            for t_id, grade, total in TestResult.objects.filter(
+                test_id__in={k[0] for k in missing_rank_keys},
+                student__grade__in={k[1] for k in missing_rank_keys},
+            ).values_list('test_id', 'student__grade', 'total_score'):
+                grade_score_lists.setdefault((t_id, grade), []).append(total)
+            for scores in grade_score_lists.values():
+                scores.sort()
+
         results = []
-        
-        for test_result in unique_results.values():
-            # 大問別得点を取得（有効な得点のみ）
-            question_scores = Score.objects.filter(
-                student=test_result.student,
-                test=test_result.test,
-                attendance=True,
-                score__gte=0  # 0点以上の有効な得点のみ
-            ).order_by('question_group__group_number')
-            
+
+        for test_result in page:
             question_details = []
             total_max_score = 0
-            for score in question_scores:
+            for score in question_scores.get((test_result.student_id, test_result.test_id), []):
                 question_details.append({
                     'question_number': score.question_group.group_number,
                     'score': score.score,
                     'max_score': score.question_group.max_score
                 })
                 total_max_score += score.question_group.max_score
-            
+
+            grade_key = (test_result.test_id, test_result.student.grade)
+
             # 学年順位（TestResultに既に保存されている順位を優先使用）
             if test_result.grade_rank and test_result.grade_total:
                 grade_rank = test_result.grade_rank
                 grade_total = test_result.grade_total
             else:
                 # 保存されていない場合は計算
-                grade_rank = TestResult.objects.filter(
-                    test=test_result.test,
-                    student__grade=test_result.student.grade,
-                    total_score__gt=test_result.total_score
-                ).count() + 1
-                
-                grade_total = TestResult.objects.filter(
-                    test=test_result.test,
-                    student__grade=test_result.student.grade
-                ).count()
-            
-            # 学年平均と標準偏差を計算
-            from django.db.models import StdDev
-            grade_stats = TestResult.objects.filter(
-                test=test_result.test,
-                student__grade=test_result.student.grade
-            ).aggregate(
-                avg=Avg('total_score'),
-                std_dev=StdDev('total_score')
-            )
-            grade_average = grade_stats['avg'] or 0
-            grade_std_dev = grade_stats['std_dev'] or 1  # 0で割ることを防ぐ
-            
+                scores = grade_score_lists.get(grade_key, [])
+                grade_rank = len(scores) - bisect_right(scores, test_result.total_score) + 1
+                grade_total = len(scores)
+
+            # 学年平均と標準偏差
+            stats = grade_stats.get(grade_key, {})
+            grade_average = stats.get('average') or 0
+            grade_std_dev = stats.get('std_dev') or 1  # 0で割ることを防ぐ
+
             # 偏差値を計算 (平均50, 標準偏差10)
             if grade_std_dev > 0 and grade_average > 0:
                 deviation_score = 50 + (test_result.total_score - grade_average) / grade_std_dev * 10
                 deviation_score = max(0, min(100, deviation_score))  # 0-100の範囲に制限
             else:
                 deviation_score = 50
-            
-            # 学年別大問平均を計算（有効な得点のみ）
-            question_averages = Score.objects.filter(
-                test=test_result.test,
-                student__grade=test_result.student.grade,
-                attendance=True,
-                score__gte=0  # 0点以上の有効な得点のみ
-            ).values('question_group__group_number').annotate(
-                avg_score=Avg('score')
-            ).order_by('question_group__group_number')
-            
-            question_avg_dict = {}
-            for q_avg in question_averages:
-                question_avg_dict[q_avg['question_group__group_number']] = q_avg['avg_score']
-            
+
+            # 学年別大問平均（事前集計済みの大問別統計から取得）
+            question_avg_dict = get_question_averages_by_number(
+                test_result.test_id, grade=test_result.student.grade
+            )
+
             results.append({
                 'id': test_result.id,
                 'student_id': test_result.student.student_id,
@@ -1131,20 +937,22 @@ class TestResultViewSet(viewsets.ModelViewSet):
                     'question_averages': question_avg_dict
                 }
             })
-        
-        return Response({
-            'results': results,
-            'total_count': len(results)
-        })
+
+        if paginator is None:
+            return Response({
+                'results': results,
+                'total_count': len(results)
+            })
+
+        response = paginator.get_paginated_response(results)
+        # 従来のクライアント向けに total_count も返す
+        response.data['total_count'] = paginator.page.paginator.count
+        return response
     
     @action(detail=False, methods=['get'])
     def export_data(self, request):
         """結果・データ出力用のCSVエクスポート"""
-        import csv
-        import io
-        from django.http import HttpResponse
-        from django.db.models import Avg
-        from .models import Score
+        from .exports import stream_csv_response, iter_test_result_export_rows
         
         # 同じフィルタロジックを使用
         test_id = request.query_params.get('test')
@@ -1156,10 +964,10 @@ class TestResultViewSet(viewsets.ModelViewSet):
         
         # リクエスト元を判別してフィルタリングを決定
         # classroom管理者かつclassroomページからのリクエストの場合のみ、自分の教室に制限
-        is_classroom_page = 'classroom' in request.META.get('HTTP_REFERER', '') or request.query_params.get('app_context') == 'classroom'
+        scope = get_role_scope(request)
         
-        if request.user.role == 'classroom_admin' and hasattr(request.user, 'classroom_id') and is_classroom_page:
-            queryset = queryset.filter(student__classroom__classroom_id=request.user.classroom_id)
+        if scope.is_classroom_admin and is_classroom_page(request):
+            queryset = scope.filter_own_classroom(queryset, 'student__classroom')
         
         if test_id:
             queryset = queryset.filter(test_id=test_id)
@@ -1173,93 +981,11 @@ class TestResultViewSet(viewsets.ModelViewSet):
         if school_id and request.user.role != 'classroom_admin':
             queryset = queryset.filter(student__classroom__school_id=school_id)
         
-        # CSVレスポンスを作成
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # ヘッダー行
-        headers = [
-            '生徒ID', '生徒名', '学年', '塾名', '教室名',
-            '合計点', '正答率(%)', '学年順位', '学年内総数', '学年平均点'
-        ]
-        
-        # 大問数を取得してヘッダーに追加
-        if queryset.exists():
-            sample_result = queryset.first()
-            question_count = Score.objects.filter(
-                student=sample_result.student,
-                test=sample_result.test,
-                attendance=True
-            ).count()
-            
-            for i in range(1, question_count + 1):
-                headers.extend([f'大問{i}得点', f'大問{i}平均'])
-        
-        writer.writerow(headers)
-        
-        # データ行
-        for test_result in queryset:
-            # 基本情報
-            row = [
-                test_result.student.student_id,
-                test_result.student.name,
-                f'{test_result.student.grade}年生',
-                test_result.student.classroom.school.name if test_result.student.classroom else '',
-                test_result.student.classroom.name if test_result.student.classroom else '',
-                test_result.total_score,
-                float(test_result.correct_rate),
-            ]
-            
-            # 学年順位と平均
-            grade_rank = TestResult.objects.filter(
-                test=test_result.test,
-                student__grade=test_result.student.grade,
-                total_score__gt=test_result.total_score
-            ).count() + 1
-            
-            grade_total = TestResult.objects.filter(
-                test=test_result.test,
-                student__grade=test_result.student.grade
-            ).count()
-            
-            grade_average = TestResult.objects.filter(
-                test=test_result.test,
-                student__grade=test_result.student.grade
-            ).aggregate(avg=Avg('total_score'))['avg'] or 0
-            
-            row.extend([grade_rank, grade_total, float(grade_average)])
-            
-            # 大問別得点と平均
-            question_scores = Score.objects.filter(
-                student=test_result.student,
-                test=test_result.test,
-                attendance=True
-            ).order_by('question_group__group_number')
-            
-            question_averages = Score.objects.filter(
-                test=test_result.test,
-                student__grade=test_result.student.grade,
-                attendance=True
-            ).values('question_group__group_number').annotate(
-                avg_score=Avg('score')
-            ).order_by('question_group__group_number')
-            
-            q_avg_dict = {}
-            for q_avg in question_averages:
-                q_avg_dict[q_avg['question_group__group_number']] = q_avg['avg_score']
-            
-            for score in question_scores:
-                q_num = score.question_group.group_number
-                q_avg = q_avg_dict.get(q_num, 0)
-                row.extend([score.score, float(q_avg)])
-            
-            writer.writerow(row)
-        
-        output.seek(0)
-        response = HttpResponse(output.getvalue(), content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="test_results_{year}_{period}.csv"'
-        
-        return response
+        # 行を生成しながらストリーミングで返す（集計値は事前に一括算出）
+        return stream_csv_response(
+            iter_test_result_export_rows(queryset),
+            f'test_results_{year}_{period}.csv'
+        )
     
 
 
@@ -1533,6 +1259,7 @@ class IndividualProblemScoreViewSet(viewsets.ModelViewSet):
             }, status=500)
 
     @action(detail=False, methods=['get'], permission_classes=[AllowAny], authentication_classes=[], url_path='preview-individual-report')
+    @conditional_on_data_version(report_preview_scope)
     def preview_individual_report(self, request):
         """個別成績表HTML印刷プレビュー"""
         from .utils import get_individual_report_data
@@ -1640,14 +1367,18 @@ document.addEventListener('keydown', function(e) {
     
     @action(detail=False, methods=['post'], permission_classes=[])
     def generate_bulk_reports(self, request):
-        """一括成績表帳票生成エンドポイント"""
-        from .utils import generate_bulk_reports_template
+        """一括成績表帳票生成エンドポイント
+
+        stream=true を指定すると、保存・URL返却の代わりにZIPを生成しながら直接返す。
+        """
+        from .utils import generate_bulk_reports_template, stream_bulk_reports_template
 
         try:
             student_ids = request.data.get('studentIds', [])
             year = request.data.get('year')
             period = request.data.get('period')
             format_type = request.data.get('format', 'pdf')
+            stream = str(request.data.get('stream', request.query_params.get('stream', ''))).lower() in ('1', 'true', 'yes')
 
             if not all([student_ids, year, period]):
                 return Response({
@@ -1661,6 +1392,14 @@ document.addEventListener('keydown', function(e) {
                     'error': 'studentIdsは空でない配列である必要があります'
                 }, status=400)
 
+            if stream:
+                return stream_bulk_reports_template(
+                    student_ids=student_ids,
+                    year=year,
+                    period=period,
+                    format_type=format_type
+                )
+
             result = generate_bulk_reports_template(
                 student_ids=student_ids,
                 year=year,
@@ -1677,6 +1416,7 @@ document.addEventListener('keydown', function(e) {
             }, status=500)
 
     @action(detail=False, methods=['get'], permission_classes=[AllowAny], authentication_classes=[], url_path='preview-bulk-reports')
+    @conditional_on_data_version(report_preview_scope)
     def preview_bulk_reports(self, request):
         """一括成績表HTML印刷プレビュー"""
         from .utils import get_individual_report_data
@@ -2349,11 +2089,10 @@ class CommentTemplateV2ViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         """塾・教室に応じたテンプレートを取得（優先順位: 教室 > 塾 > システム共有）"""
-        user = self.request.user
-        
-        # ユーザーの所属を取得
-        school_id = getattr(user, 'school_id', None)
-        classroom_id = getattr(user, 'classroom_id', None)
+        # ユーザーの所属を取得（外部キーと比較するため主キーで扱う）
+        scope = get_role_scope(self.request)
+        school_id = scope.school_pk
+        classroom_id = scope.classroom_pk
         
         # Q オブジェクトで条件を構築
         from django.db.models import Q
@@ -2417,8 +2156,10 @@ class CommentTemplateV2ViewSet(viewsets.ModelViewSet):
             )
 
         user = request.user
-        school_id = getattr(user, 'school_id', None)
-        classroom_id = getattr(user, 'classroom_id', None)
+        # テンプレートの塾・教室は外部キーなので、文字列コードではなく主キーを使う
+        scope = get_role_scope(request)
+        school_id = scope.school_pk
+        classroom_id = scope.classroom_pk
         
         category = f"{subject}_{score_range}"
         
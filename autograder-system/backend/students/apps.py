@@ -5,3 +5,7 @@ class StudentsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "students"
     verbose_name = "塾管理"
+
+    def ready(self):
+        """アプリが準備できた時にシグナルを登録"""
+        import students.signals
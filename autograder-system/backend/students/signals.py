@@ -0,0 +1,47 @@
+"""
+生徒データのDjangoシグナル
+
+生徒・受講情報の書き込みを検知し、データバージョンを進める。
+（生徒名・教室・学年は成績一覧・帳票・課金集計に含まれるため、条件付きGETの ETag と
+レスポンスキャッシュが古い内容を返さないようにする）
+"""
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from autograder.data_versions import mark_results_changed
+from classrooms.models import Classroom
+from .models import Student, StudentEnrollment
+
+
+def _school_of_classroom(classroom_id):
+    return Classroom.objects.filter(pk=classroom_id).values_list('school_id', flat=True).first()
+
+
+@receiver(pre_save, sender=Student)
+def remember_previous_school(sender, instance, **kwargs):
+    """教室移動（塾をまたぐ場合を含む）を検知するため、保存前の所属塾を控える"""
+    instance._previous_school_id = None
+    if instance.pk is not None:
+        instance._previous_school_id = Student.objects.filter(pk=instance.pk).values_list(
+            'classroom__school_id', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+def student_changed(sender, instance, **kwargs):
+    """生徒情報の変更は所属塾の全期間に影響する（移動時は移動元の塾も進める）"""
+    school_id = _school_of_classroom(instance.classroom_id)
+    mark_results_changed(school=school_id)
+    previous_school_id = getattr(instance, '_previous_school_id', None)
+    if previous_school_id is not None and previous_school_id != school_id:
+        mark_results_changed(school=previous_school_id)
+
+
+@receiver(post_save, sender=StudentEnrollment)
+@receiver(post_delete, sender=StudentEnrollment)
+def student_enrollment_changed(sender, instance, **kwargs):
+    school_id = Student.objects.filter(pk=instance.student_id).values_list(
+        'classroom__school_id', flat=True
+    ).first()
+    mark_results_changed(instance.year, instance.period, school_id)
@@ -1,3 +1,35 @@
 from django.test import TestCase
 
-# Create your tests here.
+from autograder.data_versions import get_data_version, results_scope
+from classrooms.models import Classroom
+from schools.models import School
+
+from .models import Student
+
+
+class StudentDataVersionTests(TestCase):
+    """生徒の変更で所属塾のデータバージョンが進むこと"""
+
+    def setUp(self):
+        School.objects.bulk_create([School(school_id='100001', name='塾A'), School(school_id='100002', name='塾B')])
+        self.school_a, self.school_b = School.objects.order_by('id')
+        Classroom.objects.bulk_create([
+            Classroom(classroom_id='100001', name='教室A', school=self.school_a),
+            Classroom(classroom_id='200001', name='教室B', school=self.school_b),
+        ])
+        self.classroom_a, self.classroom_b = Classroom.objects.order_by('id')
+        Student.objects.bulk_create([Student(student_id='1', name='生徒', classroom=self.classroom_a, grade='1')])
+        self.student = Student.objects.get()
+
+    def versions(self):
+        return [get_data_version(results_scope(school=school.pk)) for school in (self.school_a, self.school_b)]
+
+    def test_transfer_bumps_old_and_new_school(self):
+        before = self.versions()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student.classroom = self.classroom_b
+            self.student.save()
+
+        after = self.versions()
+        self.assertGreater(after[0], before[0])
+        self.assertGreater(after[1], before[1])
@@ -6,6 +6,8 @@ from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django.http import HttpResponse
 from django.db import IntegrityError, models
+from autograder.pagination import AdaptivePagination
+from autograder.scoping import get_role_scope
 from .models import Student, StudentEnrollment
 from .serializers import StudentSerializer, StudentImportSerializer, StudentEnrollmentSerializer
 from schools.utils import import_students_from_excel, export_student_template
@@ -16,6 +18,7 @@ import pandas as pd
 class StudentViewSet(viewsets.ModelViewSet):
     serializer_class = StudentSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = AdaptivePagination
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['classroom', 'grade', 'is_active']
     search_fields = ['name', 'student_id']
@@ -24,16 +27,14 @@ class StudentViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         user = self.request.user
+        scope = get_role_scope(self.request)
 
         # スーパーユーザーまたはスタッフは全データにアクセス可能
         if user.is_superuser or user.is_staff:
             queryset = Student.objects.all()
-        elif user.role == 'school_admin':
-            # 塾管理者は自分の塾の生徒のみ
-            queryset = Student.objects.filter(classroom__school__school_id=user.school_id)
-        elif user.role == 'classroom_admin':
-            # 教室管理者は自分の教室の生徒のみ
-            queryset = Student.objects.filter(classroom__classroom_id=user.classroom_id)
+        elif scope.is_school_admin or scope.is_classroom_admin:
+            # 塾管理者は自分の塾の教室、教室管理者は自分の教室の生徒のみ
+            queryset = scope.filter_classrooms(Student.objects.all(), 'classroom')
         else:
             # その他のユーザーはアクセス不可
             queryset = Student.objects.none()
@@ -602,15 +603,9 @@ class StudentViewSet(viewsets.ModelViewSet):
             )
             
             # 権限チェック（ユーザーがアクセス可能な生徒のみ）
-            user = request.user
-            if user.role == 'school_admin':
-                enrollments = enrollments.filter(
-                    student__classroom__school__school_id=user.school_id
-                )
-            elif user.role == 'classroom_admin':
-                enrollments = enrollments.filter(
-                    student__classroom__classroom_id=user.classroom_id
-                )
+            scope = get_role_scope(request)
+            if scope.is_school_admin or scope.is_classroom_admin:
+                enrollments = scope.filter_classrooms(enrollments, 'student__classroom')
             
             # データをExcel用に整理
             data = []
@@ -696,6 +691,7 @@ class StudentViewSet(viewsets.ModelViewSet):
 class StudentEnrollmentViewSet(viewsets.ModelViewSet):
     serializer_class = StudentEnrollmentSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = AdaptivePagination
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['student', 'year', 'period', 'is_active']
     search_fields = ['student__name', 'student__student_id']
@@ -703,14 +699,10 @@ class StudentEnrollmentViewSet(viewsets.ModelViewSet):
     ordering = ['-year', '-period']
     
     def get_queryset(self):
-        user = self.request.user
-        if user.role == 'school_admin':
-            return StudentEnrollment.objects.filter(
-                student__classroom__school__school_id=user.school_id
-            ).select_related('student', 'student__classroom')
-        elif user.role == 'classroom_admin':
-            return StudentEnrollment.objects.filter(
-                student__classroom__classroom_id=user.classroom_id
+        scope = get_role_scope(self.request)
+        if scope.is_school_admin or scope.is_classroom_admin:
+            return scope.filter_classrooms(
+                StudentEnrollment.objects.all(), 'student__classroom'
             ).select_related('student', 'student__classroom')
         return StudentEnrollment.objects.none()
     
@@ -780,11 +772,9 @@ class StudentEnrollmentViewSet(viewsets.ModelViewSet):
             )
             
             # 権限チェック
-            user = request.user
-            if user.role == 'school_admin':
-                enrollments = enrollments.filter(student__classroom__school__school_id=user.school_id)
-            elif user.role == 'classroom_admin':
-                enrollments = enrollments.filter(student__classroom__classroom_id=user.classroom_id)
+            scope = get_role_scope(request)
+            if scope.is_school_admin or scope.is_classroom_admin:
+                enrollments = scope.filter_classrooms(enrollments, 'student__classroom')
             
             # 学年フィルタ
             if grade:
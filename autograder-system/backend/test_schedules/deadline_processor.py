@@ -0,0 +1,132 @@
+"""
+締切後処理（定期実行）
+
+締切を過ぎた日程は結果が変わらないため、必要な重い処理を締切後に1回だけまとめて実行し、
+最初に閲覧した利用者のリクエストで集計が走らないようにする。
+
+1. 締切を過ぎた TestScheduleInfo を完了にする（課金レポート生成が予約される）
+2. 未確定の順位をテストごとに1回の UPDATE で確定する
+3. 大問別統計・推移用平均点を保存する
+4. 課金レポートを (年度, 期間) 単位で生成する
+5. 帳票で参照する統計をキャッシュに載せる
+6. 得点の更新で再集計待ちになった大問別統計を再集計する（締切前の日程も含む）
+
+manage.py process_test_deadlines から呼ぶ（--loop で常駐、省略時は cron 向けに1回だけ実行）。
+"""
+from __future__ import annotations
+
+import logging
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def get_pending_schedules(now=None):
+    """
+    締切後処理が済んでいない日程を取得する
+
+    締切を過ぎて結果があり、未確定の結果が残っているか推移用平均点が未保存の日程が対象。
+    処理済みの日程は次回以降対象にならない。
+    """
+    from scores.models import TestResult, TrendAverage
+    from tests.models import TestSchedule
+
+    now = now or timezone.now()
+    # process_schedule と同じく有効なテストの結果だけを見る（無効なテストの未確定結果で毎回対象にならないように）
+    results = TestResult.objects.filter(test__schedule=OuterRef('pk'), test__is_active=True)
+    return TestSchedule.objects.filter(
+        is_active=True,
+        deadline_at__lt=now,
+    ).filter(
+        Exists(results)
+    ).filter(
+        Exists(results.filter(is_rank_finalized=False))
+        | ~Exists(TrendAverage.objects.filter(schedule=OuterRef('pk')))
+    ).order_by('deadline_at')
+
+
+def warm_report_caches(tests) -> None:
+    """帳票・詳細結果で参照する統計（全国・学年別）をキャッシュに載せる"""
+    from scores.models import QuestionGroupStatistics
+    from scores.question_statistics import get_grade_result_statistics, get_question_group_statistics
+
+    test_ids = [test.id for test in tests]
+    get_grade_result_statistics(test_ids)
+    for test_id, grade in QuestionGroupStatistics.objects.filter(
+        test_id__in=test_ids, school__isnull=True
+    ).values_list('test_id', 'grade').distinct():
+        get_question_group_statistics(test_id, grade)
+
+
+def process_schedule(schedule) -> dict:
+    """
+    1つの日程の締切後処理を実行する
+
+    Returns:
+        dict: 確定件数・統計件数・推移用平均点の保存件数
+    """
+    from classrooms.billing_jobs import enqueue_school_billing
+    from scores.question_statistics import rebuild_question_group_statistics
+    from scores.trend_averages import populate_trend_averages
+    from scores.utils import finalize_test_result_ranks
+
+    tests = list(schedule.tests.filter(is_active=True).select_related('schedule'))
+
+    with transaction.atomic():
+        finalized = sum(finalize_test_result_ranks(test) for test in tests)
+
+    statistics = sum(rebuild_question_group_statistics(test)['created'] for test in tests)
+    trend = populate_trend_averages(schedule)
+
+    # 課金レポートはトランザクション確定後に (年度, 期間) ごとに1回だけ生成される
+    enqueue_school_billing(schedule.year, schedule.period)
+
+    warm_report_caches(tests)
+
+    return {
+        'finalized': finalized,
+        'statistics': statistics,
+        'trend_averages': trend['created'],
+    }
+
+
+def process_test_deadlines(now=None) -> dict:
+    """
+    締切を過ぎた日程の処理をまとめて実行する
+
+    日程ごとのエラーはログに残して次の日程へ進む（次回の実行で再処理される）。
+
+    Returns:
+        dict: {'completed': 完了にした TestScheduleInfo, 'processed': [(日程, 結果), ...],
+               'refreshed_statistics': 大問別統計を再集計したテスト数, 'errors': 件数}
+    """
+    from scores.question_statistics import rebuild_stale_question_group_statistics
+    from test_schedules.models import TestScheduleInfo
+
+    completed = TestScheduleInfo.complete_past_deadline()
+
+    processed = []
+    errors = 0
+    for schedule in get_pending_schedules(now):
+        try:
+            processed.append((schedule, process_schedule(schedule)))
+        except Exception as e:
+            logger.error(f"締切後処理エラー: {schedule} - {str(e)}")
+            errors += 1
+
+    refreshed_statistics = 0
+    try:
+        refreshed_statistics = rebuild_stale_question_group_statistics()
+    except Exception as e:
+        logger.error(f"大問別統計の再集計エラー: {str(e)}")
+        errors += 1
+
+    return {
+        'completed': completed,
+        'processed': processed,
+        'refreshed_statistics': refreshed_statistics,
+        'errors': errors,
+    }
@@ -0,0 +1,89 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from test_schedules.deadline_processor import get_pending_schedules, process_test_deadlines
+
+
+class Command(BaseCommand):
+    help = '締切を過ぎた日程の順位確定・統計保存・課金レポート生成・キャッシュ準備を実行する（cron または --loop で定期実行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='終了せずに一定間隔で繰り返し実行する'
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=300,
+            help='--loop 時の実行間隔（秒、デフォルト300）'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='実際の処理は行わず、対象の日程のみ表示する'
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            self.show_pending()
+            return
+
+        # データバージョン・集計キャッシュ・ジョブのロックは Web プロセスと共有する必要がある
+        if 'locmem' in settings.CACHES['default']['BACKEND'].lower():
+            raise CommandError(
+                'プロセス内キャッシュ（locmem）では Web プロセスに変更が伝わりません。'
+                'REDIS_URL を設定して共有キャッシュで実行してください'
+            )
+
+        if not options['loop']:
+            self.run_once()
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(f'締切後処理を {options["interval"]}秒間隔で実行します（Ctrl+C で終了）')
+        )
+        try:
+            while True:
+                close_old_connections()
+                try:
+                    self.run_once()
+                except Exception as e:
+                    # DB切断などで失敗しても次の実行で再処理する
+                    self.stdout.write(self.style.ERROR(f'締切後処理エラー: {str(e)}'))
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('締切後処理を終了しました')
+
+    def show_pending(self):
+        schedules = list(get_pending_schedules())
+        if not schedules:
+            self.stdout.write(self.style.SUCCESS('締切後処理が必要な日程はありません。'))
+            return
+        for schedule in schedules:
+            self.stdout.write(f'[DRY RUN] 処理予定: {schedule} (締切: {schedule.deadline_at:%Y-%m-%d %H:%M})')
+
+    def run_once(self):
+        result = process_test_deadlines()
+
+        for schedule_info in result['completed']:
+            self.stdout.write(self.style.SUCCESS(f'完了処理済み: {schedule_info}'))
+
+        for schedule, summary in result['processed']:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'締切後処理済み: {schedule} - 順位確定 {summary["finalized"]}件, '
+                    f'大問別統計 {summary["statistics"]}件, 推移用平均点 {summary["trend_averages"]}件'
+                )
+            )
+
+        if result['refreshed_statistics']:
+            self.stdout.write(self.style.SUCCESS(f'大問別統計を再集計: {result["refreshed_statistics"]}テスト'))
+
+        if result['errors']:
+            self.stdout.write(self.style.ERROR(f'エラー: {result["errors"]}件（次回の実行で再処理します）'))
+        elif not result['completed'] and not result['processed'] and not result['refreshed_statistics']:
+            self.stdout.write('締切後処理が必要な日程はありません。')
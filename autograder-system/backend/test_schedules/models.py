@@ -1,5 +1,6 @@
 from django.db import models
 from django.core.validators import RegexValidator
+from django.utils import timezone
 
 class TestScheduleInfo(models.Model):
     PERIOD_CHOICES = [
@@ -47,4 +48,32 @@ class TestScheduleInfo(models.Model):
         ]
     
     def __str__(self):
-        return f"{self.year}年度 {self.get_period_display()}"
\ No newline at end of file
+        return f"{self.year}年度 {self.get_period_display()}"
+
+    def is_past_deadline(self):
+        """実施中で締切時刻を過ぎているか"""
+        return self.status == 'in_progress' and self.deadline is not None and timezone.now() > self.deadline
+
+    def save(self, *args, **kwargs):
+        """締切時刻を過ぎた実施中の日程は、保存時にステータスを'completed'にする"""
+        if self.is_past_deadline():
+            self.status = 'completed'
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'status' not in update_fields:
+                kwargs['update_fields'] = [*update_fields, 'status']
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def complete_past_deadline(cls):
+        """
+        締切時刻を過ぎた実施中の日程を完了にする（定期実行用）
+
+        1件ずつ保存してシグナル（課金レポート生成の予約・キャッシュ無効化）を送る。
+        Returns:
+            list: 完了にした日程
+        """
+        completed = []
+        for schedule in cls.objects.filter(status='in_progress', deadline__lt=timezone.now()):
+            schedule.save()
+            completed.append(schedule)
+        return completed
\ No newline at end of file
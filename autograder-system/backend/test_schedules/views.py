@@ -12,9 +12,10 @@ class TestScheduleInfoViewSet(viewsets.ReadOnlyModelViewSet):
         return TestScheduleInfo.objects.all().order_by('-year', 'period')
     
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
+        # 年に数回しか変わらないため、プロセス内の参照データキャッシュから返す
+        from tests.reference_data import get_schedule_info_list
+        results = get_schedule_info_list()
         return Response({
-            'results': serializer.data,
-            'count': queryset.count()
+            'results': results,
+            'count': len(results)
         })
\ No newline at end of file
@@ -0,0 +1,109 @@
+"""
+参照データ（日程・テスト一覧）のプロセス内キャッシュ
+
+年に数回しか変わらない日程・テスト定義の一覧を、ワーカープロセス内に保持する。
+有効性はデータバージョン（autograder.data_versions）で判定するため、通常時は
+DBにアクセスせずに返せる。TestSchedule / TestDefinition / 大問 / 日程情報の
+書き込みでバージョンが進むと、次の参照時に1回だけ読み直す。
+起動時のウォームアップは gunicorn.conf.py の post_worker_init から呼ばれる。
+"""
+from __future__ import annotations
+
+import logging
+
+from autograder.data_versions import get_data_version, SCHEDULES_SCOPE, TESTS_SCOPE, SCHEDULE_INFO_SCOPE
+
+logger = logging.getLogger(__name__)
+
+PERIOD_ORDER = {'spring': 1, 'summer': 2, 'winter': 3}
+
+# name -> (データバージョン, 値)
+_store = {}
+
+
+def _cached(name: str, scope: str, loader):
+    version = get_data_version(scope)
+    entry = _store.get(name)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    value = loader()
+    _store[name] = (version, value)
+    return value
+
+
+def _load_available_periods() -> dict:
+    from .models import TestSchedule
+
+    rows = list(TestSchedule.objects.values_list('year', 'period').distinct())
+    return {
+        'years': sorted({year for year, _ in rows}, reverse=True),
+        'periods': sorted({period for _, period in rows}, key=lambda p: PERIOD_ORDER.get(p, 999)),
+    }
+
+
+def _load_active_tests() -> list:
+    from django.db.models import Count
+    from .models import TestDefinition
+
+    return list(
+        TestDefinition.objects.filter(is_active=True)
+        .select_related('schedule')
+        .annotate(question_groups_count=Count('question_groups'))
+    )
+
+
+def _load_schedule_info() -> list:
+    from test_schedules.models import TestScheduleInfo
+    from test_schedules.serializers import TestScheduleInfoSerializer
+
+    queryset = TestScheduleInfo.objects.all().order_by('-year', 'period')
+    return [dict(item) for item in TestScheduleInfoSerializer(queryset, many=True).data]
+
+
+def get_available_periods() -> dict:
+    """{'years': [...], 'periods': [...]}（年度は降順、期間は春・夏・冬の順）"""
+    periods = _cached('available_periods', SCHEDULES_SCOPE, _load_available_periods)
+    return {'years': list(periods['years']), 'periods': list(periods['periods'])}
+
+
+def get_available_tests() -> list:
+    """
+    有効なテストの一覧（TestDefinitionViewSet.available_tests の形式）
+
+    入力可否は締切時刻で変わるため、保持しているテスト定義から毎回算出する（DBアクセスなし）。
+    """
+    tests = _cached('active_tests', TESTS_SCOPE, _load_active_tests)
+    test_list = []
+    for test in tests:
+        input_status = test.get_input_status()
+        test_list.append({
+            'id': test.id,
+            'grade_level': test.grade_level,
+            'grade_level_display': test.get_grade_level_display(),
+            'subject': test.subject,
+            'subject_display': test.get_subject_display(),
+            'year': test.schedule.year,
+            'period': test.schedule.period,
+            'period_display': test.schedule.get_period_display(),
+            'max_score': test.max_score,
+            'question_groups_count': test.question_groups_count,
+            'input_allowed': input_status['allowed'],
+            'input_status': input_status['status'],
+            'deadline': test.schedule.deadline_at
+        })
+    return test_list
+
+
+def get_schedule_info_list() -> list:
+    """TestScheduleInfo の一覧（シリアライズ済み）"""
+    return [dict(item) for item in _cached('schedule_info', SCHEDULE_INFO_SCOPE, _load_schedule_info)]
+
+
+def warm_reference_data() -> None:
+    """全ての参照データを読み込んでおく（起動直後の最初のリクエストを速くする）"""
+    for loader in (get_available_periods, get_available_tests, get_schedule_info_list):
+        try:
+            loader()
+        except Exception as e:
+            # マイグレーション前などテーブルがない場合は次回参照時に読み込む
+            logger.warning(f"参照データのウォームアップに失敗しました: {loader.__name__} - {e}")
@@ -24,9 +24,18 @@ from .serializers import (
     TestScheduleSerializer, TestDefinitionSerializer, 
     QuestionGroupSerializer, QuestionSerializer, AnswerKeySerializer
 )
-import zipfile
-import tempfile
 import os
+from autograder.zip_stream import streaming_zip_response
+from autograder.data_versions import TESTS_SCOPE
+from autograder.response_cache import cached_by_data_version
+from .reference_data import get_available_tests
+
+# 入力可否（締切）は時刻で変わるため、テスト構成系のキャッシュは短めにする
+TEST_STRUCTURE_CACHE_TIMEOUT = 60
+
+
+def _test_catalog_scope(request):
+    return [TESTS_SCOPE], ()
 
 class TestScheduleViewSet(viewsets.ModelViewSet):
     queryset = TestSchedule.objects.all()
@@ -96,6 +105,7 @@ class TestDefinitionViewSet(viewsets.ModelViewSet):
         })
     
     @action(detail=True, methods=['get'])
+    @cached_by_data_version(_test_catalog_scope, timeout=TEST_STRUCTURE_CACHE_TIMEOUT)
     def test_structure(self, request, pk=None):
         """フロントエンド用：テストの構造（大問・小問）を取得"""
         test = self.get_object()
@@ -144,29 +154,8 @@ class TestDefinitionViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def available_tests(self, request):
-        """フロントエンド用：利用可能なテスト一覧"""
-        tests = self.get_queryset().filter(is_active=True).select_related('schedule')
-        
-        test_list = []
-        for test in tests:
-            input_status = test.get_input_status()
-            test_list.append({
-                'id': test.id,
-                'grade_level': test.grade_level,
-                'grade_level_display': test.get_grade_level_display(),
-                'subject': test.subject,
-                'subject_display': test.get_subject_display(),
-                'year': test.schedule.year,
-                'period': test.schedule.period,
-                'period_display': test.schedule.get_period_display(),
-                'max_score': test.max_score,
-                'question_groups_count': test.question_groups.count(),
-                'input_allowed': input_status['allowed'],
-                'input_status': input_status['status'],
-                'deadline': test.schedule.deadline_at
-            })
-        
-        return Response(test_list)
+        """フロントエンド用：利用可能なテスト一覧（プロセス内の参照データキャッシュから返す）"""
+        return Response(get_available_tests())
     
     @action(detail=False, methods=['get'])
     def subjects_for_grade(self, request):
@@ -406,43 +395,26 @@ class TestFileBulkDownloadView(APIView):
             schedule = get_object_or_404(TestSchedule, year=year, period=period)
             tests = TestDefinition.objects.filter(schedule=schedule, is_active=True)
             
-            # 一時ファイルを作成してZIPファイルを作成
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.zip') as tmp_file:
-                with zipfile.ZipFile(tmp_file.name, 'w') as zip_file:
-                    added_files = 0
-                    for test in tests:
-                        # 問題ファイルを追加
-                        if test.question_pdf and hasattr(test.question_pdf, 'path') and os.path.exists(test.question_pdf.path):
-                            try:
-                                filename = f"{test.get_grade_level_display()}{test.get_subject_display()}_問題.pdf"
-                                zip_file.write(test.question_pdf.path, filename)
-                                added_files += 1
-                            except (FileNotFoundError, PermissionError):
-                                continue
-                        
-                        # 解答ファイルを追加
-                        if test.answer_pdf and hasattr(test.answer_pdf, 'path') and os.path.exists(test.answer_pdf.path):
-                            try:
-                                filename = f"{test.get_grade_level_display()}{test.get_subject_display()}_解答.pdf"
-                                zip_file.write(test.answer_pdf.path, filename)
-                                added_files += 1
-                            except (FileNotFoundError, PermissionError):
-                                continue
-                
-                # ダウンロード可能なファイルがない場合
-                if added_files == 0:
-                    os.unlink(tmp_file.name)
-                    return Response({'error': 'ダウンロード可能なファイルがありません。ファイルが準備中の可能性があります。'}, status=status.HTTP_404_NOT_FOUND)
-                
-                # ZIPファイルを読み込んでレスポンスとして返す
-                with open(tmp_file.name, 'rb') as zip_data:
-                    response = HttpResponse(zip_data.read(), content_type='application/zip')
-                    zip_filename = f"{year}年度{schedule.get_period_display()}テスト_全ファイル.zip"
-                    response['Content-Disposition'] = f'attachment; filename="{zip_filename}"'
-                
-                # 一時ファイルを削除
-                os.unlink(tmp_file.name)
-                return response
-                
+            # 実在するファイルのみを収集（ZIP本体はストリーミングで生成）
+            members = []
+            for test in tests:
+                # 問題ファイルを追加
+                if test.question_pdf and hasattr(test.question_pdf, 'path') and os.path.exists(test.question_pdf.path):
+                    filename = f"{test.get_grade_level_display()}{test.get_subject_display()}_問題.pdf"
+                    members.append((filename, test.question_pdf.path))
+
+                # 解答ファイルを追加
+                if test.answer_pdf and hasattr(test.answer_pdf, 'path') and os.path.exists(test.answer_pdf.path):
+                    filename = f"{test.get_grade_level_display()}{test.get_subject_display()}_解答.pdf"
+                    members.append((filename, test.answer_pdf.path))
+
+            # ダウンロード可能なファイルがない場合
+            if not members:
+                return Response({'error': 'ダウンロード可能なファイルがありません。ファイルが準備中の可能性があります。'}, status=status.HTTP_404_NOT_FOUND)
+
+            # PDFは圧縮済みのためSTOREDでそのまま流す
+            zip_filename = f"{year}年度{schedule.get_period_display()}テスト_全ファイル.zip"
+            return streaming_zip_response(members, zip_filename)
+
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)